@@ -4,7 +4,10 @@ from .models import *
 # Register your models here.
 
 admin.site.register(User)
+admin.site.register(Category)
 admin.site.register(Listing)
 admin.site.register(Bid)
+admin.site.register(ProxyBid)
 admin.site.register(Comment)
-admin.site.register(Watchlist)
\ No newline at end of file
+admin.site.register(Watchlist)
+admin.site.register(Winner)
@@ -0,0 +1,239 @@
+import json
+import math
+from functools import wraps
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse
+from django.views.decorators.http import require_http_methods
+
+from .archive import bid_ledger
+from .bidding import BidResult, place_bid, place_proxy_bid
+from .cache import get_snapshot_by_id, listing_conditional
+from .models import ArchivedComment, Comment
+from .pagination import paginate
+from .queries import listing_summaries
+from .ratelimit import rate_limited
+from .routers import replica_reads
+from .views import NewBidForm
+from .watchlist import unwatch, watch
+
+# JSON API over listings, bids, comments and watchlists.
+#
+# Every endpoint that lists things takes ?cursor= and returns next/previous
+# cursors, like the HTML pages. ?fields=a,b limits the fields of each result.
+# Responses about a single listing carry an ETag and Last-Modified derived
+# from the listing's cache version, so clients polling with If-None-Match or
+# If-Modified-Since get an empty 304 until the listing, its bids or its
+# comments change.
+
+LISTING_FIELDS = {
+    "id": lambda listing: listing.id,
+    "title": lambda listing: listing.list_title,
+    "url": lambda listing: listing.get_absolute_url(),
+    "description": lambda listing: listing.description,
+    "category": lambda listing: listing.category_id,
+    "image_url": lambda listing: listing.image_url,
+    "poster": lambda listing: listing.poster_id.username,
+    "starting_bid": lambda listing: listing.starting_bid,
+    "current_bid": lambda listing: listing.highest_bid,
+    "high_bidder": lambda listing: listing.high_bidder.username,
+    "active": lambda listing: listing.active,
+    "ends_at": lambda listing: listing.ends_at,
+    "bid_count": lambda listing: listing.bid_count,
+    "unique_bidders": lambda listing: listing.unique_bidders,
+    "last_bid_at": lambda listing: listing.last_bid_at,
+}
+
+BID_FIELDS = {
+    "id": lambda bid: bid.id,
+    "bidder": lambda bid: bid.bidder_id.username,
+    "amount": lambda bid: bid.bid_amount,
+    "created": lambda bid: bid.created,
+}
+
+COMMENT_FIELDS = {
+    "id": lambda comment: comment.id,
+    "user": lambda comment: comment.user_id.username,
+    "comment": lambda comment: comment.comment,
+    "created": lambda comment: comment.created,
+}
+
+# HTTP status for each bid outcome
+BID_STATUS = {
+    BidResult.ACCEPTED: 201,
+    BidResult.OUTBID: 201,
+    BidResult.TOO_LOW: 409,
+    BidResult.CLOSED: 409,
+    BidResult.NOT_FOUND: 404,
+}
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _json(data, status=200):
+    return JsonResponse(data, status=status, encoder=DjangoJSONEncoder)
+
+
+def _too_many_requests(wait):
+    response = _json({"error": "Too many requests"}, 429)
+    response["Retry-After"] = str(math.ceil(wait))
+    return response
+
+
+# Turn ApiErrors raised by the view into JSON error responses
+def api_view(view):
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except ApiError as error:
+            return _json({"error": error.message}, error.status)
+    return wrapper
+
+
+def _require_user(request):
+    if not request.user.is_authenticated:
+        raise ApiError(401, "Authentication required")
+
+
+# The fields picked with ?fields=, all of them by default
+def _fields(request, available):
+    requested = request.GET.get("fields")
+    if not requested:
+        return available
+    names = [name for name in requested.split(",") if name]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise ApiError(400, "Unknown fields: " + ", ".join(unknown))
+    return {name: available[name] for name in names}
+
+
+def _serialize(obj, fields):
+    return {name: field(obj) for name, field in fields.items()}
+
+
+def _page(request, queryset, available):
+    fields = _fields(request, available)
+    page = paginate(queryset, request.GET.get("cursor"))
+    return _json({
+        "results": [_serialize(obj, fields) for obj in page],
+        "next": page.next_cursor,
+        "previous": page.prev_cursor,
+    })
+
+
+def _request_body(request):
+    if request.content_type == "application/json":
+        try:
+            body = json.loads(request.body)
+        except ValueError:
+            raise ApiError(400, "Malformed JSON")
+        if not isinstance(body, dict):
+            raise ApiError(400, "Expected a JSON object")
+        return body
+    return request.POST
+
+
+@replica_reads
+@require_http_methods(["GET"])
+@api_view
+def listings(request):
+    filters = {"active": request.GET.get("active", "1") != "0"}
+    if request.GET.get("category"):
+        filters["category_id"] = request.GET["category"]
+    return _page(request, listing_summaries(**filters).select_related("high_bidder"), LISTING_FIELDS)
+
+
+@require_http_methods(["GET"])
+@listing_conditional
+@api_view
+def listing_detail(request, listing_id):
+    fields = _fields(request, LISTING_FIELDS)
+    snapshot = get_snapshot_by_id(listing_id)
+    if snapshot is None:
+        raise ApiError(404, "Listing not found")
+    return _json(_serialize(snapshot.listing, fields))
+
+
+@listing_conditional
+@api_view
+def _bid_history(request, listing_id):
+    snapshot = get_snapshot_by_id(listing_id)
+    if snapshot is None:
+        raise ApiError(404, "Listing not found")
+    return _page(request, bid_ledger(snapshot.listing).select_related("bidder_id"), BID_FIELDS)
+
+
+# Place a bid with {"amount": "12.50"}, or a proxy bid with
+# {"max_amount": "20.00"}, as JSON or form data. Goes through the same
+# place_bid() and place_proxy_bid() as the bid page. For a proxy bid the
+# amount returned is the price the listing is now at. Over the bid rate
+# limit it answers 429 with Retry-After, see auctions.ratelimit.
+@rate_limited("bid", respond=_too_many_requests)
+@api_view
+def _place_bid(request, listing_id):
+    _require_user(request)
+    body = _request_body(request)
+    proxy = "max_amount" in body
+    form = NewBidForm({"bid_amount": body.get("max_amount" if proxy else "amount")})
+    if not form.is_valid():
+        raise ApiError(400, "Invalid amount")
+
+    place = place_proxy_bid if proxy else place_bid
+    result = place(listing_id, request.user, form.cleaned_data["bid_amount"])
+    return _json(
+        {"status": result.status, "message": result.message, "amount": result.amount},
+        BID_STATUS[result.status],
+    )
+
+
+@require_http_methods(["GET", "POST"])
+def listing_bids(request, listing_id):
+    if request.method == "POST":
+        return _place_bid(request, listing_id)
+    return _bid_history(request, listing_id)
+
+
+@require_http_methods(["GET"])
+@listing_conditional
+@api_view
+def listing_comments(request, listing_id):
+    snapshot = get_snapshot_by_id(listing_id)
+    if snapshot is None:
+        raise ApiError(404, "Listing not found")
+    model = ArchivedComment if snapshot.listing.archived else Comment
+    comments = model.objects.filter(listing_id=listing_id).select_related("user_id")
+    return _page(request, comments, COMMENT_FIELDS)
+
+
+# GET the user's watched listings, POST {"listing": id} to watch one
+@require_http_methods(["GET", "POST"])
+@api_view
+def watchlist(request):
+    _require_user(request)
+    if request.method == "POST":
+        try:
+            listing_id = int(_request_body(request).get("listing"))
+        except (TypeError, ValueError):
+            raise ApiError(400, "Invalid listing")
+        if get_snapshot_by_id(listing_id) is None:
+            raise ApiError(404, "Listing not found")
+        added = watch(request, listing_id)
+        return _json({"listing": listing_id, "watching": True}, 201 if added else 200)
+
+    watched = listing_summaries(listing_watch__user_id=request.user).select_related("high_bidder")
+    return _page(request, watched, LISTING_FIELDS)
+
+
+# DELETE to stop watching a listing
+@require_http_methods(["DELETE"])
+@api_view
+def watchlist_entry(request, listing_id):
+    _require_user(request)
+    unwatch(request, listing_id)
+    return _json({"listing": listing_id, "watching": False})
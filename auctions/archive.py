@@ -0,0 +1,117 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import ArchivedBid, ArchivedComment, ArchivedWatchlist, Bid, Comment, Listing, Watchlist
+from .signals import invalidate_listings
+from .watchlist import invalidate_watchlists
+
+# Archival of long-closed auctions.
+#
+# Bids, comments and watchlist entries of every listing closed more than
+# AUCTIONS_ARCHIVE_AFTER_DAYS ago are moved, with their ids, from the tables
+# open auctions read and write into ArchivedBid, ArchivedComment and
+# ArchivedWatchlist, so the hot tables and their indexes only hold recent
+# auctions. The listing itself and its Winner stay put, so closed listings
+# and their winners are shown as before, and the listing is stamped with
+# archived_at so its pages read the archive tables instead.
+#
+# Listings are taken oldest first from a partial index of unarchived closed
+# listings, a batch per transaction. A batch copies its rows with one
+# INSERT ... SELECT per table and deletes the originals by listing, so the
+# rows never pass through Python and memory use doesn't depend on how many
+# there are.
+
+ARCHIVE_BATCH_SIZE = 200
+
+# Each hot table and the archive it moves to. The archive has the same
+# columns.
+ARCHIVES = {
+    "bids": (Bid, ArchivedBid),
+    "comments": (Comment, ArchivedComment),
+    "watchlists": (Watchlist, ArchivedWatchlist),
+}
+
+
+def _copy(model, archive, listing_ids):
+    quote = connection.ops.quote_name
+    columns = ", ".join(quote(field.column) for field in model._meta.concrete_fields)
+    sql = "INSERT INTO {} ({}) SELECT {} FROM {} WHERE {} IN ({})".format(
+        quote(archive._meta.db_table),
+        columns,
+        columns,
+        quote(model._meta.db_table),
+        quote(model._meta.get_field("listing_id").column),
+        ", ".join(["%s"] * len(listing_ids)),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, listing_ids)
+        return cursor.rowcount
+
+
+# A plain DELETE, without loading the rows to send signals for each one.
+# Nothing refers to them and the listings are invalidated by the caller.
+def _delete(model, listing_ids):
+    quote = connection.ops.quote_name
+    sql = "DELETE FROM {} WHERE {} IN ({})".format(
+        quote(model._meta.db_table),
+        quote(model._meta.get_field("listing_id").column),
+        ", ".join(["%s"] * len(listing_ids)),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, listing_ids)
+
+
+def archive_cutoff(days=None, now=None):
+    if days is None:
+        days = settings.AUCTIONS_ARCHIVE_AFTER_DAYS
+    return (now or timezone.now()) - timedelta(days=days)
+
+
+# Archive one batch of listings closed before the cutoff. Returns the number
+# of listings and of each kind of row moved, {"listings": n, "bids": n, ...}.
+def archive_batch(cutoff, batch_size=ARCHIVE_BATCH_SIZE):
+    now = timezone.now()
+    with transaction.atomic():
+        listing_ids = list(
+            Listing.objects.filter(active=False, archived_at__isnull=True, closed_at__lt=cutoff)
+            .order_by("closed_at")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        moved = {"listings": len(listing_ids)}
+        if not listing_ids:
+            return moved
+
+        watchers = set(
+            Watchlist.objects.filter(listing_id__in=listing_ids).values_list("user_id", flat=True).distinct()
+        )
+        for name, (model, archive) in ARCHIVES.items():
+            moved[name] = _copy(model, archive, listing_ids)
+            _delete(model, listing_ids)
+
+        Listing.objects.filter(id__in=listing_ids).update(archived_at=now)
+        invalidate_listings(listing_ids)
+        invalidate_watchlists(watchers)
+    return moved
+
+
+# Archive every listing closed before the cutoff, batch by batch. Returns the
+# totals of archive_batch().
+def archive_closed(cutoff=None, batch_size=ARCHIVE_BATCH_SIZE):
+    cutoff = cutoff or archive_cutoff()
+    totals = {}
+    while True:
+        moved = archive_batch(cutoff, batch_size)
+        if not moved["listings"]:
+            return totals
+        for name, count in moved.items():
+            totals[name] = totals.get(name, 0) + count
+
+
+# A listing's bids in the order they were placed, from whichever table holds
+# them. Bids are never changed once stored, so this is an append-only ledger.
+def bid_ledger(listing):
+    model = ArchivedBid if listing.archived else Bid
+    return model.objects.filter(listing_id=listing.id).order_by("id")
@@ -0,0 +1,101 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.contrib.auth.views import redirect_to_login
+from django.shortcuts import render
+
+from .categories import acategory_counts
+from .comments import arender_comments
+from .loaders import alisting_required
+from .pagination import apaginate
+from .queries import listing_summaries
+from .routers import replica_reads
+from .streaming import astream_rows
+from .views import NewBidForm, NewCommentForm
+from .watchlist import awatched_ids, watched_entries
+
+# Async versions of the read-only pages, used instead of the ones in views.py
+# when AUCTIONS_ASYNC_VIEWS is on and the site is served through
+# commerce/asgi.py. They don't tie up a thread while waiting on the database.
+
+
+# Load the session user before rendering. Templates read request.user, and
+# lazily loading it from inside an async view isn't allowed.
+async def load_user(request):
+    request.user = await sync_to_async(get_user)(request)
+    return request.user
+
+
+async def listing_page(request, template, listings, context):
+    await load_user(request)
+
+    if request.GET.get("stream"):
+        return astream_rows(request, template, context, listings, "auctions/listing_summary.html")
+
+    page = await apaginate(listings, request.GET.get("cursor"))
+    context.update({"listings": page, "page": page})
+    return render(request, template, context)
+
+
+# Main active listing page
+@replica_reads
+async def index(request):
+    return await listing_page(request, "auctions/index.html", listing_summaries(active=True), {})
+
+
+# Closed listings page
+@replica_reads
+async def closed(request):
+    return await listing_page(request, "auctions/closed.html", listing_summaries(active=False), {})
+
+
+# View listings by Category
+@replica_reads
+async def category(request, category):
+    category_listings = listing_summaries(category_id=category, active=True)
+
+    return await listing_page(request, "auctions/category.html", category_listings, {
+        "category": category
+    })
+
+
+# View categories with their active listing counts
+async def categories(request):
+    await load_user(request)
+
+    return render(request, "auctions/categories.html", {
+        "categories": await acategory_counts()
+    })
+
+
+# Call up the listing for this id
+@replica_reads
+@alisting_required
+async def listing(request, listing_id):
+    await load_user(request)
+    snapshot = request.snapshot
+
+    in_list = snapshot.listing.id in await awatched_ids(request)
+
+    return render(request, "auctions/listing.html", {
+        "listing": snapshot.listing,
+        "comments": await arender_comments(snapshot.listing.id, archived=snapshot.listing.archived),
+        "version": snapshot.version,
+        "cache_timeout": settings.AUCTIONS_LISTING_CACHE_TIMEOUT,
+        "in_list": in_list,
+        "bid_form": NewBidForm(),
+        "comment_form": NewCommentForm(),
+    })
+
+
+# View users watchlist
+async def watchlist_view(request):
+    user = await load_user(request)
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+
+    users_list = [watch async for watch in watched_entries(user)]
+
+    return render(request, "auctions/watchlist.html", {
+        "users_list": users_list
+    })
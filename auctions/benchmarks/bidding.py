@@ -0,0 +1,306 @@
+import asyncio
+import json
+import random
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import override_settings
+
+from ..bidding import bid_increment, place_bid, place_proxy_bid
+from ..models import Bid, Listing, User
+from ..realtime import get_broker, listing_channel, publish_bid, websocket_application
+from ..outbox import dispatch_outbox
+from .. import ratelimit
+
+from .common import _percentile, create_listings
+
+
+# Bid placement as views.bid did it before the bidding module: read the
+# listing, compare in Python, then save the Bid and the whole listing row
+def legacy_place_bid(listing_id, bidder, amount):
+    listing = Listing.objects.get(pk=listing_id)
+    if amount > listing.highest_bid:
+        Bid(listing_id=listing, bidder_id=bidder, bid_amount=amount).save()
+        listing.highest_bid = amount
+        listing.high_bidder = bidder
+        listing.save()
+        return True
+    return False
+
+
+def _create_bid_fixture(workers):
+    poster = User.objects.create_user("loadtest-poster", password="loadtest")
+    bidders = [
+        User.objects.create_user(f"loadtest-bidder-{i}", password="loadtest")
+        for i in range(workers)
+    ]
+    listing = Listing.objects.create(
+        poster_id=poster,
+        list_title="Load test listing",
+        description="Hot listing for the bid load test",
+        starting_bid=Decimal("1.00"),
+        highest_bid=Decimal("1.00"),
+        high_bidder=poster,
+        image_url="",
+        active=True,
+    )
+    return listing, bidders
+
+
+# Hammer a single listing with bids from concurrent workers.
+#
+# Each worker bids an increasing amount with some jitter so that workers
+# regularly collide on the same price. Both engines are measured the same
+# way: attempts resolved per second, and bids correctly accepted per second,
+# those that raised the price over every bid stored before them. The old
+# path also says yes to bids that lost a race, which the price history shows
+# as bids below an earlier one. Returns a dict describing throughput and
+# whether any accepted bid was lost.
+def run_bid_load(workers=8, bids_per_worker=200, legacy=False, seed=0):
+    listing, bidders = _create_bid_fixture(workers)
+    place = legacy_place_bid if legacy else place_bid
+    accepted = [0] * workers
+    errors = [0] * workers
+    highest = [Decimal("0")] * workers
+    barrier = threading.Barrier(workers)
+
+    def worker(index):
+        rng = random.Random(seed + index)
+        bidder = bidders[index]
+        barrier.wait()
+        try:
+            for step in range(bids_per_worker):
+                amount = Decimal(2 + step * workers + rng.randint(0, workers))
+                try:
+                    if place(listing.id, bidder, amount):
+                        accepted[index] += 1
+                        highest[index] = max(highest[index], amount)
+                except Exception:
+                    errors[index] += 1
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(workers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    listing.refresh_from_db()
+    amounts = Bid.objects.filter(listing_id=listing).order_by("id").values_list("bid_amount", flat=True)
+    stored = correct = 0
+    price = listing.starting_bid
+    for amount in amounts:
+        stored += 1
+        if amount > price:
+            correct += 1
+            price = amount
+    top_accepted = max(highest)
+
+    # A bid is lost if it was accepted but never stored, or if the listing
+    # price was later overwritten with something lower than it
+    overwritten = Bid.objects.filter(
+        listing_id=listing, bid_amount__gt=listing.highest_bid
+    ).count()
+
+    attempts = workers * bids_per_worker
+    return {
+        "mode": "legacy" if legacy else "atomic",
+        "workers": workers,
+        "attempts": attempts,
+        "accepted": sum(accepted),
+        "correct": correct,
+        "errors": sum(errors),
+        "stored_bids": stored,
+        "final_price": listing.highest_bid,
+        "top_accepted": top_accepted,
+        "lost_bids": sum(accepted) - stored + overwritten,
+        "price_consistent": listing.highest_bid == top_accepted,
+        "seconds": elapsed,
+        "resolved_per_sec": (attempts - sum(errors)) / elapsed if elapsed else 0,
+        "correct_per_sec": correct / elapsed if elapsed else 0,
+    }
+
+
+# Fight the same bidding wars by hand and with proxy bids.
+#
+# Each of the bidders on a listing has a private maximum. By hand, bidders
+# take turns bidding one increment over the current price until nobody but
+# the leader is willing to go higher. With proxies, each bidder sets their
+# maximum once. Returns requests, stored bids and time for each mode, and
+# whether both ended at the same winners and prices.
+def run_proxy_benchmark(listings=20, bidders=10, seed=0):
+    rng = random.Random(seed)
+    users = [User.objects.create_user(f"proxy-bidder-{i}") for i in range(bidders)]
+    wars = [
+        [(user, Decimal(rng.randint(20, 500))) for user in rng.sample(users, len(users))]
+        for _ in range(listings)
+    ]
+    increment = bid_increment()
+
+    def by_hand(listing, war):
+        requests = 0
+        while True:
+            listing.refresh_from_db(fields=["highest_bid", "high_bidder"])
+            challengers = [
+                (user, limit) for user, limit in war
+                if user.id != listing.high_bidder_id and limit >= listing.highest_bid + increment
+            ]
+            if not challengers:
+                return requests
+            user, _ = rng.choice(challengers)
+            place_bid(listing.id, user, listing.highest_bid + increment)
+            requests += 1
+
+    def with_proxies(listing, war):
+        for user, limit in war:
+            place_proxy_bid(listing.id, user, limit)
+        return len(war)
+
+    results = {}
+    for mode, fight in (("by_hand", by_hand), ("proxy", with_proxies)):
+        create_listings(listings)
+        targets = list(Listing.objects.order_by("-id")[:listings])
+        start = time.perf_counter()
+        requests = sum(fight(listing, war) for listing, war in zip(targets, wars))
+        elapsed = time.perf_counter() - start
+        outcome = list(
+            Listing.objects.filter(id__in=[listing.id for listing in targets])
+            .order_by("-id").values_list("high_bidder_id", "highest_bid")
+        )
+        results[mode] = {
+            "requests": requests,
+            "bids": Bid.objects.filter(listing_id__in=targets).count(),
+            "seconds": elapsed,
+            "outcome": outcome,
+        }
+
+    # By hand the winner pays up to one increment over the runner-up, with
+    # proxies exactly one increment over, so only the winners must match
+    results["same_winners"] = [winner for winner, _ in results["by_hand"].pop("outcome")] == [
+        winner for winner, _ in results["proxy"].pop("outcome")
+    ]
+    return results
+
+
+# Time place_bid with notifications off and on, interleaved bid by bid so
+# both see the same database, and alternating between listings so each bid
+# displaces another bidder. Then time sending the recorded notifications to
+# the local memory email backend.
+def run_outbox_benchmark(bids=2000, listings=20):
+    users = [User.objects.create_user(f"outbox-bidder-{i}", email=f"bidder{i}@example.com") for i in range(2)]
+    create_listings(listings)
+    targets = list(Listing.objects.order_by("-id").values_list("id", flat=True)[:listings])
+    latencies = {False: [], True: []}
+    for i in range(bids * 2):
+        enabled = bool(i % 2)
+        with override_settings(AUCTIONS_NOTIFICATIONS=enabled):
+            start = time.perf_counter()
+            place_bid(targets[i % listings], users[(i // listings) % 2], Decimal(100 + i))
+            latencies[enabled].append(time.perf_counter() - start)
+    results = {
+        mode: {"p50_ms": _percentile(latencies[enabled], 50) * 1000, "p99_ms": _percentile(latencies[enabled], 99) * 1000}
+        for mode, enabled in (("off", False), ("on", True))
+    }
+
+    with override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend"):
+        start = time.perf_counter()
+        sent, failed = dispatch_outbox()
+        results["dispatch"] = {"events": sent, "failed": failed, "seconds": time.perf_counter() - start}
+    return results
+
+
+# Cost of one rate limit check, as the bid view makes it, with each backend.
+# Checks spread over users and listings so buckets are created, refilled and
+# emptied as under real traffic; the limits are set high enough that nothing
+# is rejected, which would stop the check after the user bucket.
+def run_ratelimit_benchmark(checks=200000, users=1000, listings=100):
+    results = {}
+    limits = {"bid": {"user": (1e6, 1e6), "listing": (1e6, 1e6)}}
+    for name, path in settings.RATE_LIMIT_BACKENDS.items():
+        with override_settings(AUCTIONS_RATE_LIMITING=True, AUCTIONS_RATE_LIMITS=limits, AUCTIONS_RATE_LIMIT_BACKEND=path):
+            backend, _ = ratelimit.get_limiter()
+            backend.reset()
+            cache.clear()
+            start = time.perf_counter()
+            for i in range(checks):
+                ratelimit.check("bid", i % users, i % listings)
+            elapsed = time.perf_counter() - start
+        results[name] = {"checks": checks, "us_per_check": elapsed / checks * 1e6}
+    return results
+
+
+# Measure how long the in-process broker takes to push a bid to every client
+# watching a listing.
+#
+# Each client is a simulated idle WebSocket connection running the real ASGI
+# application inside one event loop, as a single worker would. Bids are
+# published from a separate thread, like the bid view does.
+def run_fanout_benchmark(connections=5000, messages=20, listing_id=1):
+    async def main():
+        loop = asyncio.get_running_loop()
+        received = [0]
+        latencies = []
+        sent_at = {}
+        all_delivered = asyncio.Event()
+        hang_up = asyncio.Event()
+
+        def client():
+            connected = [False]
+
+            async def receive():
+                if not connected[0]:
+                    connected[0] = True
+                    return {"type": "websocket.connect"}
+                await hang_up.wait()
+                return {"type": "websocket.disconnect", "code": 1000}
+
+            async def send(event):
+                if event["type"] != "websocket.send":
+                    return
+                price = json.loads(event["text"])["highest_bid"]
+                latencies.append(time.perf_counter() - sent_at[price])
+                received[0] += 1
+                if received[0] == connections * messages:
+                    all_delivered.set()
+
+            scope = {"type": "websocket", "path": f"/ws/listing/{listing_id}"}
+            return websocket_application(scope, receive, send)
+
+        tasks = [asyncio.ensure_future(client()) for _ in range(connections)]
+        channel = listing_channel(listing_id)
+        while get_broker().subscriber_count(channel) < connections:
+            await asyncio.sleep(0.01)
+
+        def publisher():
+            for i in range(messages):
+                amount = Decimal(100 + i)
+                sent_at[str(amount)] = time.perf_counter()
+                publish_bid(listing_id, amount, "bench")
+                time.sleep(0.005)
+
+        start = time.perf_counter()
+        await loop.run_in_executor(None, publisher)
+        await all_delivered.wait()
+        elapsed = time.perf_counter() - start
+
+        hang_up.set()
+        await asyncio.gather(*tasks)
+
+        return {
+            "connections": connections,
+            "messages": messages,
+            "deliveries": received[0],
+            "seconds": elapsed,
+            "deliveries_per_sec": received[0] / elapsed if elapsed else 0,
+            "p50_ms": _percentile(latencies, 50) * 1000,
+            "p99_ms": _percentile(latencies, 99) * 1000,
+        }
+
+    return asyncio.run(main())
@@ -0,0 +1,151 @@
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection
+from django.utils import timezone
+
+from ..archive import archive_closed, archive_cutoff
+from ..bid_stats import repair_bid_stats
+from ..closing import close_expired
+from ..models import Bid, Listing, User, Winner
+from .. import transfer
+
+from .common import create_listings, create_bids
+
+
+# Close a backlog of expired listings, half of which have a winning bidder,
+# and report the time taken and the peak memory allocated while closing
+def run_expiry_benchmark(count=100000, batch_size=1000):
+    poster = User.objects.create_user("expiry-poster")
+    bidder = User.objects.create_user("expiry-bidder")
+    ended = timezone.now() - timezone.timedelta(minutes=1)
+    for start in range(0, count, 5000):
+        Listing.objects.bulk_create(
+            Listing(
+                poster_id=poster,
+                list_title=f"Expired {i}",
+                description="Synthetic listing",
+                starting_bid=Decimal("1.00"),
+                highest_bid=Decimal("2.00"),
+                high_bidder=bidder if i % 2 else poster,
+                image_url="",
+                active=True,
+                ends_at=ended,
+            )
+            for i in range(start, min(start + 5000, count))
+        )
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    closed = close_expired(batch_size=batch_size)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "listings": count,
+        "closed": closed,
+        "winners": Winner.objects.count(),
+        "seconds": elapsed,
+        "peak_mb": peak / 2 ** 20,
+    }
+
+
+# Load bids straight into the Bid table, skipping the statistics that
+# place_bid maintains, then time repairing the statistics from scratch
+def run_repair_benchmark(bids=1000000, listings=10000, bidders=1000, batch_size=5000):
+    create_listings(listings)
+    users = User.objects.bulk_create(User(username=f"repair-bidder-{i}") for i in range(bidders))
+    create_bids(list(Listing.objects.values_list("id", flat=True)), users, bids)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    checked, corrected = repair_bid_stats(batch_size)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "bids": bids,
+        "listings": checked,
+        "corrected": corrected,
+        "seconds": elapsed,
+        "peak_mb": peak / 2 ** 20,
+    }
+
+
+# Export a synthetic Bid table with its listings, empty both tables, then
+# import the files again. Returns time and peak Python memory of each step.
+def run_transfer_benchmark(bids=1000000, listings=10000, bidders=1000, fmt="jsonl"):
+    create_listings(listings)
+    users = User.objects.bulk_create(User(username=f"transfer-bidder-{i}") for i in range(bidders))
+    create_bids(list(Listing.objects.values_list("id", flat=True)), users, bids)
+
+    def measure(step):
+        tracemalloc.start()
+        start = time.perf_counter()
+        step()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return {"seconds": elapsed, "peak_mb": peak / 2 ** 20}
+
+    kinds = ["listings", "bids"]
+    results = {"bids": bids, "listings": listings}
+    with tempfile.TemporaryDirectory() as directory:
+        def path(kind):
+            return os.path.join(directory, transfer.filename(kind, fmt))
+
+        def export():
+            for kind in kinds:
+                with open(path(kind), "w", newline="", encoding="utf-8") as stream:
+                    transfer.export_records(kind, stream, fmt)
+
+        def load():
+            importer = transfer.Importer()
+            for kind in kinds:
+                with open(path(kind), newline="", encoding="utf-8") as stream:
+                    results["errors"] = results.get("errors", 0) + len(importer.run(kind, stream, fmt).errors)
+
+        results["export"] = measure(export)
+        results["file_mb"] = sum(os.path.getsize(path(kind)) for kind in kinds) / 2 ** 20
+        # Straight DELETEs, the ORM would collect a million bids to cascade
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {Bid._meta.db_table}")
+            cursor.execute(f"DELETE FROM {Listing._meta.db_table}")
+        results["import"] = measure(load)
+    results["imported_bids"] = Bid.objects.count()
+    return results
+
+
+# Close most of a synthetic set of listings long ago, then time archiving
+# them. Returns the rows moved, time and peak Python memory, and the size of
+# the Bid table before and after.
+def run_archive_benchmark(bids=1000000, listings=10000, closed_share=0.9, batch_size=200):
+    create_listings(listings)
+    users = User.objects.bulk_create(User(username=f"archive-bidder-{i}") for i in range(100))
+    listing_ids = list(Listing.objects.values_list("id", flat=True))
+    create_bids(listing_ids, users, bids)
+    closed = listing_ids[:int(len(listing_ids) * closed_share)]
+    Listing.objects.filter(id__in=closed).update(active=False, closed_at=timezone.now() - timedelta(days=365))
+
+    before = Bid.objects.count()
+    tracemalloc.start()
+    start = time.perf_counter()
+    totals = archive_closed(archive_cutoff(), batch_size)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "listings": totals.get("listings", 0),
+        "moved": totals.get("bids", 0),
+        "bids_before": before,
+        "bids_after": Bid.objects.count(),
+        "seconds": elapsed,
+        "peak_mb": peak / 2 ** 20,
+    }
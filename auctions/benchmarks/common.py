@@ -0,0 +1,76 @@
+import os
+import random
+import tempfile
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import connection, connections
+
+from ..models import Bid, Listing, User
+
+
+# Run a benchmark against a throwaway copy of the database schema.
+#
+# SQLite test databases default to in-memory, which can't be shared between
+# worker threads, so a temporary file is used instead.
+@contextmanager
+def temporary_database():
+    path = None
+    # create_test_db returns the test database's name, not the one it replaced
+    old_name = connection.settings_dict["NAME"]
+    test_name = connection.settings_dict["TEST"]["NAME"]
+    if connection.vendor == "sqlite":
+        fd, path = tempfile.mkstemp(suffix=".sqlite3")
+        os.close(fd)
+        connection.settings_dict["TEST"]["NAME"] = path
+
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connections.close_all()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        connection.settings_dict["TEST"]["NAME"] = test_name
+        if path and os.path.exists(path):
+            os.remove(path)
+
+
+def _percentile(values, percent):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+GENERATE_CHUNK = 10000
+
+
+def create_listings(count, category="Art"):
+    poster = User.objects.create_user(f"poster-{count}-{random.random()}")
+    Listing.objects.bulk_create(
+        Listing(
+            poster_id=poster,
+            list_title=f"Listing {poster.id}-{i}",
+            description="Synthetic listing",
+            starting_bid=Decimal("1.00"),
+            highest_bid=Decimal("1.00"),
+            high_bidder=poster,
+            category_id=category,
+            image_url="",
+            active=True,
+        )
+        for i in range(count)
+    )
+
+
+# Load count bids straight into the Bid table, spread at random over the
+# listings and users, a chunk at a time so memory use doesn't grow with the
+# count. Amounts just count up; nothing keeps the listings' prices or bid
+# statistics in step.
+def create_bids(listing_ids, users, count, seed=0):
+    rng = random.Random(seed)
+    for start in range(0, count, GENERATE_CHUNK):
+        Bid.objects.bulk_create(
+            Bid(listing_id_id=rng.choice(listing_ids), bidder_id_id=rng.choice(users).id, bid_amount=Decimal(i))
+            for i in range(start, min(start + GENERATE_CHUNK, count))
+        )
@@ -0,0 +1,488 @@
+import asyncio
+import importlib
+import io
+import itertools
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import clear_url_caches, reverse
+from django.utils import timezone
+
+from ..bidding import place_bid
+from .. import search
+from ..categories import category_names
+from ..models import Bid, Category, Comment, Listing, User, Watchlist, title_slug
+
+from .common import GENERATE_CHUNK, _percentile, create_listings
+
+
+# Route the read-only pages to the sync or async views for the duration
+@contextmanager
+def read_views(use_async):
+    from .. import urls
+
+    try:
+        with override_settings(AUCTIONS_ASYNC_VIEWS=use_async):
+            importlib.reload(urls)
+            clear_url_caches()
+            yield
+    finally:
+        importlib.reload(urls)
+        clear_url_caches()
+
+
+def _latency_summary(name, latencies, elapsed, failures):
+    return {
+        "server": name,
+        "requests": len(latencies),
+        "failures": failures,
+        "seconds": elapsed,
+        "requests_per_sec": len(latencies) / elapsed if elapsed else 0,
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+    }
+
+
+# Drive the WSGI handler from a pool of threads, one per concurrent client,
+# as a threaded WSGI server would
+def run_wsgi_benchmark(paths, requests, concurrency):
+    handler = WSGIHandler()
+    failures = [0]
+
+    def call(path):
+        environ = {
+            "REQUEST_METHOD": "GET",
+            "PATH_INFO": path,
+            "QUERY_STRING": "",
+            "SERVER_NAME": "localhost",
+            "SERVER_PORT": "80",
+            "SERVER_PROTOCOL": "HTTP/1.1",
+            "wsgi.input": io.BytesIO(),
+            "wsgi.errors": sys.stderr,
+            "wsgi.url_scheme": "http",
+        }
+        status = []
+        start = time.perf_counter()
+        response = handler(environ, lambda s, headers, exc_info=None: status.append(s))
+        b"".join(response)
+        response.close()
+        if not status[0].startswith("200"):
+            failures[0] += 1
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(call, (paths[i % len(paths)] for i in range(requests))))
+    elapsed = time.perf_counter() - start
+    connections.close_all()
+    return _latency_summary("wsgi", latencies, elapsed, failures[0])
+
+
+# Drive the ASGI handler with the given number of requests in flight at
+# once, as an ASGI server's event loop would
+def run_asgi_benchmark(paths, requests, concurrency, name="asgi"):
+    async def main():
+        handler = ASGIHandler()
+        limit = asyncio.Semaphore(concurrency)
+        failures = [0]
+
+        async def call(path):
+            async with limit:
+                done = asyncio.Event()
+                sent_request = [False]
+
+                async def receive():
+                    if not sent_request[0]:
+                        sent_request[0] = True
+                        return {"type": "http.request", "body": b"", "more_body": False}
+                    await done.wait()
+                    return {"type": "http.disconnect"}
+
+                async def send(message):
+                    if message["type"] == "http.response.start" and message["status"] != 200:
+                        failures[0] += 1
+
+                scope = {
+                    "type": "http",
+                    "asgi": {"version": "3.0"},
+                    "http_version": "1.1",
+                    "method": "GET",
+                    "scheme": "http",
+                    "path": path,
+                    "root_path": "",
+                    "query_string": b"",
+                    "headers": [(b"host", b"localhost")],
+                    "client": ("127.0.0.1", 50000),
+                    "server": ("localhost", 80),
+                }
+                start = time.perf_counter()
+                await handler(scope, receive, send)
+                done.set()
+                return time.perf_counter() - start
+
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(call(paths[i % len(paths)]) for i in range(requests)))
+        elapsed = time.perf_counter() - start
+        return _latency_summary(name, latencies, elapsed, failures[0])
+
+    return asyncio.run(main())
+
+
+# Compare the read-only pages served by WSGI with sync views, ASGI with sync
+# views and ASGI with async views
+def run_server_benchmark(paths, requests=2000, concurrency=200):
+    results = [run_wsgi_benchmark(paths, requests, concurrency)]
+    with read_views(use_async=False):
+        results.append(run_asgi_benchmark(paths, requests, concurrency, "asgi+sync"))
+    with read_views(use_async=True):
+        results.append(run_asgi_benchmark(paths, requests, concurrency, "asgi+async"))
+    return results
+
+
+# Dataset sizes for the view benchmark suite, by number of listings
+SCALES = {"10k": 10000, "100k": 100000, "1M": 1000000}
+
+
+# Fill the database with a synthetic marketplace of the given number of
+# listings: a user for every ten listings, around three bids, one comment
+# and one watchlist entry per listing.
+#
+# Bids are generated in rising order and the listings' current price, high
+# bidder and bid statistics are written to match, as place_bid() would have
+# left them. Everything is created a chunk at a time with bulk_create, so
+# memory use doesn't grow with the scale.
+def generate_dataset(listings, seed=0):
+    rng = random.Random(seed)
+    users = User.objects.bulk_create(User(username=f"user-{i}") for i in range(max(10, listings // 10)))
+    categories = list(Category.objects.exclude(name="None").values_list("name", flat=True))
+    now = timezone.now()
+
+    for start in range(0, listings, GENERATE_CHUNK):
+        rows = []
+        for i in range(start, min(start + GENERATE_CHUNK, listings)):
+            poster = rng.choice(users)
+            price = Decimal(rng.randint(1, 500))
+            bids = []
+            for n in range(rng.randint(0, 6)):
+                bidder = rng.choice(users)
+                if bidder.id != poster.id:
+                    price += Decimal(rng.randint(1, 20))
+                    bids.append((bidder, price, now - timedelta(minutes=listings - i - n)))
+            listing = Listing(
+                poster_id=poster,
+                list_title=f"Listing {i}",
+                description=f"Synthetic listing {i}",
+                starting_bid=Decimal(bids[0][1] if bids else price),
+                highest_bid=price,
+                high_bidder=bids[-1][0] if bids else poster,
+                category_id=rng.choice(categories),
+                image_url="",
+                active=rng.random() < 0.9,
+                bid_count=len(bids),
+                unique_bidders=len({bidder.id for bidder, _, _ in bids}),
+                last_bid_at=bids[-1][2] if bids else None,
+            )
+            rows.append((listing, bids))
+
+        Listing.objects.bulk_create(listing for listing, _ in rows)
+        Bid.objects.bulk_create(
+            Bid(listing_id=listing, bidder_id=bidder, bid_amount=amount, created=created)
+            for listing, bids in rows
+            for bidder, amount, created in bids
+        )
+        Comment.objects.bulk_create(
+            Comment(listing_id=listing, user_id=rng.choice(users), comment=f"Comment on {listing.list_title}")
+            for listing, _ in rows
+        )
+        Watchlist.objects.bulk_create(
+            (Watchlist(listing_id=listing, user_id=rng.choice(users)) for listing, _ in rows),
+            ignore_conflicts=True,
+        )
+
+
+def _listing_path(pair):
+    listing_id, title = pair
+    return reverse("listing", args=[listing_id, title_slug(title)])
+
+
+# Views measured by the suite. Each builds (method, path, data) for the next
+# request from the random generator and the listings' (id, title) pairs.
+SUITE_VIEWS = {
+    "index": lambda rng, listings: ("get", reverse("index"), None),
+    "listing": lambda rng, listings: ("get", _listing_path(rng.choice(listings)), None),
+    "bid": lambda rng, listings: (
+        "post", reverse("bid", args=[rng.choice(listings)[0]]), {"bid_amount": rng.randint(1, 5000)},
+    ),
+    "watchlist_view": lambda rng, listings: ("get", reverse("watchlist_view"), None),
+    "category": lambda rng, listings: (
+        "get", reverse("category", args=[rng.choice(category_names())]), None,
+    ),
+}
+
+
+# Time each view in SUITE_VIEWS over the data generate_dataset() created.
+#
+# Requests go through the test client as logged in users. Latency is
+# measured over the timed requests; query counts and peak traced memory
+# come from one extra request per view, since tracing would skew the
+# timings. Rate limiting is off, as a few clients sending every bid would
+# soon be turned away; run_ratelimit_benchmark measures it instead.
+# Returns {view: {p50_ms, p95_ms, p99_ms, queries, peak_kb}}.
+@override_settings(AUCTIONS_RATE_LIMITING=False)
+def run_view_suite(requests=200, clients=20, seed=0):
+    rng = random.Random(seed)
+    listings = list(Listing.objects.values_list("id", "list_title"))
+    sessions = []
+    for user in User.objects.order_by("id")[:clients]:
+        client = Client(HTTP_HOST="localhost")
+        client.force_login(user)
+        sessions.append(client)
+
+    def call(view):
+        method, path, data = SUITE_VIEWS[view](rng, listings)
+        response = getattr(rng.choice(sessions), method)(path, data)
+        if response.status_code not in (200, 302):
+            raise RuntimeError(f"{view}: {path} returned {response.status_code}")
+
+    results = {}
+    for view in SUITE_VIEWS:
+        cache.clear()
+        latencies = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            call(view)
+            latencies.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        with CaptureQueriesContext(connection) as queries:
+            call(view)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        results[view] = {
+            "p50_ms": round(_percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(_percentile(latencies, 95) * 1000, 2),
+            "p99_ms": round(_percentile(latencies, 99) * 1000, 2),
+            "queries": len(queries),
+            "peak_kb": round(peak / 1024, 1),
+        }
+    return results
+
+
+# Latency differences below this are treated as noise however large they are
+# relative to the baseline
+NOISE_FLOOR_MS = 2.0
+
+
+# Compare suite results with a stored baseline and describe every
+# regression. Query counts must not grow at all; latencies and memory may
+# grow by the tolerance, a fraction of the baseline value.
+def compare_to_baseline(results, baseline, tolerance=0.5):
+    regressions = []
+    for view, measured in results.items():
+        expected = baseline.get(view)
+        if expected is None:
+            continue
+        if measured["queries"] > expected["queries"]:
+            regressions.append(f"{view}: {measured['queries']} queries, baseline {expected['queries']}")
+        for metric in ("p50_ms", "p95_ms", "peak_kb"):
+            limit = expected[metric] * (1 + tolerance)
+            if metric.endswith("_ms"):
+                limit = max(limit, expected[metric] + NOISE_FLOOR_MS)
+            if measured[metric] > limit:
+                regressions.append(f"{view}: {metric} {measured[metric]:.1f}, baseline {expected[metric]:.1f}")
+    return regressions
+
+
+# Measure what the instrumentation middleware adds to the listing page.
+#
+# One client runs the normal middleware stack and another the stack without
+# InstrumentationMiddleware. Requests alternate between the two so drift in
+# machine load affects both equally. Returns p50 latency of each in
+# milliseconds and the overhead as a fraction.
+def run_metrics_overhead(requests=5000, sample_rate=None):
+    poster = User.objects.create_user("metrics-poster")
+    listing = Listing.objects.create(
+        poster_id=poster, list_title="Metrics", description="Synthetic listing",
+        starting_bid=Decimal("1.00"), highest_bid=Decimal("1.00"), high_bidder=poster,
+        image_url="", active=True,
+    )
+    path = listing.get_absolute_url()
+
+    plain = Client(HTTP_HOST="localhost")
+    stack = [name for name in settings.MIDDLEWARE if not name.endswith("InstrumentationMiddleware")]
+    with override_settings(MIDDLEWARE=stack):
+        # The client builds its middleware chain on its first request
+        plain.get(path)
+
+    rate = settings.AUCTIONS_METRICS_SAMPLE_RATE if sample_rate is None else sample_rate
+    with override_settings(AUCTIONS_METRICS_SAMPLE_RATE=rate):
+        instrumented = Client(HTTP_HOST="localhost")
+        instrumented.get(path)
+
+    latencies = {plain: [], instrumented: []}
+    for i in range(requests * 2):
+        client = plain if i % 2 else instrumented
+        start = time.perf_counter()
+        client.get(path)
+        latencies[client].append(time.perf_counter() - start)
+
+    base = _percentile(latencies[plain], 50) * 1000
+    measured = _percentile(latencies[instrumented], 50) * 1000
+    return {
+        "sample_rate": rate,
+        "plain_ms": base,
+        "instrumented_ms": measured,
+        "overhead": measured / base - 1,
+    }
+
+
+# Readers and writers hitting the same SQLite file at once, with the pragmas
+# and lock retry of auctions.sqlite or with SQLite's defaults.
+#
+# Readers fetch the index and listing pages through the test client while
+# writers bid on the same listings with place_bid(), for the given number of
+# seconds. Returns the throughput of each and how many operations failed,
+# which with the defaults means "database is locked".
+def run_sqlite_concurrency(tuned, readers=8, writers=4, seconds=5.0, listings=200, seed=0):
+    create_listings(listings)
+    pairs = list(Listing.objects.values_list("id", "list_title"))
+    ids = [listing_id for listing_id, _ in pairs]
+    bidders = [User.objects.create_user(f"sqlite-bidder-{i}") for i in range(writers)]
+    counts = {"reads": [0] * readers, "writes": [0] * writers}
+    errors = {"reads": [0] * readers, "writes": [0] * writers}
+    latencies = [[] for _ in range(readers)]
+    # All threads start together and run for the same window
+    started = []
+    barrier = threading.Barrier(readers + writers, action=lambda: started.append(time.perf_counter()))
+
+    def read(index):
+        rng = random.Random(seed + index)
+        client = Client(HTTP_HOST="localhost")
+        barrier.wait()
+        while time.perf_counter() < started[0] + seconds:
+            path = reverse("index") if rng.random() < 0.5 else _listing_path(rng.choice(pairs))
+            start = time.perf_counter()
+            try:
+                response = client.get(path)
+                ok = response.status_code == 200
+            except Exception:
+                ok = False
+            latencies[index].append(time.perf_counter() - start)
+            counts["reads"][index] += ok
+            errors["reads"][index] += not ok
+
+    def write(index):
+        rng = random.Random(seed + readers + index)
+        amount = Decimal(2)
+        barrier.wait()
+        while time.perf_counter() < started[0] + seconds:
+            amount += rng.randint(1, 3)
+            try:
+                place_bid(rng.choice(ids), bidders[index], amount)
+                counts["writes"][index] += 1
+            except Exception:
+                errors["writes"][index] += 1
+
+    def run(target, index):
+        try:
+            target(index)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=run, args=(read, i)) for i in range(readers)]
+    threads += [threading.Thread(target=run, args=(write, i)) for i in range(writers)]
+    with override_settings(AUCTIONS_SQLITE_TUNING=tuned):
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    elapsed = time.perf_counter() - started[0]
+
+    read_latencies = [latency for thread in latencies for latency in thread]
+    return {
+        "mode": "tuned" if tuned else "default",
+        "seconds": elapsed,
+        "reads": sum(counts["reads"]),
+        "writes": sum(counts["writes"]),
+        "read_errors": sum(errors["reads"]),
+        "write_errors": sum(errors["writes"]),
+        "reads_per_sec": sum(counts["reads"]) / elapsed if elapsed else 0,
+        "writes_per_sec": sum(counts["writes"]) / elapsed if elapsed else 0,
+        "read_p99_ms": _percentile(read_latencies, 99) * 1000,
+    }
+
+
+# Synthetic vocabulary for the search benchmark. Word frequencies follow
+# Zipf's law like real text, so a few words appear in most listings and most
+# words in very few.
+def _vocabulary(size, rng):
+    syllables = ["ka", "zu", "mi", "to", "ra", "ne", "so", "li", "be", "do", "gu", "pa", "ve", "xi", "yo", "wa"]
+    words = sorted({"".join(rng.choices(syllables, k=rng.randint(2, 4))) for _ in range(size * 2)})
+    rng.shuffle(words)
+    return words[:size]
+
+
+# Compare ranked full-text search against the LIKE scan it replaces.
+#
+# Returns p50/p99 latency in milliseconds for each backend on a very common
+# word, a moderately common one, two rare ones and a two word query.
+def run_search_benchmark(count=1000000, repeat=20, vocabulary_size=20000):
+    poster = User.objects.create_user("search-poster")
+    rng = random.Random(0)
+    words = _vocabulary(vocabulary_size, rng)
+    weights = list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+    for start in range(0, count, 10000):
+        Listing.objects.bulk_create(
+            Listing(
+                poster_id=poster,
+                list_title=f"{' '.join(rng.choices(words, cum_weights=weights, k=3))} {i}",
+                description=" ".join(rng.choices(words, cum_weights=weights, k=20)),
+                starting_bid=Decimal("1.00"),
+                highest_bid=Decimal("1.00"),
+                high_bidder=poster,
+                category_id="Art",
+                image_url="",
+                active=True,
+            )
+            for i in range(start, min(start + 10000, count))
+        )
+
+    queries = [words[0], words[100], words[5000], words[-1], f"{words[10]} {words[200]}"]
+
+    # What non-FTS databases run: a substring scan over both columns
+    def like_scan(query):
+        return list(search._scan(search._terms(query), None, True, None, search.PAGE_SIZE))
+
+    def fts(query):
+        return list(search.search_listings(query))
+
+    results = []
+    for query in queries:
+        for name, run in (("fts", fts), ("like", like_scan)):
+            latencies = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                run(query)
+                latencies.append(time.perf_counter() - start)
+            results.append({
+                "query": query,
+                "backend": name,
+                "p50_ms": _percentile(latencies, 50) * 1000,
+                "p99_ms": _percentile(latencies, 99) * 1000,
+            })
+    return results
@@ -0,0 +1,260 @@
+from decimal import Decimal
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Bid, Listing, ProxyBid
+from .outbox import record_bid
+from .realtime import publish_bid
+
+
+# Outcome of a single bid placement attempt
+class BidResult:
+    ACCEPTED = "accepted"
+    OUTBID = "outbid"
+    TOO_LOW = "too_low"
+    CLOSED = "closed"
+    NOT_FOUND = "not_found"
+
+    MESSAGES = {
+        ACCEPTED: "Your bid has been accepted",
+        OUTBID: "Your bid was placed, but another bidder's maximum bid is higher",
+        TOO_LOW: "New bid must be higher than the current price",
+        CLOSED: "This auction has been closed",
+        NOT_FOUND: "This listing does not exist",
+    }
+
+    def __init__(self, status, amount, bid=None):
+        self.status = status
+        self.amount = amount
+        self.bid = bid
+
+    @property
+    def accepted(self):
+        return self.status == self.ACCEPTED
+
+    # Whether a bid was stored, even if it was then outbid
+    @property
+    def placed(self):
+        return self.status in (self.ACCEPTED, self.OUTBID)
+
+    @property
+    def message(self):
+        return self.MESSAGES[self.status]
+
+    def __bool__(self):
+        return self.accepted
+
+    def __repr__(self):
+        return f"<BidResult {self.status} ${self.amount}>"
+
+
+# Place a bid on a listing.
+#
+# The listing is read first, without a lock, and a bid that is too low or
+# too late is turned away on that read alone, without a write transaction.
+# Otherwise the listing row is only touched by a single conditional UPDATE,
+# so two concurrent bidders can never both win against the same price and
+# the highest bid can never go backwards. The same UPDATE maintains the
+# listing's bid statistics. The Bid row is inserted in the same
+# transaction, so an accepted bid is never lost.
+#
+# Proxy bids on the listing answer the bid in the same transaction, so the
+# result is OUTBID if someone's maximum is higher. The listing's proxy_max
+# tells whether any can, so other bids don't look at proxy bids at all. With
+# notifications on, the bid that holds the lead once proxies are settled is
+# recorded in the outbox in the same transaction too.
+def place_bid(listing_id, bidder, amount):
+    now = timezone.now()
+    # If the listing changed since it was read the UPDATE matches nothing,
+    # and the bid goes round again
+    while True:
+        state = Listing.objects.filter(pk=listing_id).values("active", "ends_at", "highest_bid", "proxy_max").first()
+        if state is None:
+            return BidResult(BidResult.NOT_FOUND, amount)
+        if not state["active"] or (state["ends_at"] is not None and state["ends_at"] <= now):
+            return BidResult(BidResult.CLOSED, amount)
+        if amount <= state["highest_bid"]:
+            return BidResult(BidResult.TOO_LOW, amount)
+
+        answered = state["proxy_max"] is not None and state["proxy_max"] >= amount
+        result = _store_bid(listing_id, bidder, amount, now, answered)
+        if result is not None:
+            return result
+
+
+# place_bid()'s UPDATE, built once: compiling it through the ORM took
+# longer than running it. Parameters are the amount, the bidder id twice,
+# the time, the listing id, the time again and the amount again, and once
+# more if guarded, when it only matches while no proxy bid can answer.
+@lru_cache(maxsize=None)
+def _bid_update_sql(guarded):
+    quote = connection.ops.quote_name
+    listing, bid = quote(Listing._meta.db_table), quote(Bid._meta.db_table)
+    col = {field.name: quote(field.column) for field in Listing._meta.concrete_fields}
+    bid_listing = quote(Bid._meta.get_field("listing_id").column)
+    bid_bidder = quote(Bid._meta.get_field("bidder_id").column)
+
+    sql = (
+        f"UPDATE {listing} SET {col['highest_bid']} = %s, {col['high_bidder']} = %s, "
+        f"{col['bid_count']} = {col['bid_count']} + 1, "
+        f"{col['unique_bidders']} = {col['unique_bidders']} + CASE WHEN EXISTS ("
+        f"SELECT 1 FROM {bid} WHERE {bid}.{bid_listing} = {listing}.{col['id']} AND {bid}.{bid_bidder} = %s"
+        f") THEN 0 ELSE 1 END, {col['last_bid_at']} = %s "
+        f"WHERE {col['id']} = %s AND {col['active']} AND ({col['ends_at']} IS NULL OR {col['ends_at']} > %s) "
+        f"AND {col['highest_bid']} < %s"
+    )
+    if guarded:
+        sql += f" AND ({col['proxy_max']} IS NULL OR {col['proxy_max']} < %s)"
+    return sql
+
+
+# The write half of place_bid(). Returns None if the UPDATE matched nothing.
+def _store_bid(listing_id, bidder, amount, now, answered):
+    price = connection.ops.adapt_decimalfield_value(amount)
+    time = connection.ops.adapt_datetimefield_value(now)
+    params = [price, bidder.id, bidder.id, time, listing_id, time, price]
+    if not answered:
+        # A proxy bid placed since the read sends the bid round again
+        params.append(price)
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(_bid_update_sql(not answered), params)
+            if not cursor.rowcount:
+                return None
+
+        bid = Bid.objects.create(
+            listing_id_id=listing_id,
+            bidder_id=bidder,
+            bid_amount=amount,
+            created=now
+        )
+        high_bidder, proxy_bids = bidder.id, []
+        if answered:
+            _, high_bidder, proxy_bids = _resolve_proxies(listing_id, amount, bidder.id, now, now)
+        record_bid(proxy_bids[-1] if proxy_bids else bid, bid)
+        if high_bidder != bidder.id:
+            return BidResult(BidResult.OUTBID, amount, bid)
+        transaction.on_commit(lambda: publish_bid(listing_id, amount, bidder.username))
+        return BidResult(BidResult.ACCEPTED, amount, bid)
+
+
+def bid_increment():
+    return Decimal(settings.AUCTIONS_BID_INCREMENT)
+
+
+# A contender for the lead: a proxy bid, or the current high bidder standing
+# on the current price
+class _Contender:
+    def __init__(self, bidder_id, amount, created, proxy=None):
+        self.bidder_id = bidder_id
+        self.amount = amount
+        self.created = created
+        self.proxy = proxy
+
+    # Highest amount first, the earlier bid on a tie
+    def key(self):
+        return (-self.amount, self.created)
+
+
+# Settle the proxy bids on a listing, given its current price, high bidder
+# and the time of their bid. Runs in the caller's transaction, which must
+# already hold the lock on the listing row. Returns the listing's resulting
+# (price, high bidder id) and the bids stored for proxies, the last of them
+# the one a proxy took the lead with.
+#
+# Only the two highest maxima at or above the current price can matter: the
+# highest takes the lead, at one increment over the runner-up, capped at its
+# own maximum. They come from the (listing, max_amount) index, so this costs
+# the same however many proxies the listing has. At most two visible bids
+# are stored, the runner-up's maximum and the leader's new price, where a
+# bidding war fought by hand would have stored one per step.
+def _resolve_proxies(listing_id, price, holder, held_since, now):
+    proxies = (
+        ProxyBid.objects.filter(listing_id=listing_id, max_amount__gte=price)
+        .select_related("bidder_id")
+        .order_by("-max_amount", "created")[:2]
+    )
+    contenders = [_Contender(proxy.bidder_id_id, proxy.max_amount, proxy.created, proxy) for proxy in proxies]
+    if holder not in (contender.bidder_id for contender in contenders):
+        contenders.append(_Contender(holder, price, held_since))
+    contenders.sort(key=_Contender.key)
+
+    leader = contenders[0]
+    if leader.proxy is None or len(contenders) == 1:
+        # Nobody to outbid
+        return price, holder, []
+    runner_up = contenders[1]
+    new_price = min(leader.amount, runner_up.amount + bid_increment())
+    if new_price == price and leader.bidder_id == holder:
+        return price, holder, []
+
+    bids = []
+    # A runner-up at the current price already has a visible bid there
+    if runner_up.proxy is not None and runner_up.amount > price:
+        bids.append(Bid(listing_id_id=listing_id, bidder_id_id=runner_up.bidder_id, bid_amount=runner_up.amount, created=now))
+    bids.append(Bid(listing_id_id=listing_id, bidder_id_id=leader.bidder_id, bid_amount=new_price, created=now))
+
+    bidders = {bid.bidder_id_id for bid in bids}
+    returning = set(Bid.objects.filter(listing_id=listing_id, bidder_id__in=bidders).values_list("bidder_id", flat=True))
+    Listing.objects.filter(pk=listing_id).update(
+        highest_bid=new_price,
+        high_bidder_id=leader.bidder_id,
+        bid_count=F("bid_count") + len(bids),
+        unique_bidders=F("unique_bidders") + len(bidders - returning),
+        last_bid_at=now,
+    )
+    # Saved one at a time rather than in bulk so the listing's cache is
+    # invalidated as for any other bid
+    for bid in bids:
+        bid.save()
+
+    username = leader.proxy.bidder_id.username
+    transaction.on_commit(lambda: publish_bid(listing_id, new_price, username))
+    return new_price, leader.bidder_id, bids
+
+
+# Set a hidden maximum on a listing. Proxy bidding raises the bidder's bid
+# only as far as needed to keep the lead, now and whenever someone bids
+# against them later.
+#
+# The maximum must be above the current price and above any maximum the
+# bidder already has on the listing. The result is ACCEPTED with the price
+# the bidder now leads at, or OUTBID if another maximum is higher.
+def place_proxy_bid(listing_id, bidder, max_amount):
+    now = timezone.now()
+    with transaction.atomic():
+        state = (
+            Listing.objects.select_for_update().filter(pk=listing_id)
+            .values("active", "ends_at", "highest_bid", "high_bidder_id", "last_bid_at").first()
+        )
+        if state is None:
+            return BidResult(BidResult.NOT_FOUND, max_amount)
+        if not state["active"] or (state["ends_at"] is not None and state["ends_at"] <= now):
+            return BidResult(BidResult.CLOSED, max_amount)
+        if max_amount <= state["highest_bid"]:
+            return BidResult(BidResult.TOO_LOW, max_amount)
+
+        proxy, created = ProxyBid.objects.get_or_create(
+            listing_id_id=listing_id, bidder_id=bidder, defaults={"max_amount": max_amount, "created": now}
+        )
+        if not created:
+            if proxy.max_amount >= max_amount:
+                return BidResult(BidResult.TOO_LOW, max_amount)
+            proxy.max_amount, proxy.created = max_amount, now
+            proxy.save(update_fields=["max_amount", "created"])
+        # From here place_bid() hands bids up to the maximum to the proxies
+        Listing.objects.filter(Q(proxy_max__isnull=True) | Q(proxy_max__lt=max_amount), pk=listing_id).update(
+            proxy_max=max_amount
+        )
+
+        price, high_bidder, bids = _resolve_proxies(
+            listing_id, state["highest_bid"], state["high_bidder_id"], state["last_bid_at"] or now, now
+        )
+        if bids:
+            record_bid(bids[-1], bids[0])
+    return BidResult(BidResult.ACCEPTED if high_bidder == bidder.id else BidResult.OUTBID, price)
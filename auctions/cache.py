@@ -0,0 +1,162 @@
+import hashlib
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.views.decorators.http import condition
+
+from .models import Listing
+from .routers import cache_timeout
+
+
+def _version_key(listing_id):
+    return f"listing-version:{listing_id}"
+
+
+# Titles can contain anything, so they are hashed to make a safe key
+def _title_key(title):
+    return "listing-title:" + hashlib.md5(title.encode()).hexdigest()
+
+
+def _snapshot_key(listing_id, version):
+    return f"listing:{listing_id}:{version}"
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+# Current cache version of a listing.
+#
+# Versions are millisecond timestamps rather than counters, so if one is
+# evicted it comes back larger than any value handed out before and stale
+# entries are never reused.
+def listing_version(listing_id):
+    key = _version_key(listing_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _now_ms(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+async def alisting_version(listing_id):
+    key = _version_key(listing_id)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, _now_ms(), timeout=None)
+        version = await cache.aget(key)
+    return version
+
+
+# Invalidate everything cached for a listing by moving it to a new version.
+# Old entries are left to expire or be evicted.
+def bump_listing_version(listing_id):
+    key = _version_key(listing_id)
+    version = max(_now_ms(), (cache.get(key) or 0) + 1)
+    cache.set(key, version, timeout=None)
+    return version
+
+
+# bump_listing_version() for many listings at once
+def bump_listing_versions(listing_ids):
+    keys = {_version_key(listing_id): listing_id for listing_id in listing_ids}
+    current = cache.get_many(keys)
+    now = _now_ms()
+    cache.set_many({key: max(now, current.get(key, 0) + 1) for key in keys}, timeout=None)
+
+
+# The listing details shown to every visitor. Comments are paged and cached
+# separately, see auctions.comments.
+class ListingSnapshot:
+    def __init__(self, listing, version):
+        self.listing = listing
+        self.version = version
+
+
+def _load_snapshot(listing_id, version):
+    try:
+        listing = Listing.objects.select_related("poster_id", "high_bidder").get(pk=listing_id)
+    except Listing.DoesNotExist:
+        return None
+    return ListingSnapshot(listing, version)
+
+
+async def _aload_snapshot(listing_id, version):
+    try:
+        listing = await Listing.objects.select_related("poster_id", "high_bidder").aget(pk=listing_id)
+    except Listing.DoesNotExist:
+        return None
+    return ListingSnapshot(listing, version)
+
+
+# The listing page data for a listing id, from the cache when the listing
+# hasn't changed since it was last loaded. Returns None if there is no such
+# listing.
+def get_snapshot_by_id(listing_id):
+    version = listing_version(listing_id)
+    key = _snapshot_key(listing_id, version)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = _load_snapshot(listing_id, version)
+        if snapshot is not None:
+            cache.set(key, snapshot, cache_timeout(settings.AUCTIONS_LISTING_CACHE_TIMEOUT))
+    return snapshot
+
+
+async def aget_snapshot_by_id(listing_id):
+    version = await alisting_version(listing_id)
+    key = _snapshot_key(listing_id, version)
+    snapshot = await cache.aget(key)
+    if snapshot is None:
+        snapshot = await _aload_snapshot(listing_id, version)
+        if snapshot is not None:
+            await cache.aset(key, snapshot, cache_timeout(settings.AUCTIONS_LISTING_CACHE_TIMEOUT))
+    return snapshot
+
+
+# The listing page data for a title, served from the cache when the listing
+# hasn't changed since it was last loaded. Returns None if there is no such
+# listing. Pages are routed by id, this serves the old title URLs, see
+# views.listing_by_title.
+def get_listing_snapshot(title):
+    listing_id = cache.get(_title_key(title))
+    if listing_id is None:
+        listing_id = Listing.objects.filter(list_title=title).values_list("id", flat=True).first()
+        if listing_id is None:
+            return None
+        cache.set(_title_key(title), listing_id, timeout=None)
+
+    snapshot = get_snapshot_by_id(listing_id)
+    if snapshot is None:
+        cache.delete(_title_key(title))
+        return None
+
+    # The title may have been edited since it was cached
+    if snapshot.listing.list_title != title:
+        cache.delete(_title_key(title))
+        return get_listing_snapshot(title)
+
+    return snapshot
+
+
+# HTTP validators for responses about one listing, for the condition
+# decorator. The version is looked up once per request and the query string
+# is part of the ETag, since it changes the representation.
+def _request_version(request, listing_id):
+    if not hasattr(request, "_listing_version"):
+        request._listing_version = listing_version(listing_id)
+    return request._listing_version
+
+
+def listing_etag(request, listing_id, *args):
+    query = hashlib.md5(request.GET.urlencode().encode()).hexdigest()[:8]
+    return f"{listing_id}-{_request_version(request, listing_id)}-{query}"
+
+
+def listing_last_modified(request, listing_id, *args):
+    return datetime.fromtimestamp(_request_version(request, listing_id) / 1000, tz=timezone.utc)
+
+
+listing_conditional = condition(etag_func=listing_etag, last_modified_func=listing_last_modified)
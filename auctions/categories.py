@@ -0,0 +1,58 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Category, Listing
+from .routers import cache_timeout
+
+# Category names with their active listing counts, for the categories page
+# and category pickers.
+#
+# Counting is one aggregate over the partial (category, id) index of active
+# listings, so it never touches closed listings or the table itself. The
+# result is cached until a listing is created, edited, closed or deleted or
+# a category changes, see auctions.signals, so the categories page doesn't
+# count anything on a normal request. Bids don't change the counts and
+# don't invalidate them.
+
+COUNTS_KEY = "category-counts"
+
+
+def _active_counts():
+    return (
+        Listing.objects.filter(active=True)
+        .values_list("category_id").annotate(count=Count("id")).order_by()
+    )
+
+
+def _names():
+    return Category.objects.values_list("name", flat=True)
+
+
+# [(name, active listing count)] for every category, in name order
+def category_counts():
+    counts = cache.get(COUNTS_KEY)
+    if counts is None:
+        active = dict(_active_counts())
+        counts = [(name, active.get(name, 0)) for name in _names()]
+        cache.set(COUNTS_KEY, counts, cache_timeout(settings.AUCTIONS_CATEGORY_CACHE_TIMEOUT))
+    return counts
+
+
+async def acategory_counts():
+    counts = await cache.aget(COUNTS_KEY)
+    if counts is None:
+        active = {name: count async for name, count in _active_counts()}
+        counts = [(name, active.get(name, 0)) async for name in _names()]
+        await cache.aset(COUNTS_KEY, counts, cache_timeout(settings.AUCTIONS_CATEGORY_CACHE_TIMEOUT))
+    return counts
+
+
+def category_names():
+    return [name for name, _ in category_counts()]
+
+
+# Drop the cached counts once the current transaction commits
+def invalidate_category_counts():
+    transaction.on_commit(lambda: cache.delete(COUNTS_KEY))
@@ -0,0 +1,68 @@
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Listing, Winner
+from .outbox import record_closed
+from .signals import invalidate_listings
+
+CLOSE_BATCH_SIZE = 1000
+
+
+# Close listings and record their winners.
+#
+# The listings are marked closed first, which stops any further bid from
+# being accepted, so the high bidder read back afterwards is final. Listings
+# nobody bid on have no winner. The closes are recorded in the outbox for
+# notifications in the same transaction.
+def _close(listing_ids, closed_at):
+    closed = Listing.objects.filter(id__in=listing_ids, active=True).update(active=False, closed_at=closed_at)
+    if not closed:
+        return 0
+
+    results = Listing.objects.filter(id__in=listing_ids).values_list(
+        "id", "poster_id_id", "high_bidder_id", "highest_bid"
+    )
+    Winner.objects.bulk_create(
+        [
+            Winner(listing_id_id=listing_id, user_id_id=high_bidder, amount=amount, closed_at=closed_at)
+            for listing_id, poster, high_bidder, amount in results
+            if high_bidder != poster
+        ],
+        ignore_conflicts=True,
+    )
+    record_closed(listing_id for listing_id, *_ in results)
+    invalidate_listings(listing_ids)
+    return closed
+
+
+# Close a single listing by hand. Returns False if it was already closed.
+def close_listing(listing_id):
+    with transaction.atomic():
+        return _close([listing_id], timezone.now()) == 1
+
+
+# Close one batch of listings whose end time has passed, returning how many
+# were closed. Each batch is an indexed range read, one UPDATE and one bulk
+# INSERT of winners, so memory use is bounded by the batch size.
+def close_expired_batch(now=None, batch_size=CLOSE_BATCH_SIZE):
+    now = now or timezone.now()
+    with transaction.atomic():
+        listing_ids = list(
+            Listing.objects.filter(active=True, ends_at__lte=now)
+            .order_by("ends_at")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not listing_ids:
+            return 0
+        return _close(listing_ids, now)
+
+
+# Close every listing that has expired by now, batch by batch
+def close_expired(now=None, batch_size=CLOSE_BATCH_SIZE):
+    now = now or timezone.now()
+    total = 0
+    while True:
+        closed = close_expired_batch(now, batch_size)
+        if not closed:
+            return total
+        total += closed
@@ -0,0 +1,97 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.template.loader import render_to_string
+
+from .cache import alisting_version, listing_version
+from .models import ArchivedComment, Comment
+from .pagination import KeysetPage
+from .routers import cache_timeout
+
+# Comment threads, newest first, a page at a time.
+#
+# Pages are keyset paginated on (created, id) using the listing's comment
+# index, so a listing with thousands of comments costs the same per page as
+# one with ten. Rendered pages are the same for every visitor and are cached
+# under the listing's version, which a new comment bumps. Archived listings
+# read their comments from the archive table, see auctions.archive.
+
+COMMENT_PAGE_SIZE = 20
+
+COMMENTS_TEMPLATE = "auctions/comments.html"
+
+
+def _encode_cursor(comment):
+    token = f"{comment.created.isoformat()}|{comment.id}".encode()
+    return urlsafe_b64encode(token).decode().rstrip("=")
+
+
+# Returns (created, id), or None for a missing or malformed cursor
+def _decode_cursor(token):
+    if not token:
+        return None
+    try:
+        created, comment_id = urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode().split("|")
+        return datetime.fromisoformat(created), int(comment_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def _page_query(listing_id, cursor, page_size, archived=False):
+    comments = (
+        (ArchivedComment if archived else Comment).objects.filter(listing_id=listing_id)
+        .select_related("user_id")
+        .only("comment", "created", "user_id", "user_id__username")
+        .order_by("-created", "-id")
+    )
+    position = _decode_cursor(cursor)
+    if position:
+        created, comment_id = position
+        comments = comments.filter(Q(created__lt=created) | Q(created=created, id__lt=comment_id))
+    # One extra row tells us whether there are older comments
+    return comments[:page_size + 1]
+
+
+def _build_page(rows, page_size):
+    if len(rows) > page_size:
+        return KeysetPage(rows[:page_size], next_cursor=_encode_cursor(rows[page_size - 1]))
+    return KeysetPage(rows)
+
+
+# One page of a listing's comments with their authors, in one query
+def comment_page(listing_id, cursor=None, page_size=COMMENT_PAGE_SIZE, archived=False):
+    return _build_page(list(_page_query(listing_id, cursor, page_size, archived)), page_size)
+
+
+async def acomment_page(listing_id, cursor=None, page_size=COMMENT_PAGE_SIZE, archived=False):
+    return _build_page([row async for row in _page_query(listing_id, cursor, page_size, archived)], page_size)
+
+
+def _cache_key(listing_id, version, cursor):
+    return f"comments:{listing_id}:{version}:{cursor or ''}"
+
+
+def _render(listing_id, page):
+    return render_to_string(COMMENTS_TEMPLATE, {"listing_id": listing_id, "page": page})
+
+
+# HTML for a page of comments, from the cache while the listing is unchanged
+def render_comments(listing_id, cursor=None, archived=False):
+    key = _cache_key(listing_id, listing_version(listing_id), cursor)
+    html = cache.get(key)
+    if html is None:
+        html = _render(listing_id, comment_page(listing_id, cursor, archived=archived))
+        cache.set(key, html, cache_timeout(settings.AUCTIONS_LISTING_CACHE_TIMEOUT))
+    return html
+
+
+async def arender_comments(listing_id, cursor=None, archived=False):
+    key = _cache_key(listing_id, await alisting_version(listing_id), cursor)
+    html = await cache.aget(key)
+    if html is None:
+        html = _render(listing_id, await acomment_page(listing_id, cursor, archived=archived))
+        await cache.aset(key, html, cache_timeout(settings.AUCTIONS_LISTING_CACHE_TIMEOUT))
+    return html
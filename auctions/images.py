@@ -0,0 +1,257 @@
+import hashlib
+import io
+import ipaddress
+import logging
+import os
+import socket
+import tempfile
+from http.client import HTTPConnection, HTTPSConnection
+from urllib.parse import urlsplit
+from urllib.request import HTTPHandler, HTTPRedirectHandler, HTTPSHandler, ProxyHandler, Request, build_opener
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .models import Listing
+from .signals import invalidate_listing
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Thumbnails of listing images, served from our own origin.
+#
+# A listing's image is fetched by the generate_thumbnails command, never
+# while handling a request, and cut to each of AUCTIONS_THUMBNAIL_SIZES. Run
+# it with --loop next to the web workers to pick up new listings. Until then
+# pages link to the original image URL. The thumbnails are named after a
+# hash of the original image, which is stored on the listing as
+# image_digest, so a thumbnail URL never changes content and is served with
+# a year-long immutable Cache-Control. A new image gets a new digest and
+# new URLs.
+#
+# Image URLs come from users, so fetch_url only connects to public
+# addresses. The check is made on the addresses the host resolves to, right
+# before connecting, for every redirect too, so a name that resolves to a
+# private address, or a redirect to one, gets nowhere.
+#
+# The thumbnail directory is an LRU cache bounded at
+# AUCTIONS_IMAGE_CACHE_BYTES. Serving a thumbnail refreshes its mtime, and
+# writing new ones evicts the least recently served once the directory's
+# size, counted as thumbnails are written, passes the limit. A request for
+# an evicted thumbnail is redirected to the original image, and the
+# listing is queued for the command to make its thumbnails again.
+#
+# Pillow is optional. Without it no thumbnails are made and pages link to
+# the original image URLs, as before.
+
+JPEG_QUALITY = 80
+
+
+class ImageError(Exception):
+    pass
+
+
+def _is_public(address):
+    address = ipaddress.ip_address(address)
+    return address.is_global and not address.is_multicast
+
+
+# socket.create_connection, refusing hosts with a non-public address
+def _public_connection(address, timeout, source_address=None):
+    host, port = address
+    try:
+        addresses = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except OSError as error:
+        raise ImageError(f"Couldn't resolve {host}: {error}")
+    for *_, sockaddr in addresses:
+        if not _is_public(sockaddr[0]):
+            raise ImageError(f"{host} isn't a public address")
+    # Connect to the addresses just checked, not whatever a second lookup says
+    family, kind, protocol, _, sockaddr = addresses[0]
+    sock = socket.socket(family, kind, protocol)
+    try:
+        sock.settimeout(timeout)
+        sock.connect(sockaddr)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+class _PublicHTTPConnection(HTTPConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _public_connection
+
+
+class _PublicHTTPSConnection(HTTPSConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _public_connection
+
+
+class _PublicHTTPHandler(HTTPHandler):
+    def http_open(self, request):
+        return self.do_open(_PublicHTTPConnection, request)
+
+
+class _PublicHTTPSHandler(HTTPSHandler):
+    def https_open(self, request):
+        return self.do_open(_PublicHTTPSConnection, request, context=self._context)
+
+
+class _RedirectHandler(HTTPRedirectHandler):
+    def redirect_request(self, request, fp, code, message, headers, url):
+        if urlsplit(url).scheme not in ("http", "https"):
+            raise ImageError(f"Redirected to a URL that isn't http(s): {url}")
+        return super().redirect_request(request, fp, code, message, headers, url)
+
+
+# No proxies from the environment, the proxy would make the connection
+_opener = build_opener(ProxyHandler({}), _PublicHTTPHandler, _PublicHTTPSHandler, _RedirectHandler)
+
+
+# The bytes of an http(s) image URL on a public address, up to
+# AUCTIONS_IMAGE_MAX_BYTES
+def fetch_url(url):
+    if urlsplit(url).scheme not in ("http", "https"):
+        raise ImageError(f"Not an http(s) URL: {url}")
+    request = Request(url, headers={"User-Agent": "auctions-thumbnailer"})
+    try:
+        with _opener.open(request, timeout=settings.AUCTIONS_IMAGE_FETCH_TIMEOUT) as response:
+            data = response.read(settings.AUCTIONS_IMAGE_MAX_BYTES + 1)
+    except (OSError, ValueError) as error:
+        raise ImageError(f"Couldn't fetch {url}: {error}")
+    if len(data) > settings.AUCTIONS_IMAGE_MAX_BYTES:
+        raise ImageError(f"Image larger than {settings.AUCTIONS_IMAGE_MAX_BYTES} bytes: {url}")
+    return data
+
+
+def fetch_image(url):
+    return import_string(settings.AUCTIONS_IMAGE_FETCHER)(url)
+
+
+def image_digest(data):
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def thumbnail_path(digest, size):
+    return os.path.join(settings.AUCTIONS_IMAGE_DIR, f"{digest}-{size}.jpg")
+
+
+# JPEG bytes of the image cropped to fill each thumbnail size
+def make_thumbnails(data):
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image = ImageOps.exif_transpose(image).convert("RGB")
+    except (OSError, ValueError, Image.DecompressionBombError) as error:
+        raise ImageError(f"Not an image: {error}")
+
+    thumbnails = {}
+    for size, dimensions in settings.AUCTIONS_THUMBNAIL_SIZES.items():
+        output = io.BytesIO()
+        ImageOps.fit(image, dimensions, Image.LANCZOS).save(output, "JPEG", quality=JPEG_QUALITY, optimize=True)
+        thumbnails[size] = output.getvalue()
+    return thumbnails
+
+
+# Bytes of thumbnails in each image directory, counted once and then kept
+# up to date as this process writes and evicts, so writing a thumbnail
+# doesn't list the whole directory
+_usage = {}
+
+
+def _directory_size():
+    with os.scandir(settings.AUCTIONS_IMAGE_DIR) as scan:
+        return sum(entry.stat().st_size for entry in scan if entry.is_file() and entry.name.endswith(".jpg"))
+
+
+# Write to a temporary file and rename, so a reader never sees half a file
+def _write(path, data):
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as stream:
+        stream.write(data)
+    os.replace(temporary, path)
+
+
+# Remove the least recently served thumbnails until the directory is back
+# under 90% of its limit, so eviction doesn't run on every write
+def evict(limit=None):
+    limit = settings.AUCTIONS_IMAGE_CACHE_BYTES if limit is None else limit
+    entries = []
+    total = 0
+    with os.scandir(settings.AUCTIONS_IMAGE_DIR) as scan:
+        for entry in scan:
+            if entry.is_file() and entry.name.endswith(".jpg"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+    removed = 0
+    if total > limit:
+        for _, size, path in sorted(entries):
+            if total <= limit * 0.9:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+    _usage[settings.AUCTIONS_IMAGE_DIR] = total
+    return removed
+
+
+# Fetch a listing's image and write its thumbnails. Records the digest on
+# the listing and returns it, or returns None if the image couldn't be
+# fetched or read, or Pillow isn't installed. Fetches, so it is for the
+# generate_thumbnails command and not for views.
+def generate_thumbnails(listing):
+    if Image is None or not listing.image_url:
+        return None
+    try:
+        data = fetch_image(listing.image_url)
+        thumbnails = make_thumbnails(data)
+    except ImageError as error:
+        logger.info("No thumbnails for listing %s: %s", listing.id, error)
+        return None
+
+    digest = image_digest(data)
+    directory = settings.AUCTIONS_IMAGE_DIR
+    os.makedirs(directory, exist_ok=True)
+    if directory not in _usage:
+        _usage[directory] = _directory_size()
+    for size, thumbnail in thumbnails.items():
+        _write(thumbnail_path(digest, size), thumbnail)
+        _usage[directory] += len(thumbnail)
+    if _usage[directory] > settings.AUCTIONS_IMAGE_CACHE_BYTES:
+        evict()
+
+    if digest != listing.image_digest:
+        Listing.objects.filter(id=listing.id).update(image_digest=digest)
+        listing.image_digest = digest
+        invalidate_listing(listing.id)
+    return digest
+
+
+# Path of a thumbnail to serve, None if the digest isn't the listing's
+# current one or the thumbnail was evicted. An evicted thumbnail isn't made
+# again here: the listing's digest is cleared, so its pages use the original
+# image and the generate_thumbnails command picks it up again.
+def thumbnail_file(listing, digest, size):
+    if digest != listing.image_digest or size not in settings.AUCTIONS_THUMBNAIL_SIZES:
+        return None
+    path = thumbnail_path(digest, size)
+    try:
+        # Marks the thumbnail as recently used
+        os.utime(path)
+        return path
+    except FileNotFoundError:
+        pass
+    if Listing.objects.filter(id=listing.id, image_digest=digest).update(image_digest=""):
+        invalidate_listing(listing.id)
+    return None
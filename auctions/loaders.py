@@ -0,0 +1,53 @@
+from functools import wraps
+
+from django.http import HttpResponsePermanentRedirect, HttpResponseRedirect
+from django.urls import reverse
+
+from .cache import aget_snapshot_by_id, get_snapshot_by_id
+
+# Listing pages are routed by id, /listing/<id>/<slug>, and the actions on a
+# listing by id alone. The decorators here resolve the id to the listing's
+# snapshot once per request, by primary key and usually from the cache, and
+# attach it to the request as request.snapshot for the view.
+#
+# A listing URL whose slug doesn't match the title, because the title was
+# edited or the link was mistyped, is redirected to the current one.
+
+
+def _canonical(request, snapshot, slug):
+    if slug is None or slug == snapshot.listing.slug:
+        return None
+    url = snapshot.listing.get_absolute_url()
+    if request.GET:
+        url += "?" + request.GET.urlencode()
+    return HttpResponsePermanentRedirect(url)
+
+
+# Load the listing for a view taking listing_id, and a slug for listing
+# pages. Unknown listings go back to the index.
+def listing_required(view):
+    @wraps(view)
+    def wrapper(request, listing_id, slug=None, **kwargs):
+        snapshot = get_snapshot_by_id(listing_id)
+        if snapshot is None:
+            return HttpResponseRedirect(reverse("index"))
+        redirect = _canonical(request, snapshot, slug)
+        if redirect:
+            return redirect
+        request.snapshot = snapshot
+        return view(request, listing_id, **kwargs)
+    return wrapper
+
+
+def alisting_required(view):
+    @wraps(view)
+    async def wrapper(request, listing_id, slug=None, **kwargs):
+        snapshot = await aget_snapshot_by_id(listing_id)
+        if snapshot is None:
+            return HttpResponseRedirect(reverse("index"))
+        redirect = _canonical(request, snapshot, slug)
+        if redirect:
+            return redirect
+        request.snapshot = snapshot
+        return await view(request, listing_id, **kwargs)
+    return wrapper
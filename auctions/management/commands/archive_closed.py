@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from auctions.archive import ARCHIVE_BATCH_SIZE, archive_closed, archive_cutoff
+
+
+# Archive auctions that closed long ago
+class Command(BaseCommand):
+    help = (
+        "Move the bids, comments and watchlist entries of long-closed listings to the archive tables. "
+        "Listings and winners are kept."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, help="Archive listings closed this many days ago or more.")
+        parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        totals = archive_closed(archive_cutoff(options["days"]), options["batch_size"])
+        self.stdout.write(
+            "Archived {} listings: {} bids, {} comments, {} watchlist entries.".format(
+                totals.get("listings", 0), totals.get("bids", 0), totals.get("comments", 0),
+                totals.get("watchlists", 0),
+            )
+        )
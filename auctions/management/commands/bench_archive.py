@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from auctions.benchmarks.bulk import run_archive_benchmark
+from auctions.benchmarks.common import temporary_database
+
+
+# Benchmark archiving the bids of long-closed listings
+class Command(BaseCommand):
+    help = "Measure time and peak memory of archive_closed over a synthetic Bid table."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bids", type=int, default=1000000)
+        parser.add_argument("--listings", type=int, default=10000)
+        parser.add_argument("--closed-share", type=float, default=0.9, help="Share of listings closed long ago.")
+
+    def handle(self, *args, **options):
+        with temporary_database():
+            result = run_archive_benchmark(options["bids"], options["listings"], options["closed_share"])
+
+        self.stdout.write(
+            "Archived {listings} listings, {moved} bids in {seconds:.2f}s, peak {peak_mb:.1f} MB. "
+            "Bid table {bids_before} -> {bids_after} rows".format(**result)
+        )
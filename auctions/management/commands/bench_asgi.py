@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from auctions.benchmarks.common import create_listings, temporary_database
+from auctions.benchmarks.reads import run_server_benchmark
+
+
+# Compare WSGI and ASGI serving of the read-only pages
+class Command(BaseCommand):
+    help = "Benchmark requests/sec and p99 latency of the read-only pages under WSGI and ASGI."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--concurrency", type=int, default=200)
+        parser.add_argument("--listings", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with temporary_database():
+            create_listings(options["listings"])
+            results = run_server_benchmark(
+                ["/", "/closed", "/category/Art", "/categories"],
+                requests=options["requests"],
+                concurrency=options["concurrency"],
+            )
+
+        for result in results:
+            self.stdout.write(
+                "{server:>10}: {requests} requests in {seconds:.2f}s, {requests_per_sec:.0f} req/sec, "
+                "p50 {p50_ms:.1f}ms, p99 {p99_ms:.1f}ms, {failures} failures".format(**result)
+            )
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from auctions.benchmarks.bulk import run_expiry_benchmark
+from auctions.benchmarks.common import temporary_database
+
+
+# Benchmark closing a large backlog of expired auctions
+class Command(BaseCommand):
+    help = "Measure time and peak memory of closing a backlog of expired listings."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--listings", type=int, default=100000)
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with temporary_database():
+            result = run_expiry_benchmark(options["listings"], options["batch_size"])
+
+        self.stdout.write(
+            "Closed {closed} of {listings} expired listings ({winners} winners) "
+            "in {seconds:.2f}s, peak {peak_mb:.1f} MB".format(**result)
+        )
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from auctions.benchmarks.bidding import run_fanout_benchmark
+
+
+# Benchmark live bid update fan-out to idle WebSocket clients
+class Command(BaseCommand):
+    help = "Measure bid broadcast latency with many idle WebSocket connections in one worker."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--connections", type=int, default=5000)
+        parser.add_argument("--messages", type=int, default=20)
+
+    def handle(self, *args, **options):
+        result = run_fanout_benchmark(options["connections"], options["messages"])
+        self.stdout.write(
+            "{deliveries} deliveries to {connections} connections in {seconds:.2f}s "
+            "({deliveries_per_sec:.0f}/sec), latency p50 {p50_ms:.1f}ms p99 {p99_ms:.1f}ms".format(**result)
+        )
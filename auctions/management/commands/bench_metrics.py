@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from auctions.benchmarks.common import temporary_database
+from auctions.benchmarks.reads import run_metrics_overhead
+
+
+# Benchmark the cost of the instrumentation middleware
+class Command(BaseCommand):
+    help = "Measure the latency the instrumentation middleware adds to the listing page."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=5000)
+        parser.add_argument("--sample-rate", type=float, help="Defaults to AUCTIONS_METRICS_SAMPLE_RATE.")
+
+    def handle(self, *args, **options):
+        with temporary_database():
+            result = run_metrics_overhead(options["requests"], options["sample_rate"])
+
+        self.stdout.write(
+            "Listing page p50 {plain_ms:.3f} ms without instrumentation, {instrumented_ms:.3f} ms with it "
+            "at sample rate {sample_rate}: {overhead:+.1%}".format(**result)
+        )
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from auctions.benchmarks.bidding import run_outbox_benchmark
+from auctions.benchmarks.common import temporary_database
+
+
+# Check that recording notifications doesn't slow bidding down
+class Command(BaseCommand):
+    help = "Compare place_bid latency with notifications off and on, and time dispatching them."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bids", type=int, default=2000)
+        parser.add_argument("--listings", type=int, default=20)
+
+    def handle(self, *args, **options):
+        with temporary_database():
+            results = run_outbox_benchmark(options["bids"], options["listings"])
+
+        for mode in ("off", "on"):
+            self.stdout.write("notifications {mode:>3}: p50 {p50_ms:.2f} ms, p99 {p99_ms:.2f} ms".format(
+                mode=mode, **results[mode]
+            ))
+        self.stdout.write("dispatched {events} events ({failed} failed) in {seconds:.2f}s".format(**results["dispatch"]))
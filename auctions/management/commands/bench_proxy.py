@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from auctions.benchmarks.bidding import run_proxy_benchmark
+from auctions.benchmarks.common import temporary_database
+
+
+# Compare bidding wars fought by hand with the same wars fought by proxy bids
+class Command(BaseCommand):
+    help = "Measure requests and stored bids for bidding wars with and without proxy bids."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--listings", type=int, default=20)
+        parser.add_argument("--bidders", type=int, default=10, help="Bidders per listing.")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        with temporary_database():
+            results = run_proxy_benchmark(options["listings"], options["bidders"], options["seed"])
+
+        for mode in ("by_hand", "proxy"):
+            self.stdout.write(
+                "{mode:>7}: {requests} requests, {bids} stored bids, {seconds:.2f}s".format(mode=mode, **results[mode])
+            )
+        if not results["same_winners"]:
+            self.stderr.write(self.style.ERROR("Proxy bidding picked different winners."))
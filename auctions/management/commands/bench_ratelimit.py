@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from auctions.benchmarks.bidding import run_ratelimit_benchmark
+
+
+# Check that the rate limiter stays cheap next to the request it guards
+class Command(BaseCommand):
+    help = "Measure the time one bid rate limit check takes with each backend."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--checks", type=int, default=200000)
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--listings", type=int, default=100)
+
+    def handle(self, *args, **options):
+        results = run_ratelimit_benchmark(options["checks"], options["users"], options["listings"])
+
+        for backend, result in results.items():
+            self.stdout.write("{backend:>5}: {us_per_check:.2f} us per check over {checks} checks".format(
+                backend=backend, **result
+            ))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from auctions.benchmarks.bulk import run_repair_benchmark
+from auctions.benchmarks.common import temporary_database
+
+
+# Benchmark rebuilding the denormalized bid statistics
+class Command(BaseCommand):
+    help = "Measure time and peak memory of repair_bid_stats over a synthetic Bid table."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bids", type=int, default=1000000)
+        parser.add_argument("--listings", type=int, default=10000)
+
+    def handle(self, *args, **options):
+        with temporary_database():
+            result = run_repair_benchmark(options["bids"], options["listings"])
+
+        self.stdout.write(
+            "Reconciled {bids} bids across {listings} listings ({corrected} corrected) "
+            "in {seconds:.2f}s, peak {peak_mb:.1f} MB".format(**result)
+        )
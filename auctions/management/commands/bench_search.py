@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from auctions.benchmarks.common import temporary_database
+from auctions.benchmarks.reads import run_search_benchmark
+
+
+# Benchmark full-text search against a LIKE scan
+class Command(BaseCommand):
+    help = "Measure search latency over a synthetic listing table, FTS index versus LIKE scan."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--listings", type=int, default=1000000)
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        with temporary_database():
+            results = run_search_benchmark(options["listings"], repeat=options["repeat"])
+
+        for result in results:
+            self.stdout.write(
+                "{query!r:16} {backend:5} p50 {p50_ms:8.2f} ms  p99 {p99_ms:8.2f} ms".format(**result)
+            )
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from auctions.benchmarks.common import temporary_database
+from auctions.benchmarks.reads import run_sqlite_concurrency
+
+
+# Compare concurrent reads and bids on SQLite with and without the tuning in
+# auctions.sqlite
+class Command(BaseCommand):
+    help = "Benchmark concurrent page reads and bids on SQLite with default and tuned pragmas."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--readers", type=int, default=8)
+        parser.add_argument("--writers", type=int, default=4)
+        parser.add_argument("--seconds", type=float, default=5.0)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("This benchmark needs the SQLite backend.")
+
+        results = []
+        for tuned in (False, True):
+            with temporary_database():
+                results.append(run_sqlite_concurrency(
+                    tuned,
+                    readers=options["readers"],
+                    writers=options["writers"],
+                    seconds=options["seconds"],
+                    seed=options["seed"],
+                ))
+
+        for result in results:
+            self.stdout.write(
+                "{mode:>7}: {reads_per_sec:.0f} reads/sec (p99 {read_p99_ms:.1f} ms), "
+                "{writes_per_sec:.0f} bids/sec, {read_errors} failed reads, "
+                "{write_errors} failed bids".format(**result)
+            )
+
+        default, tuned = results
+        self.stdout.write(
+            "Tuned: {:+.0%} reads/sec, {:+.0%} bids/sec".format(
+                tuned["reads_per_sec"] / default["reads_per_sec"] - 1 if default["reads_per_sec"] else 0,
+                tuned["writes_per_sec"] / default["writes_per_sec"] - 1 if default["writes_per_sec"] else 0,
+            )
+        )
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from auctions.benchmarks.bulk import run_transfer_benchmark
+from auctions.benchmarks.common import temporary_database
+from auctions.transfer import FORMATS
+
+
+# Benchmark exporting and re-importing a large Bid table
+class Command(BaseCommand):
+    help = "Measure time and peak memory of export_data and import_data over a synthetic Bid table."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bids", type=int, default=1000000)
+        parser.add_argument("--listings", type=int, default=10000)
+        parser.add_argument("--format", choices=FORMATS, default="jsonl")
+
+    def handle(self, *args, **options):
+        with temporary_database():
+            result = run_transfer_benchmark(options["bids"], options["listings"], fmt=options["format"])
+
+        self.stdout.write(f"{result['bids']} bids, {result['listings']} listings, {result['file_mb']:.1f} MB of files")
+        for step in ("export", "import"):
+            self.stdout.write("{step:>6}: {seconds:.2f}s, peak {peak_mb:.1f} MB".format(step=step, **result[step]))
+        self.stdout.write(f"Imported {result['imported_bids']} bids, {result['errors']} errors.")
@@ -0,0 +1,54 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from auctions.benchmarks.common import temporary_database
+from auctions.benchmarks.reads import SCALES, compare_to_baseline, generate_dataset, run_view_suite
+
+BASELINE_DIR = Path(__file__).resolve().parents[2] / "benchmark_baselines"
+
+
+# Benchmark the main views against a stored baseline
+class Command(BaseCommand):
+    help = (
+        "Generate a synthetic dataset, measure latency, queries and memory of the main views "
+        "and fail if they regressed against the stored baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scale", choices=SCALES, default="10k")
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--baseline", help="Baseline file, by default the stored one for the scale.")
+        parser.add_argument("--tolerance", type=float, default=0.5,
+                            help="Allowed growth of latency and memory, as a fraction of the baseline.")
+        parser.add_argument("--save-baseline", action="store_true",
+                            help="Store the results as the new baseline instead of comparing.")
+
+    def handle(self, *args, **options):
+        baseline_path = Path(options["baseline"] or BASELINE_DIR / f"{options['scale']}.json")
+
+        with temporary_database():
+            generate_dataset(SCALES[options["scale"]])
+            results = run_view_suite(options["requests"])
+
+        for view, result in results.items():
+            self.stdout.write(
+                "{view:15} p50 {p50_ms:7.2f} ms  p95 {p95_ms:7.2f} ms  p99 {p99_ms:7.2f} ms  "
+                "{queries:3} queries  peak {peak_kb:8.1f} KB".format(view=view, **result)
+            )
+
+        if options["save_baseline"]:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps(results, indent=2, sort_keys=True) + "\n")
+            self.stdout.write(f"Saved baseline to {baseline_path}")
+            return
+
+        if not baseline_path.exists():
+            raise CommandError(f"No baseline at {baseline_path}, run with --save-baseline first.")
+        regressions = compare_to_baseline(
+            results, json.loads(baseline_path.read_text()), options["tolerance"]
+        )
+        if regressions:
+            raise CommandError("Regressed against baseline:\n  " + "\n  ".join(regressions))
+        self.stdout.write("No regressions against baseline.")
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from auctions.benchmarks.bidding import run_bid_load
+from auctions.benchmarks.common import temporary_database
+
+
+# Compare the atomic bid engine against the old read-modify-write bid path.
+# Fails unless the atomic engine loses no bids and beats the old path both
+# on attempts resolved and on bids correctly accepted per second.
+class Command(BaseCommand):
+    help = "Load test concurrent bidding on a single hot listing."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=8)
+        parser.add_argument("--bids", type=int, default=200, help="Bids per worker.")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        results = []
+        for legacy in (True, False):
+            with temporary_database():
+                results.append(run_bid_load(
+                    workers=options["workers"],
+                    bids_per_worker=options["bids"],
+                    legacy=legacy,
+                    seed=options["seed"],
+                ))
+
+        for result in results:
+            self.stdout.write(
+                "{mode:>7}: {attempts} attempts in {seconds:.2f}s ({resolved_per_sec:.0f} resolved/sec), "
+                "{accepted} accepted, {correct} correctly ({correct_per_sec:.0f}/sec), "
+                "{stored_bids} stored, {lost_bids} lost, {errors} errors, final price ${final_price} "
+                "(top accepted ${top_accepted})".format(**result)
+            )
+
+        legacy, atomic = results
+        if atomic["lost_bids"] or not atomic["price_consistent"]:
+            raise CommandError("Atomic bid engine lost bids.")
+        slower = [
+            metric for metric in ("resolved_per_sec", "correct_per_sec") if atomic[metric] <= legacy[metric]
+        ]
+        if slower:
+            raise CommandError("Atomic bid engine was no faster on " + ", ".join(slower) + ".")
+        self.stdout.write(self.style.SUCCESS(
+            "No lost bids with the atomic bid engine, {:.1f}x the attempts resolved and {:.1f}x the bids "
+            "correctly accepted per second.".format(
+                atomic["resolved_per_sec"] / legacy["resolved_per_sec"],
+                atomic["correct_per_sec"] / legacy["correct_per_sec"],
+            )
+        ))
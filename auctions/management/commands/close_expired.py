@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from auctions.closing import CLOSE_BATCH_SIZE, close_expired
+
+
+# Close auctions whose end time has passed
+class Command(BaseCommand):
+    help = "Close every expired listing and record its winner, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=CLOSE_BATCH_SIZE)
+        parser.add_argument("--loop", action="store_true", help="Keep polling for expired listings.")
+        parser.add_argument("--interval", type=float, default=30, help="Seconds between polls with --loop.")
+
+    def handle(self, *args, **options):
+        while True:
+            closed = close_expired(batch_size=options["batch_size"])
+            if closed or options["verbosity"] > 1:
+                self.stdout.write(f"Closed {closed} expired listing{'s' if closed != 1 else ''}.")
+            if not options["loop"]:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,37 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from auctions.outbox import DISPATCH_BATCH_SIZE, dispatch_outbox, failed_events, purge_dispatched, purge_failed
+
+
+# Send the notifications waiting in the outbox
+class Command(BaseCommand):
+    help = "Send due outbid, won and closed notifications from the outbox, retrying failed ones later."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=DISPATCH_BATCH_SIZE)
+        parser.add_argument("--loop", action="store_true", help="Keep polling the outbox.")
+        parser.add_argument("--interval", type=float, default=5, help="Seconds between polls with --loop.")
+        parser.add_argument("--keep-days", type=int, default=7, help="Days to keep sent events before deleting them.")
+        parser.add_argument(
+            "--keep-failed-days", type=int, default=30,
+            help="Days to keep events that ran out of attempts before deleting them.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = dispatch_outbox(options["batch_size"])
+            now = timezone.now()
+            purged = purge_dispatched(now - timedelta(days=options["keep_days"]))
+            purged += purge_failed(now - timedelta(days=options["keep_failed_days"]))
+            if sent or failed or options["verbosity"] > 1:
+                self.stdout.write(f"Sent {sent} events, {failed} failed, {purged} old events deleted.")
+            given_up = failed_events().count()
+            if given_up:
+                self.stderr.write(f"{given_up} events ran out of attempts and won't be sent, see failed_events().")
+            if not options["loop"]:
+                return
+            time.sleep(options["interval"])
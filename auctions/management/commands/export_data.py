@@ -0,0 +1,28 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from auctions.transfer import EXPORT_CHUNK_SIZE, FORMATS, KINDS, export_records, filename
+
+
+# Write listings, bids, comments, watchlists and their archives to one file
+# each
+class Command(BaseCommand):
+    help = (
+        "Export listings, bids, comments and watchlists, and the archives of closed listings, "
+        "as JSON Lines or CSV files in a directory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory")
+        parser.add_argument("--format", choices=FORMATS, default="jsonl")
+        parser.add_argument("--kinds", nargs="+", choices=KINDS, default=KINDS)
+        parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        os.makedirs(options["directory"], exist_ok=True)
+        for kind in options["kinds"]:
+            path = os.path.join(options["directory"], filename(kind, options["format"]))
+            with open(path, "w", newline="", encoding="utf-8") as stream:
+                count = export_records(kind, stream, options["format"], options["chunk_size"])
+            self.stdout.write(f"Exported {count} {kind} to {path}.")
@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from auctions import images
+from auctions.models import Listing
+
+
+# Make thumbnails for new listings, listings whose thumbnails were evicted,
+# and listings created before thumbnails existed or imported in bulk. Image
+# fetching happens here rather than in views, run it with --loop next to
+# the web workers.
+class Command(BaseCommand):
+    help = "Fetch listing images and make their thumbnails, for listings that have none yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Fetch every listing's image again.")
+        parser.add_argument("--loop", action="store_true", help="Keep polling for listings without thumbnails.")
+        parser.add_argument("--interval", type=float, default=5, help="Seconds between polls with --loop.")
+
+    def handle(self, *args, **options):
+        if images.Image is None:
+            raise CommandError("Thumbnails need Pillow, which isn't installed.")
+
+        # Listings whose image couldn't be fetched aren't tried again in a loop
+        failed_ids = set()
+        fetch_all = options["all"]
+        while True:
+            listings = Listing.objects.exclude(image_url="").only("id", "image_url", "image_digest").order_by("id")
+            if not fetch_all:
+                listings = listings.filter(image_digest="")
+
+            made = failed = 0
+            for listing in listings.iterator():
+                if listing.id in failed_ids and not fetch_all:
+                    continue
+                if images.generate_thumbnails(listing):
+                    made += 1
+                else:
+                    failed += 1
+                    failed_ids.add(listing.id)
+            if made or failed or not options["loop"] or options["verbosity"] > 1:
+                self.stdout.write(f"Made thumbnails for {made} listings, {failed} failed.")
+            if not options["loop"]:
+                return
+            fetch_all = False
+            time.sleep(options["interval"])
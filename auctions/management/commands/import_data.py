@@ -0,0 +1,41 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from auctions.transfer import ARCHIVED_KINDS, FORMATS, IMPORT_BATCH_SIZE, KINDS, Importer, filename
+
+
+# Load files written by export_data. Listings are imported first, so the
+# other kinds can be pointed at their new ids. Exports made before archives
+# were exported have no archive files, which are then skipped.
+class Command(BaseCommand):
+    help = (
+        "Import listings, bids, comments and watchlists, and the archives of closed listings, "
+        "from JSON Lines or CSV files in a directory. "
+        "Users are matched by username and created without a usable password if missing."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory")
+        parser.add_argument("--format", choices=FORMATS, default="jsonl")
+        parser.add_argument("--kinds", nargs="+", choices=KINDS, default=KINDS)
+        parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+        parser.add_argument("--show-errors", type=int, default=10, help="Invalid records to list per file.")
+
+    def handle(self, *args, **options):
+        importer = Importer(options["batch_size"])
+        for kind in KINDS:
+            if kind not in options["kinds"]:
+                continue
+            path = os.path.join(options["directory"], filename(kind, options["format"]))
+            if not os.path.exists(path):
+                if kind in ARCHIVED_KINDS:
+                    self.stdout.write(f"No {path}, skipping {kind}.")
+                    continue
+                raise CommandError(f"{path} doesn't exist.")
+            with open(path, newline="", encoding="utf-8") as stream:
+                result = importer.run(kind, stream, options["format"])
+
+            self.stdout.write(f"Imported {result.imported} {kind} from {path}, skipped {len(result.errors)}.")
+            for line_number, message in result.errors[:options["show_errors"]]:
+                self.stderr.write(f"  line {line_number}: {message}")
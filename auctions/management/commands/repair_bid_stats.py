@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from auctions.bid_stats import REPAIR_BATCH_SIZE, repair_bid_stats
+
+
+# Rebuild the denormalized bid statistics on Listing
+class Command(BaseCommand):
+    help = "Recompute bid_count, unique_bidders and last_bid_at for every listing from the Bid table."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=REPAIR_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        checked, corrected = repair_bid_stats(options["batch_size"])
+        self.stdout.write(f"Checked {checked} listings, corrected {corrected}.")
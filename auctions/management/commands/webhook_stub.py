@@ -0,0 +1,41 @@
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+
+# A webhook receiver for trying notifications out locally. Run it, then
+# start dispatch_outbox with AUCTIONS_WEBHOOK_URL=http://127.0.0.1:8001/.
+class Command(BaseCommand):
+    help = "Print notification webhooks posted to a local port, dropping repeated idempotency keys."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--port", type=int, default=8001)
+
+    def handle(self, *args, **options):
+        seen = set()
+        stdout = self.stdout
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                key = self.headers.get("Idempotency-Key")
+                if key in seen:
+                    stdout.write(f"Duplicate {key}, ignored")
+                else:
+                    seen.add(key)
+                    stdout.write(json.dumps(json.loads(body), indent=2))
+                self.send_response(204)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", options["port"]), Handler)
+        self.stdout.write(f"Listening on http://127.0.0.1:{options['port']}/")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,205 @@
+import contextvars
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from itertools import accumulate
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import Http404, HttpResponse
+from django.template.backends.django import DjangoTemplates
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the request latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+# Database and template cost of one sampled request
+class RequestStats:
+    def __init__(self):
+        self.queries = []
+        self.db_time = 0.0
+        self.template_time = 0.0
+
+    def record_query(self, sql, params, duration):
+        self.queries.append((sql, params, duration))
+        self.db_time += duration
+
+    # Queries that repeated an earlier one with the same parameters, the
+    # usual sign of a lookup inside a loop
+    @property
+    def duplicates(self):
+        return len(self.queries) - len({(sql, params) for sql, params, _ in self.queries})
+
+
+# Stats of the request being handled, None when it isn't sampled. Context
+# variables follow the request into sync_to_async() threads, so this also
+# works for async views.
+_current = contextvars.ContextVar("auctions_request_stats", default=None)
+
+
+def start_request(sampled):
+    return _current.set(RequestStats() if sampled else None)
+
+
+def end_request(token):
+    stats = _current.get()
+    _current.reset(token)
+    return stats
+
+
+def _record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.record_query(sql, None if many else repr(params), time.perf_counter() - start)
+
+
+# Time queries on every connection. Unsampled requests only pay for one
+# context variable lookup per query.
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+# Render timing for templates loaded through the backend, which covers
+# render() and render_to_string(). Queries run while rendering count as
+# database time, not template time.
+class _TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        if stats is None:
+            return self.template.render(context, request)
+        start, db_time = time.perf_counter(), stats.db_time
+        try:
+            return self.template.render(context, request)
+        finally:
+            stats.template_time += time.perf_counter() - start - (stats.db_time - db_time)
+
+
+class InstrumentedTemplates(DjangoTemplates):
+    def from_string(self, template_code):
+        return _TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return _TimedTemplate(super().get_template(template_name))
+
+
+def _labels(**labels):
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels.items()
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+# Per-view counters for this process. Every request counts towards the
+# request total and latency histogram; database and template figures come
+# from sampled requests only.
+class Registry:
+    COUNTERS = [
+        ("sampled_requests_total", "Requests sampled for database and template timing."),
+        ("db_queries_total", "Database queries run by sampled requests."),
+        ("db_duplicate_queries_total", "Queries that repeated an earlier query of the same sampled request."),
+        ("db_query_seconds_total", "Time spent in database queries by sampled requests."),
+        ("template_render_seconds_total", "Time spent rendering templates by sampled requests."),
+        ("slow_queries_total", "Queries slower than AUCTIONS_METRICS_SLOW_QUERY_MS."),
+    ]
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = Counter()
+            self.latency_sum = Counter()
+            self.latency_buckets = defaultdict(lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+            self.counters = {name: Counter() for name, _ in self.COUNTERS}
+            self.rejected = Counter()
+
+    def observe(self, view, seconds, stats=None, slow_query_seconds=None):
+        slow = []
+        if stats is not None and slow_query_seconds is not None:
+            slow = [(sql, duration) for sql, _, duration in stats.queries if duration >= slow_query_seconds]
+
+        with self._lock:
+            self.requests[view] += 1
+            self.latency_sum[view] += seconds
+            # Counted in the first bucket that fits, accumulated in render()
+            self.latency_buckets[view][bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            if stats is not None:
+                self.counters["sampled_requests_total"][view] += 1
+                self.counters["db_queries_total"][view] += len(stats.queries)
+                self.counters["db_duplicate_queries_total"][view] += stats.duplicates
+                self.counters["db_query_seconds_total"][view] += stats.db_time
+                self.counters["template_render_seconds_total"][view] += stats.template_time
+                self.counters["slow_queries_total"][view] += len(slow)
+
+        for sql, duration in sorted(slow, key=lambda query: -query[1]):
+            logger.warning("Slow query in %s (%.1f ms): %s", view, duration * 1000, sql)
+
+    # A request turned away by the rate limit on an action, see
+    # auctions.ratelimit
+    def rate_limited(self, action, scope):
+        with self._lock:
+            self.rejected[action, scope] += 1
+
+    # Prometheus text exposition format
+    def render(self, prefix="auctions_"):
+        with self._lock:
+            lines = [
+                f"# HELP {prefix}requests_total Requests handled.",
+                f"# TYPE {prefix}requests_total counter",
+            ]
+            lines += [f"{prefix}requests_total{_labels(view=view)} {count}" for view, count in sorted(self.requests.items())]
+
+            name = f"{prefix}request_duration_seconds"
+            lines += [f"# HELP {name} Request wall time.", f"# TYPE {name} histogram"]
+            for view in sorted(self.requests):
+                for bound, count in zip(LATENCY_BUCKETS, accumulate(self.latency_buckets[view])):
+                    lines.append(f"{name}_bucket{_labels(view=view, le=bound)} {count}")
+                lines.append(f"{name}_bucket{_labels(view=view, le='+Inf')} {self.requests[view]}")
+                lines.append(f"{name}_sum{_labels(view=view)} {self.latency_sum[view]}")
+                lines.append(f"{name}_count{_labels(view=view)} {self.requests[view]}")
+
+            for counter, help_text in self.COUNTERS:
+                lines += [f"# HELP {prefix}{counter} {help_text}", f"# TYPE {prefix}{counter} counter"]
+                lines += [
+                    f"{prefix}{counter}{_labels(view=view)} {value}"
+                    for view, value in sorted(self.counters[counter].items())
+                ]
+
+            name = f"{prefix}rate_limited_total"
+            lines += [f"# HELP {name} Requests rejected by a rate limit.", f"# TYPE {name} counter"]
+            lines += [
+                f"{name}{_labels(action=action, scope=scope)} {count}"
+                for (action, scope), count in sorted(self.rejected.items())
+            ]
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+# Prometheus scrape endpoint. Only answers requests from the addresses in
+# AUCTIONS_METRICS_ALLOWED_IPS, everyone else gets a 404.
+def metrics_view(request):
+    if request.META.get("REMOTE_ADDR") not in settings.AUCTIONS_METRICS_ALLOWED_IPS:
+        raise Http404
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,97 @@
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from . import routers
+from .metrics import end_request, registry, start_request
+
+
+# Record wall time for every request and, for a sample of them, database
+# time, query and duplicate query counts and template render time, all per
+# view. See auctions.metrics for what is exported.
+#
+# Goes first in MIDDLEWARE so the timings include the rest of the stack.
+# Works under WSGI and ASGI without forcing async views onto a thread.
+class InstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = settings.AUCTIONS_METRICS_SAMPLE_RATE
+        slow_ms = settings.AUCTIONS_METRICS_SLOW_QUERY_MS
+        self.slow_query_seconds = slow_ms / 1000 if slow_ms is not None else None
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        start, token = self._start()
+        try:
+            return self.get_response(request)
+        finally:
+            self._finish(request, start, token)
+
+    async def __acall__(self, request):
+        start, token = self._start()
+        try:
+            return await self.get_response(request)
+        finally:
+            self._finish(request, start, token)
+
+    def _start(self):
+        sampled = self.sample_rate >= 1 or random.random() < self.sample_rate
+        return time.perf_counter(), start_request(sampled)
+
+    def _finish(self, request, start, token):
+        elapsed = time.perf_counter() - start
+        stats = end_request(token)
+        match = request.resolver_match
+        registry.observe(match.view_name if match else "unresolved", elapsed, stats, self.slow_query_seconds)
+
+
+# Track database routing for each request, see auctions.routers. After a
+# request that wrote to the auctions tables, a cookie keeps the user's reads
+# on the primary until the replica has had time to catch up.
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = routers.start_request(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            routing = routers.end_request(token)
+        return self._stick(routing, response)
+
+    async def __acall__(self, request):
+        token = routers.start_request(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            routing = routers.end_request(token)
+        return self._stick(routing, response)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        routers.use_replica(view_func, request)
+
+    def _stick(self, routing, response):
+        if routing.wrote and settings.AUCTIONS_REPLICA_DATABASE:
+            seconds = settings.AUCTIONS_REPLICA_STICKY_SECONDS
+            response.set_cookie(
+                routers.STICKY_COOKIE, str(time.time() + seconds), max_age=seconds, httponly=True, samesite="Lax"
+            )
+        return response
@@ -0,0 +1,77 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:13
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+# Titles must be unique before the unique index can be built; later
+# duplicates get their id appended
+def dedupe_titles(apps, schema_editor):
+    Listing = apps.get_model('auctions', 'Listing')
+    duplicates = (
+        Listing.objects.values('list_title')
+        .annotate(n=Count('id'), first=Min('id'))
+        .filter(n__gt=1)
+    )
+    for duplicate in duplicates:
+        clashes = Listing.objects.filter(list_title=duplicate['list_title']).exclude(id=duplicate['first'])
+        for listing in clashes:
+            suffix = f" ({listing.id})"
+            listing.list_title = listing.list_title[:100 - len(suffix)] + suffix
+            listing.save(update_fields=['list_title'])
+
+
+# Keep one watchlist row per (user, listing)
+def dedupe_watchlist(apps, schema_editor):
+    Watchlist = apps.get_model('auctions', 'Watchlist')
+    duplicates = (
+        Watchlist.objects.values('user_id', 'listing_id')
+        .annotate(n=Count('id'), first=Min('id'))
+        .filter(n__gt=1)
+    )
+    for duplicate in duplicates:
+        Watchlist.objects.filter(
+            user_id=duplicate['user_id'], listing_id=duplicate['listing_id']
+        ).exclude(id=duplicate['first']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_titles, migrations.RunPython.noop),
+        migrations.RunPython(dedupe_watchlist, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='listing',
+            name='category_id',
+            field=models.CharField(choices=[('Art', 'Art'), ('Business', 'Business'), ('Collectibles', 'Collectibles'), ('Electronics', 'Electronics'), ('Fashion', 'Fashion'), ('Garden', 'Garden'), ('Home', 'Home'), ('Industrial', 'Industrial'), ('Motors', 'Motors'), ('Outdoors', 'Outdoors'), ('Sports', 'Sports'), ('Toys', 'Toys'), ('None', 'None')], default='None', max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='listing',
+            name='list_title',
+            field=models.CharField(help_text='Enter a title using 100 characters or less.', max_length=100, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['listing_id', '-bid_amount'], name='bid_listing_amount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('active', True)), fields=['id'], name='listing_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('active', False)), fields=['id'], name='listing_closed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('active', True)), fields=['category_id', 'id'], name='listing_active_category_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='watchlist',
+            constraint=models.UniqueConstraint(fields=('user_id', 'listing_id'), name='unique_watchlist_entry'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:21
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0002_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Winner',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('closed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='ends_at',
+            field=models.DateTimeField(blank=True, help_text='Leave blank to close the auction by hand.', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('active', True)), fields=['ends_at'], name='listing_active_ends_at_idx'),
+        ),
+        migrations.AddField(
+            model_name='winner',
+            name='listing_id',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='winner', to='auctions.listing'),
+        ),
+        migrations.AddField(
+            model_name='winner',
+            name='user_id',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='wins', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:23
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max
+import django.db.models.deletion
+import django.utils.timezone
+
+
+# Fill in the new bid statistics for existing listings
+def fill_bid_stats(apps, schema_editor):
+    Bid = apps.get_model('auctions', 'Bid')
+    Listing = apps.get_model('auctions', 'Listing')
+    stats = (
+        Bid.objects.values('listing_id')
+        .annotate(n=Count('id'), bidders=Count('bidder_id', distinct=True), last=Max('created'))
+        .order_by()
+    )
+    for row in stats.iterator():
+        Listing.objects.filter(id=row['listing_id']).update(
+            bid_count=row['n'], unique_bidders=row['bidders'], last_bid_at=row['last']
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0003_listing_ends_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bid',
+            name='created',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='bid_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='last_bid_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='unique_bidders',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='bid',
+            name='bidder_id',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='bidder', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['bidder_id', 'listing_id'], name='bid_bidder_listing_idx'),
+        ),
+        migrations.RunPython(fill_bid_stats, migrations.RunPython.noop),
+    ]
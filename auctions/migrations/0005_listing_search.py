@@ -0,0 +1,66 @@
+from django.db import migrations
+
+
+# Full-text index over listing titles and descriptions, see auctions.search.
+# An external content FTS5 table kept in sync with auctions_listing by
+# triggers, on SQLite only; other databases search with a substring scan.
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE auctions_listing_fts USING fts5(
+        list_title, description, content='auctions_listing', content_rowid='id',
+        tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER auctions_listing_fts_insert AFTER INSERT ON auctions_listing BEGIN
+        INSERT INTO auctions_listing_fts(rowid, list_title, description)
+        VALUES (new.id, new.list_title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER auctions_listing_fts_delete AFTER DELETE ON auctions_listing BEGIN
+        INSERT INTO auctions_listing_fts(auctions_listing_fts, rowid, list_title, description)
+        VALUES ('delete', old.id, old.list_title, old.description);
+    END
+    """,
+    # Only text changes touch the index, not every bid
+    """
+    CREATE TRIGGER auctions_listing_fts_update AFTER UPDATE OF list_title, description ON auctions_listing BEGIN
+        INSERT INTO auctions_listing_fts(auctions_listing_fts, rowid, list_title, description)
+        VALUES ('delete', old.id, old.list_title, old.description);
+        INSERT INTO auctions_listing_fts(rowid, list_title, description)
+        VALUES (new.id, new.list_title, new.description);
+    END
+    """,
+    "INSERT INTO auctions_listing_fts(auctions_listing_fts) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    'DROP TRIGGER IF EXISTS auctions_listing_fts_insert',
+    'DROP TRIGGER IF EXISTS auctions_listing_fts_delete',
+    'DROP TRIGGER IF EXISTS auctions_listing_fts_update',
+    'DROP TABLE IF EXISTS auctions_listing_fts',
+]
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for sql in DROP_SQL + CREATE_SQL:
+            schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for sql in DROP_SQL:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0004_listing_bid_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 21:04
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0005_listing_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='created',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['listing_id', '-created', '-id'], name='comment_listing_created_idx'),
+        ),
+    ]
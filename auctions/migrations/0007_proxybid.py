@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-18 21:11
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0006_comment_created'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProxyBid',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('max_amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('bidder_id', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='proxy_bids', to=settings.AUTH_USER_MODEL)),
+                ('listing_id', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='listing_proxy', to='auctions.listing')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['listing_id', '-max_amount', 'created'], name='proxy_listing_max_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='proxybid',
+            constraint=models.UniqueConstraint(fields=('listing_id', 'bidder_id'), name='unique_proxy_bid'),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='proxy_max',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+    ]
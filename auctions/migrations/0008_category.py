@@ -0,0 +1,125 @@
+from django.db import migrations, models
+from django.db.models import F
+import django.db.models.deletion
+
+# The categories listings could be filed under before they had a table
+CATEGORIES = [
+    'Art', 'Business', 'Collectibles', 'Electronics', 'Fashion', 'Garden', 'Home',
+    'Industrial', 'Motors', 'Outdoors', 'Sports', 'Toys', 'None',
+]
+
+
+# Every category in use becomes a row, then listings point at it by name
+def create_categories(apps, schema_editor):
+    Category = apps.get_model('auctions', 'Category')
+    Listing = apps.get_model('auctions', 'Listing')
+    names = set(CATEGORIES) | set(Listing.objects.values_list('category_name', flat=True).distinct())
+    Category.objects.bulk_create([Category(name=name) for name in sorted(names)])
+
+
+def copy_categories(apps, schema_editor):
+    Listing = apps.get_model('auctions', 'Listing')
+    Listing.objects.update(category_id=F('category_name'))
+
+
+def copy_category_names(apps, schema_editor):
+    Listing = apps.get_model('auctions', 'Listing')
+    Listing.objects.update(category_name=F('category_id'))
+
+
+# Rebuilding the listing table on SQLite drops the full-text index triggers
+# from 0005, so they are created again and the index rebuilt
+SEARCH_TRIGGERS_SQL = [
+    'DROP TRIGGER IF EXISTS auctions_listing_fts_insert',
+    'DROP TRIGGER IF EXISTS auctions_listing_fts_delete',
+    'DROP TRIGGER IF EXISTS auctions_listing_fts_update',
+    """
+    CREATE TRIGGER auctions_listing_fts_insert AFTER INSERT ON auctions_listing BEGIN
+        INSERT INTO auctions_listing_fts(rowid, list_title, description)
+        VALUES (new.id, new.list_title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER auctions_listing_fts_delete AFTER DELETE ON auctions_listing BEGIN
+        INSERT INTO auctions_listing_fts(auctions_listing_fts, rowid, list_title, description)
+        VALUES ('delete', old.id, old.list_title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER auctions_listing_fts_update AFTER UPDATE OF list_title, description ON auctions_listing BEGIN
+        INSERT INTO auctions_listing_fts(auctions_listing_fts, rowid, list_title, description)
+        VALUES ('delete', old.id, old.list_title, old.description);
+        INSERT INTO auctions_listing_fts(rowid, list_title, description)
+        VALUES (new.id, new.list_title, new.description);
+    END
+    """,
+    "INSERT INTO auctions_listing_fts(auctions_listing_fts) VALUES ('rebuild')",
+]
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for sql in SEARCH_TRIGGERS_SQL:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0007_proxybid'),
+    ]
+
+    operations = [
+        # Runs last when migrating backwards
+        migrations.RunPython(migrations.RunPython.noop, create_search_index),
+        migrations.CreateModel(
+            name='Category',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+            ],
+            options={
+                'verbose_name_plural': 'categories',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='listing',
+            name='listing_active_category_idx',
+        ),
+        # Frees the category_id column name for the foreign key
+        migrations.RenameField(
+            model_name='listing',
+            old_name='category_id',
+            new_name='category_name',
+        ),
+        migrations.RunPython(create_categories, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='listing',
+            name='category',
+            field=models.ForeignKey(
+                null=True, on_delete=django.db.models.deletion.PROTECT, related_name='listings',
+                to='auctions.category', to_field='name',
+            ),
+        ),
+        migrations.RunPython(copy_categories, copy_category_names),
+        migrations.RemoveField(
+            model_name='listing',
+            name='category_name',
+        ),
+        migrations.AlterField(
+            model_name='listing',
+            name='category',
+            field=models.ForeignKey(
+                default='None', on_delete=django.db.models.deletion.PROTECT, related_name='listings',
+                to='auctions.category', to_field='name',
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(
+                condition=models.Q(('active', True)), fields=['category', 'id'], name='listing_active_category_idx',
+            ),
+        ),
+        migrations.RunPython(create_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,97 @@
+# Generated by Django 4.2.30 on 2026-10-18 21:28
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce, Now
+
+
+# Listings closed before closed_at existed: when the winner was recorded, or
+# failing that the last bid, or now
+def backfill_closed_at(apps, schema_editor):
+    Listing = apps.get_model('auctions', 'Listing')
+    Winner = apps.get_model('auctions', 'Winner')
+    won_at = Winner.objects.filter(listing_id=OuterRef('pk')).values('closed_at')[:1]
+    Listing.objects.filter(active=False).update(closed_at=Coalesce(Subquery(won_at), 'last_bid_at', Now()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0008_category'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedBid',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bid_amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('created', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedComment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('comment', models.CharField(max_length=500)),
+                ('created', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedWatchlist',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='archived_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='closed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_closed_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('active', False), ('archived_at__isnull', True)), fields=['closed_at'], name='listing_unarchived_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedwatchlist',
+            name='listing_id',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_watch', to='auctions.listing'),
+        ),
+        migrations.AddField(
+            model_name='archivedwatchlist',
+            name='user_id',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_watches', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='archivedcomment',
+            name='listing_id',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_comment', to='auctions.listing'),
+        ),
+        migrations.AddField(
+            model_name='archivedcomment',
+            name='user_id',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_comments', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='archivedbid',
+            name='bidder_id',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_bids', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='archivedbid',
+            name='listing_id',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_bid', to='auctions.listing'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedcomment',
+            index=models.Index(fields=['listing_id', '-created', '-id'], name='archived_comment_created_idx'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.30 on 2026-10-18 21:36
+
+from django.db import migrations, models
+
+
+# Rebuilding the listing table on SQLite drops the full-text index triggers
+# from 0005, so they are created again and the index rebuilt
+SEARCH_TRIGGERS_SQL = [
+    'DROP TRIGGER IF EXISTS auctions_listing_fts_insert',
+    'DROP TRIGGER IF EXISTS auctions_listing_fts_delete',
+    'DROP TRIGGER IF EXISTS auctions_listing_fts_update',
+    """
+    CREATE TRIGGER auctions_listing_fts_insert AFTER INSERT ON auctions_listing BEGIN
+        INSERT INTO auctions_listing_fts(rowid, list_title, description)
+        VALUES (new.id, new.list_title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER auctions_listing_fts_delete AFTER DELETE ON auctions_listing BEGIN
+        INSERT INTO auctions_listing_fts(auctions_listing_fts, rowid, list_title, description)
+        VALUES ('delete', old.id, old.list_title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER auctions_listing_fts_update AFTER UPDATE OF list_title, description ON auctions_listing BEGIN
+        INSERT INTO auctions_listing_fts(auctions_listing_fts, rowid, list_title, description)
+        VALUES ('delete', old.id, old.list_title, old.description);
+        INSERT INTO auctions_listing_fts(rowid, list_title, description)
+        VALUES (new.id, new.list_title, new.description);
+    END
+    """,
+    "INSERT INTO auctions_listing_fts(auctions_listing_fts) VALUES ('rebuild')",
+]
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for sql in SEARCH_TRIGGERS_SQL:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0009_archive'),
+    ]
+
+    operations = [
+        # Runs last when migrating backwards
+        migrations.RunPython(migrations.RunPython.noop, create_search_index),
+        migrations.AddField(
+            model_name='listing',
+            name='image_digest',
+            field=models.CharField(blank=True, default='', editable=False, max_length=16),
+        ),
+        migrations.RunPython(create_search_index, migrations.RunPython.noop),
+    ]
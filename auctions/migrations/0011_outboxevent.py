@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-18 21:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0010_listing_image_digest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('bid', 'Bid placed'), ('closed', 'Auction closed')], max_length=20)),
+                ('key', models.CharField(max_length=100, unique=True)),
+                ('payload', models.JSONField(default=dict)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('dispatched_at', models.DateTimeField(blank=True, null=True)),
+                ('failed_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('sent', models.JSONField(default=list)),
+                ('claimed_by', models.CharField(blank=True, max_length=32)),
+                ('listing_id', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='outbox_events', to='auctions.listing')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('dispatched_at__isnull', True), ('failed_at__isnull', True)), fields=['next_attempt_at', 'id'], name='outbox_pending_idx'), models.Index(condition=models.Q(('claimed_by', ''), _negated=True), fields=['claimed_by'], name='outbox_claimed_idx'), models.Index(condition=models.Q(('failed_at__isnull', False)), fields=['failed_at'], name='outbox_failed_idx')],
+            },
+        ),
+    ]
@@ -1,58 +1,173 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.text import slugify
 
 
 class User(AbstractUser):
     pass
 
-class Listing(models.Model):
-    CATEGORIES= [
-    ('Art', 'Art'),
-    ('Business', 'Business'),
-    ('Collectibles', 'Collectibles'),
-    ('Electronics', 'Electronics'),
-    ('Fashion', 'Fashion'), 
-    ('Garden', 'Garden'),
-    ('Home', 'Home'),
-    ('Industrial', 'Industrial'), 
-    ('Motors', 'Motors'),
-    ('Outdoors', 'Outdoors'),
-    ('Sports', 'Sports'),
-    ('Toys', 'Toys'), 
-    ('None', 'None')
-    ]
 
+# URL slug for a listing title. A title slugify() keeps nothing of still
+# gets one, listings are found by their id anyway.
+def title_slug(title):
+    return slugify(title) or "listing"
+
+
+# Listing categories. Listings refer to them by name, so category_id on a
+# listing is the name and filtering on it needs no join. Active listing
+# counts per category are cached, see auctions.categories.
+class Category(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+
+    class Meta:
+        ordering = ["name"]
+        verbose_name_plural = "categories"
+
+    def __str__(self):
+        return f"{self.name}"
+
+
+class Listing(models.Model):
     poster_id = models.ForeignKey(User, on_delete=models.CASCADE, related_name="poster")
-    list_title = models.CharField(max_length=100, help_text="Enter a title using 100 characters or less.")     
+    list_title = models.CharField(max_length=100, unique=True, help_text="Enter a title using 100 characters or less.")     
     description	= models.CharField(max_length=1000, help_text="Enter a description using 1000 characters or less.")    
     starting_bid = models.DecimalField(max_digits=10, decimal_places=2)	
     highest_bid = models.DecimalField(max_digits=10, decimal_places=2)	
     high_bidder = models.ForeignKey(User, on_delete=models.CASCADE, related_name="high_bidder")
-    category_id = models.CharField(
-        max_length=100,
-        choices=CATEGORIES,
+    category = models.ForeignKey(
+        Category,
+        to_field="name",
+        on_delete=models.PROTECT,
+        related_name="listings",
         default='None'
     )
     image_url = models.CharField(max_length=300, help_text="Enter the URL of an image, using 300 characters or less.")
+    # Hash of the image, naming its thumbnails, once they have been made
+    image_digest = models.CharField(max_length=16, blank=True, default="", editable=False)
     active = models.BooleanField() 
+    ends_at = models.DateTimeField(null=True, blank=True, help_text="Leave blank to close the auction by hand.")
+
+    # Bid activity, kept up to date by bidding.place_bid and repaired in bulk
+    # by the repair_bid_stats command
+    bid_count = models.PositiveIntegerField(default=0, editable=False)
+    unique_bidders = models.PositiveIntegerField(default=0, editable=False)
+    last_bid_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # The highest proxy bid maximum on the listing, kept by
+    # bidding.place_proxy_bid, so place_bid only looks at proxy bids when one
+    # of them could answer the bid
+    proxy_max = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, editable=False)
+
+    # When the listing was closed, and when its bids, comments and watchlist
+    # entries were moved to the archive tables by the archive_closed command
+    closed_at = models.DateTimeField(null=True, blank=True, editable=False)
+    archived_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        # Partial indexes, so the active/closed filters and the id ordering used
+        # for pagination are both served by the index
+        indexes = [
+            models.Index(fields=["id"], condition=models.Q(active=True), name="listing_active_idx"),
+            models.Index(fields=["id"], condition=models.Q(active=False), name="listing_closed_idx"),
+            models.Index(
+                fields=["category", "id"],
+                condition=models.Q(active=True),
+                name="listing_active_category_idx"
+            ),
+            models.Index(fields=["ends_at"], condition=models.Q(active=True), name="listing_active_ends_at_idx"),
+            # Closed listings still waiting to be archived, oldest first
+            models.Index(
+                fields=["closed_at"],
+                condition=models.Q(active=False, archived_at__isnull=True),
+                name="listing_unarchived_idx",
+            ),
+        ]
     
     def __str__(self):
         return f"{self.list_title}"
 
+    # Listings are looked up by id, the slug only makes the URL readable and
+    # follows the title if it is edited
+    @property
+    def slug(self):
+        return title_slug(self.list_title)
+
+    def get_absolute_url(self):
+        return reverse("listing", args=[self.id, self.slug])
+
+    # Our thumbnail of the image at one of AUCTIONS_THUMBNAIL_SIZES, or the
+    # image URL itself until there is one, see auctions.images
+    def image_src(self, size):
+        if not self.image_digest:
+            return self.image_url
+        return reverse("thumbnail", args=[self.id, size, self.image_digest])
+
+    @property
+    def summary_image(self):
+        return self.image_src("summary")
+
+    @property
+    def listing_image(self):
+        return self.image_src("listing")
+
+    @property
+    def archived(self):
+        return self.archived_at is not None
+
 
 class Bid(models.Model):
     listing_id = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="listing_bid")
-    bidder_id = models.ForeignKey(User, on_delete=models.CASCADE, related_name="bidder")
+    # Indexed with the listing below
+    bidder_id = models.ForeignKey(User, on_delete=models.CASCADE, related_name="bidder", db_index=False)
     bid_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    created = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["listing_id", "-bid_amount"], name="bid_listing_amount_idx"),
+            # Whether a bidder has bid on a listing before, which place_bid
+            # checks to count unique bidders
+            models.Index(fields=["bidder_id", "listing_id"], name="bid_bidder_listing_idx"),
+        ]
 
     def __str__(self):
         return f"${self.bid_amount}"
 
 
+# A bidder's hidden maximum on a listing. bidding.place_proxy_bid() and
+# place_bid() outbid other bidders on their behalf, one increment at a time,
+# up to this amount. Only the resulting visible bids are stored as Bids.
+class ProxyBid(models.Model):
+    listing_id = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="listing_proxy")
+    bidder_id = models.ForeignKey(User, on_delete=models.CASCADE, related_name="proxy_bids")
+    max_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    created = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["listing_id", "bidder_id"], name="unique_proxy_bid"),
+        ]
+        indexes = [
+            # The two highest maxima decide a listing's price
+            models.Index(fields=["listing_id", "-max_amount", "created"], name="proxy_listing_max_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.bidder_id} up to ${self.max_amount}"
+
+
 class Comment(models.Model):
     user_id = models.ForeignKey(User, on_delete=models.CASCADE, related_name="commenter")
     listing_id = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="listing_comment")
     comment = models.CharField(max_length=500, help_text="Enter a comment using 500 characters or less.")
+    created = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Newest-first comment pages for a listing
+            models.Index(fields=["listing_id", "-created", "-id"], name="comment_listing_created_idx"),
+        ]
 
     def __str__(self):
         return f"{self.comment}"    
@@ -61,5 +176,103 @@ class Watchlist(models.Model):
     user_id = models.ForeignKey(User, on_delete=models.CASCADE, related_name="watcher")     
     listing_id = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="listing_watch")
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user_id", "listing_id"], name="unique_watchlist_entry"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} is watching: {self.listing_id}"
+
+
+class Winner(models.Model):
+    listing_id = models.OneToOneField(Listing, on_delete=models.CASCADE, related_name="winner")
+    user_id = models.ForeignKey(User, on_delete=models.CASCADE, related_name="wins")
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    closed_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.user_id} won {self.listing_id} for ${self.amount}"
+
+
+# The archive tables. Bids, comments and watchlist entries of listings closed
+# for longer than AUCTIONS_ARCHIVE_AFTER_DAYS are moved here, keeping their
+# ids, so the tables open auctions use stay small. See auctions.archive.
+class ArchivedBid(models.Model):
+    listing_id = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="archived_bid")
+    bidder_id = models.ForeignKey(User, on_delete=models.CASCADE, related_name="archived_bids")
+    bid_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    created = models.DateTimeField()
+
+    def __str__(self):
+        return f"${self.bid_amount}"
+
+
+class ArchivedComment(models.Model):
+    user_id = models.ForeignKey(User, on_delete=models.CASCADE, related_name="archived_comments")
+    listing_id = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="archived_comment")
+    comment = models.CharField(max_length=500)
+    created = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["listing_id", "-created", "-id"], name="archived_comment_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.comment}"
+
+
+class ArchivedWatchlist(models.Model):
+    user_id = models.ForeignKey(User, on_delete=models.CASCADE, related_name="archived_watches")
+    listing_id = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="archived_watch")
+
+    def __str__(self):
+        return f"{self.user_id} watched: {self.listing_id}"
+
+
+# Notifications waiting to be sent. Events are written in the same
+# transaction as the bid or close they are about, so one exists exactly when
+# that write committed, and sent later by the dispatch_outbox command, see
+# auctions.outbox. The key makes each event unique and, with the recipient
+# and sink, names each delivery so retries can be told apart from new
+# notifications.
+class OutboxEvent(models.Model):
+    BID = "bid"
+    CLOSED = "closed"
+    KINDS = [(BID, "Bid placed"), (CLOSED, "Auction closed")]
+
+    kind = models.CharField(max_length=20, choices=KINDS)
+    key = models.CharField(max_length=100, unique=True)
+    # Not indexed, nothing looks events up by listing and every bid would pay
+    # to maintain it
+    listing_id = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="outbox_events", db_index=False)
+    payload = models.JSONField(default=dict)
+    created = models.DateTimeField(default=timezone.now)
+
+    # Delivery state, kept by the dispatcher
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+    # Set once the event runs out of attempts, it isn't tried again
+    failed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    # Keys of the deliveries that already succeeded
+    sent = models.JSONField(default=list)
+    # The dispatcher run that last claimed the event
+    claimed_by = models.CharField(max_length=32, blank=True)
+
+    class Meta:
+        indexes = [
+            # Events still to be sent, in the order they are due
+            models.Index(
+                fields=["next_attempt_at", "id"],
+                condition=models.Q(dispatched_at__isnull=True, failed_at__isnull=True),
+                name="outbox_pending_idx",
+            ),
+            models.Index(fields=["claimed_by"], condition=~models.Q(claimed_by=""), name="outbox_claimed_idx"),
+            models.Index(fields=["failed_at"], condition=models.Q(failed_at__isnull=False), name="outbox_failed_idx"),
+        ]
+
     def __str__(self):
-        return f"{self.user_id} is watching: {self.listing_id}"
\ No newline at end of file
+        return self.key
@@ -0,0 +1,248 @@
+import json
+import logging
+from datetime import timedelta
+from urllib.request import Request, urlopen
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Bid, OutboxEvent, Winner
+
+logger = logging.getLogger(__name__)
+
+# Outbid, won and closed notifications through a transactional outbox.
+#
+# Placing a bid or closing a listing only inserts an OutboxEvent row in the
+# same transaction, one small write, so notifications add no round trip to
+# anyone else and can't be lost or sent for a write that rolled back. A bid
+# event is recorded for the bid that holds the lead once proxy bids have
+# answered it. Who it displaced is worked out by the dispatcher rather than
+# read on the bid path: it's whoever held the lead before the first bid of
+# that transaction. A bid a proxy beats straight away tells nobody, nor does
+# a first bid or a leader raising their own bid.
+#
+# dispatch_outbox drains the events a batch at a time, oldest due first, and
+# hands each notification to every sink in AUCTIONS_NOTIFICATION_SINKS. A
+# batch is claimed first with one UPDATE that tags the due events with the
+# run and pushes them AUCTIONS_OUTBOX_CLAIM_SECONDS into the future, so
+# dispatchers running at once never pick the same event, and the events of
+# one that dies are picked up again later. An event with a failed delivery
+# is retried later with exponential backoff, and marked failed once it has
+# had AUCTIONS_OUTBOX_MAX_ATTEMPTS attempts. Failed events are kept for
+# failed_events() to report until purge_failed() deletes them.
+#
+# Each delivery has an idempotency key, "<event key>:<recipient id>:<sink>",
+# which is recorded once it succeeds, so a retry only repeats the deliveries
+# that failed, and webhook receivers get the key to drop duplicates in case
+# the dispatcher dies between sending and recording.
+
+DISPATCH_BATCH_SIZE = 100
+
+
+# Record events in the caller's transaction, if notifications are enabled.
+# bid holds the lead and first is the first bid stored in the transaction,
+# which is bid itself unless proxy bids answered it.
+def record_bid(bid, first):
+    if settings.AUCTIONS_NOTIFICATIONS:
+        OutboxEvent.objects.create(
+            kind=OutboxEvent.BID, key=f"bid:{bid.id}", listing_id_id=bid.listing_id_id,
+            payload={"bid": bid.id, "first": first.id},
+        )
+
+
+def record_closed(listing_ids):
+    if settings.AUCTIONS_NOTIFICATIONS:
+        OutboxEvent.objects.bulk_create(
+            [
+                OutboxEvent(kind=OutboxEvent.CLOSED, key=f"closed:{listing_id}", listing_id_id=listing_id)
+                for listing_id in listing_ids
+            ],
+            ignore_conflicts=True,
+        )
+
+
+class Notification:
+    def __init__(self, event, recipient, subject, body):
+        self.event = event
+        self.recipient = recipient
+        self.subject = subject
+        self.body = body
+
+    def as_dict(self):
+        listing = self.event.listing_id
+        return {
+            "event": self.event.kind,
+            "recipient": self.recipient.username,
+            "listing": listing.id,
+            "url": listing.get_absolute_url(),
+            "subject": self.subject,
+            "body": self.body,
+        }
+
+    def __repr__(self):
+        return f"<Notification to {self.recipient}: {self.subject}>"
+
+
+# The listing row was locked while the bids were stored, so the listing's
+# bids before the first one are exactly those placed before the transaction,
+# and the highest of them was the lead it displaced
+def _outbid(event):
+    bid = Bid.objects.filter(id=event.payload["bid"]).select_related("bidder_id").first()
+    if bid is None:
+        return []
+    outbid = (
+        Bid.objects.filter(listing_id=bid.listing_id_id, id__lt=event.payload["first"])
+        .select_related("bidder_id").order_by("-bid_amount", "-id").first()
+    )
+    if outbid is None or outbid.bidder_id_id == bid.bidder_id_id:
+        return []
+    listing = event.listing_id
+    return [Notification(
+        event, outbid.bidder_id, f"You've been outbid on {listing}",
+        f"{bid.bidder_id} bid ${bid.bid_amount} on {listing}, over your ${outbid.bid_amount}.",
+    )]
+
+
+def _closed(event):
+    listing = event.listing_id
+    winner = Winner.objects.filter(listing_id=listing).select_related("user_id").first()
+    if winner is None:
+        return [Notification(event, listing.poster_id, f"{listing} has closed", f"{listing} closed without any bids.")]
+    return [
+        Notification(
+            event, listing.poster_id, f"{listing} has sold",
+            f"{listing} closed and {winner.user_id} won it for ${winner.amount}.",
+        ),
+        Notification(event, winner.user_id, f"You won {listing}", f"You won {listing} for ${winner.amount}."),
+    ]
+
+
+# The notifications an event sends
+def notifications(event):
+    return {OutboxEvent.BID: _outbid, OutboxEvent.CLOSED: _closed}[event.kind](event)
+
+
+# Sinks take a notification and the delivery's idempotency key, and raise
+# if it couldn't be delivered
+class EmailSink:
+    name = "email"
+
+    def send(self, notification, key):
+        if not notification.recipient.email:
+            return
+        EmailMessage(
+            notification.subject, notification.body, to=[notification.recipient.email],
+            headers={"X-Idempotency-Key": key},
+        ).send()
+
+
+class WebhookSink:
+    name = "webhook"
+
+    def send(self, notification, key):
+        request = Request(
+            settings.AUCTIONS_WEBHOOK_URL,
+            data=json.dumps(dict(notification.as_dict(), key=key)).encode(),
+            headers={"Content-Type": "application/json", "Idempotency-Key": key},
+            method="POST",
+        )
+        # urlopen raises for responses other than 2xx
+        with urlopen(request, timeout=settings.AUCTIONS_WEBHOOK_TIMEOUT):
+            pass
+
+
+def get_sinks():
+    return [import_string(path)() for path in settings.AUCTIONS_NOTIFICATION_SINKS]
+
+
+def _dispatch(event, sinks, now):
+    try:
+        for notification in notifications(event):
+            for sink in sinks:
+                key = f"{event.key}:{notification.recipient.id}:{sink.name}"
+                if key in event.sent:
+                    continue
+                sink.send(notification, key)
+                event.sent.append(key)
+    except Exception as error:
+        event.attempts += 1
+        event.last_error = f"{type(error).__name__}: {error}"
+        if event.attempts >= settings.AUCTIONS_OUTBOX_MAX_ATTEMPTS:
+            event.failed_at = now
+            logger.error("Giving up on %s after %s attempts: %s", event.key, event.attempts, event.last_error)
+        else:
+            delay = settings.AUCTIONS_OUTBOX_RETRY_DELAY * 2 ** (event.attempts - 1)
+            event.next_attempt_at = now + timedelta(seconds=delay)
+            logger.warning("Delivery of %s failed (attempt %s): %s", event.key, event.attempts, event.last_error)
+    else:
+        event.dispatched_at = now
+    event.claimed_by = ""
+    event.save(update_fields=[
+        "attempts", "next_attempt_at", "dispatched_at", "failed_at", "last_error", "sent", "claimed_by",
+    ])
+    return event.dispatched_at is not None
+
+
+def _pending():
+    return OutboxEvent.objects.filter(dispatched_at__isnull=True, failed_at__isnull=True)
+
+
+# Claim up to batch_size due events for this run. The UPDATE checks again
+# that each event is due, so of two dispatchers racing for an event only
+# one changes it.
+def _claim(batch_size, now):
+    claim = uuid4().hex
+    due = _pending().filter(next_attempt_at__lte=now)
+    ids = due.order_by("next_attempt_at", "id").values("id")[:batch_size]
+    claimed = due.filter(id__in=ids).update(
+        claimed_by=claim, next_attempt_at=now + timedelta(seconds=settings.AUCTIONS_OUTBOX_CLAIM_SECONDS)
+    )
+    if not claimed:
+        return []
+    return list(
+        OutboxEvent.objects.filter(claimed_by=claim).select_related("listing_id__poster_id").order_by("id")
+    )
+
+
+# Send one batch of due events. Returns (events sent, events that failed
+# and will be retried or have run out of attempts).
+def dispatch_batch(batch_size=DISPATCH_BATCH_SIZE, now=None, sinks=None):
+    now = now or timezone.now()
+    sinks = get_sinks() if sinks is None else sinks
+    events = _claim(batch_size, now)
+    sent = sum(_dispatch(event, sinks, now) for event in events)
+    return sent, len(events) - sent
+
+
+# Try every due event once, batch by batch. Failed events are due again
+# later, so they aren't picked up twice in one run.
+def dispatch_outbox(batch_size=DISPATCH_BATCH_SIZE, now=None):
+    now = now or timezone.now()
+    sinks = get_sinks()
+    total_sent = total_failed = 0
+    while True:
+        sent, failed = dispatch_batch(batch_size, now, sinks)
+        total_sent += sent
+        total_failed += failed
+        if not sent and not failed:
+            return total_sent, total_failed
+
+
+# Events that ran out of attempts, most recent first
+def failed_events():
+    return OutboxEvent.objects.filter(failed_at__isnull=False).order_by("-failed_at")
+
+
+# Delete events sent before a time, so the outbox stays small
+def purge_dispatched(before):
+    deleted, _ = OutboxEvent.objects.filter(dispatched_at__lt=before).delete()
+    return deleted
+
+
+# Delete events that ran out of attempts before a time
+def purge_failed(before):
+    deleted, _ = OutboxEvent.objects.filter(failed_at__lt=before).delete()
+    return deleted
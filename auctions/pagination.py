@@ -0,0 +1,101 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+PAGE_SIZE = 25
+
+NEXT = "n"
+PREV = "p"
+
+
+# Cursors are opaque to clients but stable: the same row always produces the
+# same token, so pages can be bookmarked and cached
+def encode_cursor(direction, key):
+    token = f"{direction}:{key}".encode()
+    return urlsafe_b64encode(token).decode().rstrip("=")
+
+
+# Returns (direction, key), or (None, None) for a missing or malformed cursor
+def decode_cursor(token):
+    if not token:
+        return None, None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        direction, key = urlsafe_b64decode(padded.encode()).decode().split(":", 1)
+        if direction not in (NEXT, PREV):
+            return None, None
+        return direction, int(key)
+    except (ValueError, UnicodeDecodeError):
+        return None, None
+
+
+# One page of a keyset paginated queryset
+class KeysetPage:
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        return self.items[index]
+
+
+def _page_query(queryset, cursor, page_size, key):
+    direction, value = decode_cursor(cursor)
+    if direction == PREV:
+        queryset = queryset.filter(**{f"{key}__lt": value}).order_by(f"-{key}")
+    else:
+        if direction == NEXT:
+            queryset = queryset.filter(**{f"{key}__gt": value})
+        queryset = queryset.order_by(key)
+    # One extra row tells us whether there is another page
+    return direction, queryset[:page_size + 1]
+
+
+def _build_page(rows, direction, page_size, key):
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if direction == PREV:
+        rows.reverse()
+    if not rows:
+        return KeysetPage(rows)
+
+    first, last = getattr(rows[0], key), getattr(rows[-1], key)
+    if direction == PREV:
+        return KeysetPage(
+            rows,
+            next_cursor=encode_cursor(NEXT, last),
+            prev_cursor=encode_cursor(PREV, first) if has_more else None,
+        )
+    return KeysetPage(
+        rows,
+        next_cursor=encode_cursor(NEXT, last) if has_more else None,
+        prev_cursor=encode_cursor(PREV, first) if direction == NEXT else None,
+    )
+
+
+# Page through a queryset in ascending order of a unique integer key.
+#
+# Each page is a single indexed range query (key > cursor LIMIT n + 1), so
+# fetching page 1000 costs the same as fetching page 1, unlike OFFSET.
+def paginate(queryset, cursor=None, page_size=PAGE_SIZE, key="id"):
+    direction, query = _page_query(queryset, cursor, page_size, key)
+    return _build_page(list(query), direction, page_size, key)
+
+
+# paginate() for async views
+async def apaginate(queryset, cursor=None, page_size=PAGE_SIZE, key="id"):
+    direction, query = _page_query(queryset, cursor, page_size, key)
+    return _build_page([row async for row in query], direction, page_size, key)
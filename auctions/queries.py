@@ -0,0 +1,11 @@
+from .models import Listing
+
+
+# Listings with everything the summary templates show (poster name, current
+# price and bid activity, and the winner of a closed listing) fetched in a
+# single query
+def listing_summaries(**filters):
+    listings = Listing.objects.filter(**filters).select_related("poster_id")
+    if filters.get("active") is not True:
+        listings = listings.select_related("winner__user_id")
+    return listings.order_by("id")
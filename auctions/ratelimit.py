@@ -0,0 +1,158 @@
+import math
+import threading
+import time
+from functools import lru_cache, wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.test.signals import setting_changed
+from django.utils.module_loading import import_string
+
+from .metrics import registry
+
+# Token bucket rate limits on bids and comments, per user and per listing.
+#
+# Each (action, scope) in AUCTIONS_RATE_LIMITS has a rate in requests per
+# second and a burst size. A bucket holds up to burst tokens, refills at the
+# rate and each request takes one from each of its buckets, so a client can
+# send burst requests at once and then keeps to the rate. A request that is
+# turned away takes nothing, so one client hammering a listing empties its
+# own bucket and not the listing's, and everyone else can still bid on it.
+#
+# Rejected requests get a 429 with Retry-After, the seconds until a token is
+# back, and count towards auctions_rate_limited_total in /metrics.
+#
+# Buckets live in AUCTIONS_RATE_LIMIT_BACKEND. LocalBackend keeps them in a
+# dict in this process, which is exact and costs a few microseconds per
+# check, but each worker process counts separately. CacheBackend keeps them
+# in the default cache, so workers sharing a cache share the limits. Its
+# read and write aren't atomic, two workers taking the last token at the
+# same moment can both get it, so it may let a request or two past the
+# limit under contention but never rejects more than it should.
+
+
+# A bucket is stored as the time it will be full again, which is all a token
+# bucket needs: at now it holds (burst - (full_at - now) * rate) tokens, and
+# taking a token pushes full_at on by 1 / rate. Buckets are passed around
+# as (key, 1 / rate, burst / rate), so a check doesn't divide.
+#
+# Takes a token from each bucket, whose full_at times are stored. Returns
+# the new times, or None and (key, seconds until it has a token) for the
+# first empty bucket, in which case nothing is taken.
+def _take(buckets, stored, now):
+    taken = []
+    for (key, interval, window), full_at in zip(buckets, stored):
+        if full_at is None or full_at < now:
+            full_at = now
+        full_at += interval
+        wait = full_at - now - window
+        # Allowing for rounding in the sum of intervals over a burst
+        if wait > 1e-9:
+            return None, (key, wait)
+        taken.append(full_at)
+    return taken, None
+
+
+# Backends take a list of buckets and return None if each had a token, or
+# the first empty bucket's (key, wait)
+class LocalBackend:
+    # Full buckets are dropped once there are this many, so the dict stays
+    # bounded by the clients active in the last few seconds
+    MAX_BUCKETS = 10000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def take(self, buckets):
+        now = time.monotonic()
+        with self._lock:
+            taken, rejected = _take(buckets, [self._buckets.get(bucket[0]) for bucket in buckets], now)
+            if taken:
+                for bucket, full_at in zip(buckets, taken):
+                    self._buckets[bucket[0]] = full_at
+                if len(self._buckets) > self.MAX_BUCKETS:
+                    self._buckets = {key: full_at for key, full_at in self._buckets.items() if full_at > now}
+        return rejected
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+# One get_many and one set_many per check
+class CacheBackend:
+    def take(self, buckets):
+        keys = ["ratelimit:{}:{}:{}".format(*key) for key, _, _ in buckets]
+        # Wall clock time, as the other workers have their own monotonic clocks
+        now = time.time()
+        stored = cache.get_many(keys)
+        taken, rejected = _take(buckets, [stored.get(key) for key in keys], now)
+        if taken:
+            # Kept until the buckets are full, when they are the same as none
+            cache.set_many(dict(zip(keys, taken)), math.ceil(max(taken) - now))
+        return rejected
+
+    def reset(self):
+        pass
+
+
+# The backend and each action's [(scope, 1 / rate, burst / rate)], or None
+# when rate limiting is off. Settings are read once, as reading them costs
+# more than a check, and again when tests change them.
+@lru_cache(maxsize=None)
+def get_limiter():
+    if not settings.AUCTIONS_RATE_LIMITING:
+        return None
+    limits = {
+        action: [(scope, 1 / rate, burst / rate) for scope, (rate, burst) in scopes.items()]
+        for action, scopes in settings.AUCTIONS_RATE_LIMITS.items()
+    }
+    return import_string(settings.AUCTIONS_RATE_LIMIT_BACKEND)(), limits
+
+
+@receiver(setting_changed)
+def _reset_limiter(setting, **kwargs):
+    if setting.startswith("AUCTIONS_RATE_LIMIT"):
+        get_limiter.cache_clear()
+
+
+# Seconds until the user may repeat the action on the listing, 0 if they
+# may now, in which case a token is taken from each of its buckets
+def check(action, user_id, listing_id):
+    limiter = get_limiter()
+    if limiter is None:
+        return 0
+    backend, limits = limiter
+    rejected = backend.take([
+        ((action, scope, user_id if scope == "user" else listing_id), interval, window)
+        for scope, interval, window in limits[action]
+    ])
+    if rejected is None:
+        return 0
+    (_, scope, _), wait = rejected
+    registry.rate_limited(action, scope)
+    return wait
+
+
+def too_many_requests(wait):
+    response = HttpResponse("Too many requests, please slow down.", status=429, content_type="text/plain")
+    response["Retry-After"] = str(math.ceil(wait))
+    return response
+
+
+# Limit POSTs to a view taking a listing_id. Anonymous requests pass through
+# to the view, which turns them away.
+def rate_limited(action, respond=too_many_requests):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, listing_id, *args, **kwargs):
+            if request.method == "POST" and request.user.is_authenticated:
+                wait = check(action, request.user.id, listing_id)
+                if wait:
+                    return respond(wait)
+            return view(request, listing_id, *args, **kwargs)
+        return wrapper
+    return decorator
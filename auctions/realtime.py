@@ -0,0 +1,144 @@
+import asyncio
+import json
+import re
+import threading
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+LISTING_PATH = re.compile(r"^/ws/listing/(?P<listing_id>\d+)/?$")
+
+# Messages a slow client may have queued before older ones are dropped. Only
+# the latest price matters, so dropping is harmless.
+SUBSCRIPTION_BACKLOG = 16
+
+
+def listing_channel(listing_id):
+    return f"listing:{listing_id}"
+
+
+# A single client's stream of messages from one channel, owned by the event
+# loop that created it
+class Subscription:
+    def __init__(self, channel, loop):
+        self.channel = channel
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=SUBSCRIPTION_BACKLOG)
+
+    def deliver(self, message):
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+# Publish/subscribe within a single process.
+#
+# Brokers only need subscribe(), unsubscribe() and publish(), so this can be
+# replaced by one backed by an external message broker through the
+# AUCTIONS_BROKER setting. publish() may be called from any thread.
+class InProcessBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = defaultdict(lambda: defaultdict(set))
+
+    # Must be called from inside the event loop that will read the subscription
+    def subscribe(self, channel):
+        subscription = Subscription(channel, asyncio.get_running_loop())
+        with self._lock:
+            self._channels[channel][subscription.loop].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            loops = self._channels.get(subscription.channel)
+            if loops is None:
+                return
+            subscribers = loops.get(subscription.loop)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del loops[subscription.loop]
+            if not loops:
+                del self._channels[subscription.channel]
+
+    # Fan a message out to every subscriber of a channel. Each event loop is
+    # woken once per message, however many of its clients are subscribed.
+    def publish(self, channel, message):
+        with self._lock:
+            loops = [
+                (loop, tuple(subscribers))
+                for loop, subscribers in self._channels.get(channel, {}).items()
+            ]
+        for loop, subscribers in loops:
+            try:
+                loop.call_soon_threadsafe(_deliver_all, subscribers, message)
+            except RuntimeError:
+                # The loop has been closed
+                pass
+
+    def subscriber_count(self, channel):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._channels.get(channel, {}).values())
+
+
+def _deliver_all(subscribers, message):
+    for subscription in subscribers:
+        subscription.deliver(message)
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(settings.AUCTIONS_BROKER)()
+
+
+# Tell everyone watching a listing about its new price
+def publish_bid(listing_id, amount, high_bidder):
+    get_broker().publish(listing_channel(listing_id), {
+        "listing": listing_id,
+        "highest_bid": str(amount),
+        "high_bidder": high_bidder,
+    })
+
+
+async def _wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message["type"] == "websocket.disconnect":
+            return
+
+
+# ASGI application for /ws/listing/<id>, pushing every accepted bid on the
+# listing to the client as JSON. Clients never need to send anything.
+async def websocket_application(scope, receive, send):
+    message = await receive()
+    if message["type"] != "websocket.connect":
+        return
+
+    match = LISTING_PATH.match(scope["path"])
+    if match is None:
+        await send({"type": "websocket.close", "code": 4404})
+        return
+
+    await send({"type": "websocket.accept"})
+
+    broker = get_broker()
+    subscription = broker.subscribe(listing_channel(match["listing_id"]))
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+    try:
+        while True:
+            update = asyncio.ensure_future(subscription.get())
+            done, _ = await asyncio.wait({disconnected, update}, return_when=asyncio.FIRST_COMPLETED)
+            if update in done:
+                await send({"type": "websocket.send", "text": json.dumps(update.result())})
+            else:
+                update.cancel()
+            if disconnected in done:
+                break
+    finally:
+        broker.unsubscribe(subscription)
+        disconnected.cancel()
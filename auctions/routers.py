@@ -0,0 +1,103 @@
+import contextvars
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# Read replica routing.
+#
+# Views marked with @replica_reads send their queries to the replica alias
+# (AUCTIONS_REPLICA_DATABASE) when serving GET and HEAD requests. Everything
+# else, and every write, goes to the primary.
+#
+# Replicas lag behind the primary, so a user who has just written something
+# (a bid, a comment, a new listing) would not see it if their next page came
+# from the replica. Any write to the auctions tables pins the rest of the
+# request, and the user's requests for the next AUCTIONS_REPLICA_STICKY_SECONDS
+# (through a cookie), to the primary.
+#
+# Cache misses are loaded wherever the request reads from. A lagging replica
+# could return rows older than the listing version they get cached under, so
+# anything loaded from the replica is only cached for the sticky window, see
+# cache_timeout().
+
+PRIMARY = DEFAULT_DB_ALIAS
+
+STICKY_COOKIE = "auctions_primary_until"
+
+
+class _RequestRouting:
+    def __init__(self, pinned):
+        self.pinned = pinned
+        self.replica = False
+        self.wrote = False
+
+
+# Routing state of the current request, None outside of requests
+_current = contextvars.ContextVar("auctions_request_routing", default=None)
+
+
+# Mark a view as only reading, so its GET requests can be served from the
+# replica
+def replica_reads(view):
+    view.replica_reads = True
+    return view
+
+
+def _reads_replica():
+    routing = _current.get()
+    return bool(routing and routing.replica and not routing.wrote and settings.AUCTIONS_REPLICA_DATABASE)
+
+
+# How long to cache what the current request read from the database. Data
+# read from the replica is kept no longer than the sticky window, which is
+# set to outlast the replica's lag.
+def cache_timeout(timeout):
+    if _reads_replica():
+        return min(timeout, settings.AUCTIONS_REPLICA_STICKY_SECONDS)
+    return timeout
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _reads_replica():
+            return settings.AUCTIONS_REPLICA_DATABASE
+        return PRIMARY
+
+    def db_for_write(self, model, **hints):
+        routing = _current.get()
+        # Session and other framework writes don't affect what a user sees
+        if routing and model._meta.app_label == "auctions":
+            routing.wrote = True
+        return PRIMARY
+
+    # Replicas hold the same data, so objects can be related across aliases
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
+
+
+def _pinned(request):
+    try:
+        return float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def start_request(request):
+    return _current.set(_RequestRouting(_pinned(request)))
+
+
+def use_replica(view_func, request):
+    routing = _current.get()
+    if routing and not routing.pinned and request.method in ("GET", "HEAD"):
+        routing.replica = getattr(view_func, "replica_reads", False)
+
+
+# Returns the request's routing state and clears it
+def end_request(token):
+    routing = _current.get()
+    _current.reset(token)
+    return routing
@@ -0,0 +1,122 @@
+import json
+import re
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.db import connection
+from django.db.models import Q
+
+from .pagination import PAGE_SIZE, KeysetPage, paginate
+from .queries import listing_summaries
+
+# Full-text search over listing titles and descriptions.
+#
+# On SQLite the index is an external content FTS5 table kept in sync with
+# auctions_listing by triggers, so it stores only the index and can't drift
+# from the listings. Words are stemmed, so "gundams" finds "Gundam".
+#
+# Results are ranked in tiers: listings with every search word in the title
+# first, then listings that need the description to match, newest first
+# within each tier. Unlike BM25, which scores every match and so slows down
+# with the number of matches, each tier is read straight off the index in
+# rowid order and a page costs about the same however common the words are.
+#
+# Other databases fall back to a substring scan. The index table and its
+# triggers are created by migrations: 0005, and again by any migration that
+# rebuilds auctions_listing on SQLite, since that drops the triggers.
+
+FTS_TABLE = "auctions_listing_fts"
+
+
+def uses_fts(connection=connection):
+    return connection.vendor == "sqlite"
+
+
+def _terms(query):
+    return re.findall(r"\w+", query or "")
+
+
+# FTS5 queries for each ranking tier. Every word must match; words are
+# quoted so FTS5 syntax typed into the search box is treated as text.
+def _tier_queries(terms):
+    words = " ".join('"{}"'.format(term.replace('"', '""')) for term in terms)
+    title = f"{{list_title}} : ({words})"
+    return [title, f"({words}) NOT {title}"]
+
+
+def _encode_cursor(tier, listing_id):
+    return urlsafe_b64encode(json.dumps([tier, listing_id]).encode()).decode().rstrip("=")
+
+
+# Returns (tier, listing id), or None for a malformed cursor
+def _decode_cursor(token):
+    try:
+        tier, listing_id = json.loads(urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        return int(tier), int(listing_id)
+    except (ValueError, TypeError, UnicodeDecodeError):
+        return None
+
+
+# Ids of listings matching one tier, newest first, below an optional id
+def _matching_ids(match, category, active, before, limit):
+    filters, params = [], [match]
+    if before is not None:
+        filters.append(f"AND {FTS_TABLE}.rowid < %s")
+        params.append(before)
+    if active is not None:
+        filters.append("AND listing.active = %s")
+        params.append(active)
+    if category:
+        filters.append("AND listing.category_id = %s")
+        params.append(category)
+
+    sql = f"""
+        SELECT listing.id FROM {FTS_TABLE}
+        JOIN auctions_listing AS listing ON listing.id = {FTS_TABLE}.rowid
+        WHERE {FTS_TABLE} MATCH %s {" ".join(filters)}
+        ORDER BY {FTS_TABLE}.rowid DESC
+        LIMIT %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + [limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+# Search listings, best matches first, a page at a time.
+#
+# active=None searches open and closed listings. The cursor comes from the
+# previous page's next_cursor.
+def search_listings(query, category=None, active=True, cursor=None, page_size=PAGE_SIZE):
+    terms = _terms(query)
+    if not terms:
+        return KeysetPage([])
+
+    if not uses_fts():
+        return _scan(terms, category, active, cursor, page_size)
+
+    tier, before = (cursor and _decode_cursor(cursor)) or (0, None)
+    tiers = _tier_queries(terms)
+    # One row more than a page, to tell whether there is a next page
+    ranked = []
+    while tier < len(tiers) and len(ranked) <= page_size:
+        ids = _matching_ids(tiers[tier], category, active, before, page_size + 1 - len(ranked))
+        ranked += [(tier, listing_id) for listing_id in ids]
+        tier, before = tier + 1, None
+
+    has_next = len(ranked) > page_size
+    ranked = ranked[:page_size]
+    listings = listing_summaries().in_bulk([listing_id for _, listing_id in ranked])
+    items = [listings[listing_id] for _, listing_id in ranked if listing_id in listings]
+    return KeysetPage(items, next_cursor=_encode_cursor(*ranked[-1]) if has_next else None)
+
+
+# Substring search for databases without the FTS index, in id order
+def _scan(terms, category, active, cursor, page_size):
+    filters = {}
+    if active is not None:
+        filters["active"] = active
+    if category:
+        filters["category_id"] = category
+    listings = listing_summaries(**filters)
+    for term in terms:
+        listings = listings.filter(Q(list_title__icontains=term) | Q(description__icontains=term))
+    return paginate(listings, cursor, page_size)
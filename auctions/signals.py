@@ -0,0 +1,37 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import bump_listing_version, bump_listing_versions
+from .categories import invalidate_category_counts
+from .models import Bid, Comment, Category, Listing
+
+
+# Move the listing to a new cache version once the write is committed, so
+# readers can't cache data from a transaction that is later rolled back
+def invalidate_listing(listing_id):
+    transaction.on_commit(lambda: bump_listing_version(listing_id))
+
+
+# invalidate_listing() for bulk writes, which don't send model signals
+def invalidate_listings(listing_ids):
+    listing_ids = list(listing_ids)
+    transaction.on_commit(lambda: bump_listing_versions(listing_ids))
+    invalidate_category_counts()
+
+
+@receiver([post_save, post_delete], sender=Listing)
+def listing_changed(sender, instance, **kwargs):
+    invalidate_listing(instance.pk)
+    invalidate_category_counts()
+
+
+@receiver([post_save, post_delete], sender=Category)
+def category_changed(sender, instance, **kwargs):
+    invalidate_category_counts()
+
+
+@receiver([post_save, post_delete], sender=Bid)
+@receiver([post_save, post_delete], sender=Comment)
+def listing_activity(sender, instance, **kwargs):
+    invalidate_listing(instance.listing_id_id)
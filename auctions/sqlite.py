@@ -0,0 +1,66 @@
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import OperationalError
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+# Tuning for single-node deployments on SQLite, enabled with
+# AUCTIONS_SQLITE_TUNING.
+#
+# With the default rollback journal a bid write locks the whole file, so
+# every reader of the index and listing pages waits for it, and a burst of
+# bids ends in "database is locked". Each new connection is switched to the
+# pragmas in AUCTIONS_SQLITE_PRAGMAS, WAL mode in particular, where readers
+# never wait for the writer and only writers queue up behind each other.
+#
+# Writers still contend, so transactions take the write lock up front with
+# BEGIN IMMEDIATE and wait for it in busy_timeout. A deferred transaction
+# that reads first and writes later can't wait: SQLite fails it straight
+# away rather than deadlock with another reader trying to write. Statements
+# outside a transaction that still find the database locked are retried
+# with exponential backoff, up to AUCTIONS_SQLITE_LOCK_RETRIES times.
+# Statements inside a transaction are not, the transaction has to be retried
+# as a whole.
+
+
+def _locked(error):
+    return "database is locked" in str(error) or "database table is locked" in str(error)
+
+
+def _retry_locked(execute, sql, params, many, context):
+    connection = context["connection"]
+    if sql == "BEGIN":
+        sql = "BEGIN IMMEDIATE"
+    elif connection.in_atomic_block:
+        return execute(sql, params, many, context)
+
+    retries = settings.AUCTIONS_SQLITE_LOCK_RETRIES
+    for attempt in range(retries + 1):
+        try:
+            return execute(sql, params, many, context)
+        except OperationalError as error:
+            if attempt == retries or not _locked(error):
+                raise
+            # Jittered so that writers that collided don't collide again
+            delay = settings.AUCTIONS_SQLITE_LOCK_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5)
+            logger.info("Database locked, retrying in %.0f ms: %s", delay * 1000, sql)
+            time.sleep(delay)
+
+
+def tune_connection(connection):
+    with connection.cursor() as cursor:
+        for name, value in settings.AUCTIONS_SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+    if _retry_locked not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_retry_locked)
+
+
+@receiver(connection_created)
+def tune_sqlite(sender, connection, **kwargs):
+    if connection.vendor == "sqlite" and settings.AUCTIONS_SQLITE_TUNING:
+        tune_connection(connection)
@@ -0,0 +1,54 @@
+from django.http import StreamingHttpResponse
+from django.template.loader import get_template, render_to_string
+
+STREAM_CHUNK_SIZE = 200
+
+# Placeholder the page template renders where the rows belong
+ROWS_MARKER = "<!--stream-rows-->"
+
+
+def _split_page(request, template, context):
+    page = render_to_string(template, {**context, "stream_marker": ROWS_MARKER}, request)
+    return page.split(ROWS_MARKER, 1)
+
+
+# Render the page around the rows once, then stream the rows themselves in
+# chunks straight from a server-side cursor. Memory use stays flat however
+# many rows there are, and the page header goes out before the first query.
+def stream_rows(request, template, context, rows, row_template, chunk_size=STREAM_CHUNK_SIZE):
+    head, tail = _split_page(request, template, context)
+    row_template = get_template(row_template)
+
+    def generate():
+        yield head
+        chunk = []
+        for row in rows.iterator(chunk_size=chunk_size):
+            chunk.append(row_template.render({"listing": row}, request))
+            if len(chunk) >= chunk_size:
+                yield "".join(chunk)
+                chunk = []
+        if chunk:
+            yield "".join(chunk)
+        yield tail
+
+    return StreamingHttpResponse(generate())
+
+
+# stream_rows() for async views
+def astream_rows(request, template, context, rows, row_template, chunk_size=STREAM_CHUNK_SIZE):
+    head, tail = _split_page(request, template, context)
+    row_template = get_template(row_template)
+
+    async def generate():
+        yield head
+        chunk = []
+        async for row in rows.aiterator(chunk_size=chunk_size):
+            chunk.append(row_template.render({"listing": row}, request))
+            if len(chunk) >= chunk_size:
+                yield "".join(chunk)
+                chunk = []
+        if chunk:
+            yield "".join(chunk)
+        yield tail
+
+    return StreamingHttpResponse(generate())
@@ -0,0 +1,13 @@
+from django import template
+
+register = template.Library()
+
+
+# Query string for another page of the current listing: the request's own
+# parameters, such as a search's q, category and status, with only the
+# cursor replaced
+@register.simple_tag(takes_context=True)
+def cursor_query(context, cursor):
+    params = context["request"].GET.copy()
+    params["cursor"] = cursor
+    return "?" + params.urlencode()
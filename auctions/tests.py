@@ -1,3 +1,1643 @@
-from django.test import TestCase
+import asyncio
+import csv
+import html
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
+
+from asgiref.sync import sync_to_async
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.contrib.sessions.backends.db import SessionStore
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from django.urls import reverse
+
+from . import async_views, images, views
+from .benchmarks.reads import compare_to_baseline, generate_dataset
+from .archive import archive_closed, archive_cutoff, bid_ledger
+from .bid_stats import repair_bid_stats
+from .categories import category_counts
+from .bidding import BidResult, _store_bid, place_bid, place_proxy_bid
+from .closing import close_expired, close_listing
+from .images import ImageError, evict, fetch_url, thumbnail_path
+from .comments import _page_query as _comment_page_query, comment_page, render_comments
+from .metrics import end_request, registry, start_request
+from .outbox import (
+    Notification, WebhookSink, _claim, dispatch_batch, dispatch_outbox, failed_events, notifications,
+    purge_failed,
+)
+from .cache import get_listing_snapshot, listing_version
+from .models import ArchivedBid, Bid, Category, Comment, Listing, OutboxEvent, ProxyBid, User, Watchlist, Winner
+from .realtime import get_broker, listing_channel, publish_bid, websocket_application
+from .pagination import NEXT, encode_cursor, paginate
+from .queries import listing_summaries
+from .ratelimit import CacheBackend, LocalBackend, _take, get_limiter
+from .routers import PRIMARY, STICKY_COOKIE, ReplicaRouter
+from .search import search_listings
+from .sqlite import _retry_locked, tune_connection
+from .transfer import KINDS, Importer, export_records
+from .watchlist import unwatch, watch, watched_entries, watched_ids
+
+
+def make_listing(poster, title="Gundam", price="10.00", active=True, description="A listing", image_url="", **kwargs):
+    return Listing.objects.create(
+        poster_id=poster,
+        list_title=title,
+        description=description,
+        starting_bid=Decimal(price),
+        highest_bid=Decimal(price),
+        high_bidder=poster,
+        image_url=image_url,
+        active=active,
+        **kwargs
+    )
+
+
+class BiddingTests(TestCase):
+    def setUp(self):
+        self.poster = User.objects.create_user("poster")
+        self.bidder = User.objects.create_user("bidder")
+        self.listing = make_listing(self.poster)
+
+    def test_higher_bid_is_accepted(self):
+        result = place_bid(self.listing.id, self.bidder, Decimal("12.50"))
+
+        self.assertEqual(result.status, BidResult.ACCEPTED)
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.highest_bid, Decimal("12.50"))
+        self.assertEqual(self.listing.high_bidder, self.bidder)
+        self.assertEqual(Bid.objects.get().bid_amount, Decimal("12.50"))
+
+    def test_price_never_goes_backwards(self):
+        place_bid(self.listing.id, self.bidder, Decimal("20.00"))
+        result = place_bid(self.listing.id, self.poster, Decimal("15.00"))
+
+        self.assertEqual(result.status, BidResult.TOO_LOW)
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.highest_bid, Decimal("20.00"))
+        self.assertEqual(Bid.objects.count(), 1)
+
+    def test_equal_bid_is_rejected(self):
+        result = place_bid(self.listing.id, self.bidder, Decimal("10.00"))
+        self.assertEqual(result.status, BidResult.TOO_LOW)
+
+    def test_closed_listing_rejects_bids(self):
+        closed = make_listing(self.poster, title="Closed", active=False)
+        result = place_bid(closed.id, self.bidder, Decimal("99.00"))
+
+        self.assertEqual(result.status, BidResult.CLOSED)
+        self.assertFalse(Bid.objects.exists())
+
+    def test_missing_listing(self):
+        result = place_bid(0, self.bidder, Decimal("99.00"))
+        self.assertEqual(result.status, BidResult.NOT_FOUND)
+
+    def test_rejected_bids_only_read_the_listing(self):
+        place_bid(self.listing.id, self.bidder, Decimal("20.00"))
+        with self.assertNumQueries(1):
+            self.assertEqual(place_bid(self.listing.id, self.poster, Decimal("15.00")).status, BidResult.TOO_LOW)
+
+
+class ProxyBidTests(TestCase):
+    def setUp(self):
+        self.poster = User.objects.create_user("poster")
+        self.alice = User.objects.create_user("alice")
+        self.bob = User.objects.create_user("bob")
+        self.listing = make_listing(self.poster)
+
+    def state(self):
+        self.listing.refresh_from_db()
+        return self.listing.high_bidder, self.listing.highest_bid
+
+    def test_proxy_bids_one_increment_over_the_price(self):
+        result = place_proxy_bid(self.listing.id, self.alice, Decimal("50.00"))
+
+        self.assertEqual(result.status, BidResult.ACCEPTED)
+        self.assertEqual(result.amount, Decimal("11.00"))
+        self.assertEqual(self.state(), (self.alice, Decimal("11.00")))
+        self.assertEqual(Bid.objects.count(), 1)
+
+    def test_highest_maximum_wins_at_one_increment_over_the_runner_up(self):
+        place_proxy_bid(self.listing.id, self.alice, Decimal("50.00"))
+        result = place_proxy_bid(self.listing.id, self.bob, Decimal("30.00"))
+
+        self.assertEqual(result.status, BidResult.OUTBID)
+        self.assertEqual(self.state(), (self.alice, Decimal("31.00")))
+        self.assertEqual(
+            list(Bid.objects.order_by("id").values_list("bidder_id__username", "bid_amount")),
+            [("alice", Decimal("11.00")), ("bob", Decimal("30.00")), ("alice", Decimal("31.00"))],
+        )
+        self.assertEqual(self.listing.bid_count, 3)
+        self.assertEqual(self.listing.unique_bidders, 2)
+
+    def test_equal_maximum_loses_to_the_earlier_one(self):
+        place_proxy_bid(self.listing.id, self.alice, Decimal("30.00"))
+        place_proxy_bid(self.listing.id, self.bob, Decimal("30.00"))
+        self.assertEqual(self.state(), (self.alice, Decimal("30.00")))
+
+        # So does an explicit bid of the same amount
+        place_proxy_bid(self.listing.id, self.alice, Decimal("50.00"))
+        result = place_bid(self.listing.id, self.bob, Decimal("50.00"))
+        self.assertEqual(result.status, BidResult.OUTBID)
+        self.assertEqual(self.state(), (self.alice, Decimal("50.00")))
+
+    def test_explicit_bids_are_answered_by_proxies(self):
+        place_proxy_bid(self.listing.id, self.alice, Decimal("50.00"))
+        result = place_bid(self.listing.id, self.bob, Decimal("20.00"))
+
+        self.assertEqual(result.status, BidResult.OUTBID)
+        self.assertTrue(result.placed)
+        self.assertEqual(self.state(), (self.alice, Decimal("21.00")))
+
+        result = place_bid(self.listing.id, self.bob, Decimal("60.00"))
+        self.assertEqual(result.status, BidResult.ACCEPTED)
+        self.assertEqual(self.state(), (self.bob, Decimal("60.00")))
+
+    def test_raising_your_own_maximum_keeps_the_price(self):
+        place_proxy_bid(self.listing.id, self.alice, Decimal("20.00"))
+        self.assertEqual(place_proxy_bid(self.listing.id, self.alice, Decimal("15.00")).status, BidResult.TOO_LOW)
+        self.assertEqual(place_proxy_bid(self.listing.id, self.alice, Decimal("40.00")).status, BidResult.ACCEPTED)
+
+        self.assertEqual(self.state(), (self.alice, Decimal("11.00")))
+        self.assertEqual(ProxyBid.objects.get().max_amount, Decimal("40.00"))
+        self.assertEqual(Bid.objects.count(), 1)
+
+    def test_proxy_bid_placed_after_the_read_answers_the_bid(self):
+        place_proxy_bid(self.listing.id, self.alice, Decimal("50.00"))
+        # As if place_bid had read the listing before the proxy bid was placed
+        self.assertIsNone(_store_bid(self.listing.id, self.bob, Decimal("20.00"), timezone.now(), answered=False))
+        self.assertEqual(place_bid(self.listing.id, self.bob, Decimal("20.00")).status, BidResult.OUTBID)
+        self.assertEqual(self.state(), (self.alice, Decimal("21.00")))
+
+    def test_rejected_proxy_bids(self):
+        closed = make_listing(self.poster, title="Closed", active=False)
+        self.assertEqual(place_proxy_bid(closed.id, self.alice, Decimal("50.00")).status, BidResult.CLOSED)
+        self.assertEqual(place_proxy_bid(0, self.alice, Decimal("50.00")).status, BidResult.NOT_FOUND)
+        self.assertEqual(place_proxy_bid(self.listing.id, self.alice, Decimal("10.00")).status, BidResult.TOO_LOW)
+        self.assertFalse(ProxyBid.objects.exists())
+
+    def test_bid_page_and_api_take_a_maximum(self):
+        self.client.force_login(self.alice)
+        self.client.post(reverse("bid", args=[self.listing.id]), {"bid_amount": "50.00", "proxy": "on"})
+        self.assertEqual(self.state(), (self.alice, Decimal("11.00")))
+
+        self.client.force_login(self.bob)
+        response = self.client.post(
+            reverse("api_listing_bids", args=[self.listing.id]),
+            {"max_amount": "30.00"}, content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["status"], BidResult.OUTBID)
+        self.assertEqual(self.state(), (self.alice, Decimal("31.00")))
+
+
+# Stands in for fetching image URLs in tests, serving TEST_IMAGES by URL
+TEST_IMAGES = {}
+
+
+def fetch_test_image(url):
+    try:
+        return TEST_IMAGES[url]
+    except KeyError:
+        raise ImageError(f"No test image at {url}")
+
+
+def png(width, height, color="red"):
+    output = io.BytesIO()
+    images.Image.new("RGB", (width, height), color).save(output, "PNG")
+    return output.getvalue()
+
+
+class ListingPageQueryTests(TestCase):
+    def setUp(self):
+        self.poster = User.objects.create_user("poster")
+        self.bidder = User.objects.create_user("bidder")
+
+    def add_listings(self, count, active=True):
+        for i in range(Listing.objects.count(), Listing.objects.count() + count):
+            listing = make_listing(
+                User.objects.create_user(f"user-{i}"),
+                title=f"Listing {i}",
+                active=active,
+                category_id="Art"
+            )
+            place_bid(listing.id, self.bidder, Decimal("11.00"))
+
+    def assertConstantQueries(self, url, active=True):
+        self.add_listings(1, active)
+        with self.assertNumQueries(1):
+            self.client.get(url)
+
+        self.add_listings(10, active)
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        return response
+
+    def test_index(self):
+        response = self.assertConstantQueries(reverse("index"))
+        self.assertContains(response, "Posted by: user-0")
+        self.assertNotIn("bids", response.context)
+
+    def test_closed(self):
+        self.assertConstantQueries(reverse("closed"), active=False)
+
+    def test_category(self):
+        self.assertConstantQueries(reverse("category", args=["Art"]))
+
+    def test_summary_bid_count(self):
+        self.add_listings(1)
+        summary = listing_summaries(active=True).get()
+        self.assertEqual(summary.bid_count, 1)
+
+
+class PaginationTests(TestCase):
+    def setUp(self):
+        poster = User.objects.create_user("poster")
+        self.listings = [make_listing(poster, title=f"Listing {i}") for i in range(30)]
+
+    def test_next_and_previous_pages(self):
+        first = paginate(Listing.objects.all(), page_size=25)
+        self.assertEqual([l.id for l in first], [l.id for l in self.listings[:25]])
+        self.assertFalse(first.has_previous)
+
+        second = paginate(Listing.objects.all(), first.next_cursor, page_size=25)
+        self.assertEqual([l.id for l in second], [l.id for l in self.listings[25:]])
+        self.assertFalse(second.has_next)
+
+        back = paginate(Listing.objects.all(), second.prev_cursor, page_size=25)
+        self.assertEqual([l.id for l in back], [l.id for l in first])
+        self.assertFalse(back.has_previous)
+        self.assertEqual(back.next_cursor, first.next_cursor)
+
+    def test_malformed_cursor_starts_at_first_page(self):
+        page = paginate(Listing.objects.all(), "not-a-cursor", page_size=5)
+        self.assertEqual(page[0].id, self.listings[0].id)
+
+    def test_index_links_to_next_page(self):
+        response = self.client.get(reverse("index"))
+        self.assertEqual(len(response.context["listings"]), 25)
+        self.assertContains(response, "?cursor=" + response.context["page"].next_cursor)
+
+    def test_streamed_index_contains_every_listing(self):
+        response = self.client.get(reverse("index"), {"stream": 1})
+        content = b"".join(response.streaming_content).decode()
+
+        self.assertEqual(content.count('class="container"'), 30)
+        self.assertIn("Listing 29", content)
+        self.assertTrue(content.rstrip().endswith("</html>"))
+
+
+@skipUnless(connection.vendor == "sqlite", "Checks SQLite query plans")
+class QueryPlanTests(TestCase):
+    def setUp(self):
+        poster = User.objects.create_user("poster")
+        listing = make_listing(poster)
+        Watchlist.objects.create(user_id=poster, listing_id=listing)
+
+    # Every table in the plan must be reached through an index or the primary
+    # key, never through a full table scan
+    def assertUsesIndex(self, queryset):
+        plan = queryset.explain()
+        for line in plan.splitlines():
+            if "auctions_" in line:
+                self.assertIn("USING", line, plan)
+
+    def test_listing_by_title(self):
+        self.assertUsesIndex(Listing.objects.filter(list_title="Gundam"))
+
+    def test_active_listings(self):
+        self.assertUsesIndex(listing_summaries(active=True)[:25])
+        self.assertUsesIndex(listing_summaries(active=True, id__gt=1)[:25])
+
+    def test_closed_listings(self):
+        self.assertUsesIndex(listing_summaries(active=False)[:25])
+
+    def test_category_listings(self):
+        self.assertUsesIndex(listing_summaries(category_id="Art", active=True)[:25])
+
+    def test_watchlist_membership(self):
+        self.assertUsesIndex(Watchlist.objects.filter(user_id=1, listing_id=1))
+
+    def test_highest_bid_for_listing(self):
+        self.assertUsesIndex(Bid.objects.filter(listing_id=1).order_by("-bid_amount")[:1])
+
+    def test_comment_pages(self):
+        self.assertUsesIndex(_comment_page_query(1, None, 20))
+        self.assertIn("comment_listing_created_idx", _comment_page_query(1, None, 20).explain())
+
+
+class ListingCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.poster = User.objects.create_user("poster")
+        self.bidder = User.objects.create_user("bidder")
+        self.listing = make_listing(self.poster)
+        self.url = self.listing.get_absolute_url()
+
+    def test_repeat_views_skip_the_database(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertContains(response, "Current price: $10.00")
+
+    def test_bid_invalidates_listing(self):
+        self.client.get(self.url)
+        version = listing_version(self.listing.id)
+
+        self.client.force_login(self.bidder)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("bid", args=[self.listing.id]), {"bid_amount": "15.00"})
+
+        self.assertGreater(listing_version(self.listing.id), version)
+        self.assertContains(response, "Your bid has been accepted")
+        self.assertContains(self.client.get(self.url), "Current price: $15.00")
+
+    def test_comment_invalidates_listing(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(user_id=self.bidder, listing_id=self.listing, comment="Still available?")
+
+        self.assertContains(self.client.get(self.url), "Still available?")
+
+    def test_close_invalidates_listing(self):
+        self.client.force_login(self.poster)
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("close", args=[self.listing.id]))
+
+        self.assertContains(response, "This auction has been closed without any bids.")
+        page = self.client.get(self.url)
+        self.assertContains(page, "This auction has closed. There were no bids.")
+        self.assertNotContains(page, "won the auction")
+        self.assertFalse(get_listing_snapshot(self.listing.list_title).listing.active)
+
+    def test_close_names_the_winner(self):
+        place_bid(self.listing.id, self.bidder, Decimal("15.00"))
+        self.client.force_login(self.poster)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("close", args=[self.listing.id]))
+
+        self.assertContains(response, "This auction has been closed. bidder won the auction.")
+        self.assertContains(self.client.get(self.url), "This auction has closed. bidder won the auction.")
+
+    def test_watchlist_flag_is_per_user(self):
+        Watchlist.objects.create(user_id=self.bidder, listing_id=self.listing)
+        self.client.force_login(self.poster)
+        self.assertContains(self.client.get(self.url), "Add to watchlist")
+
+        self.client.force_login(self.bidder)
+        self.assertContains(self.client.get(self.url), "Remove from watchlist")
+
+    def test_missing_listing_redirects(self):
+        response = self.client.get(reverse("listing", args=[0, "nothing"]))
+        self.assertRedirects(response, reverse("index"))
+
+
+class ListingRoutingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.poster = User.objects.create_user("poster")
+        self.listing = make_listing(self.poster, title="Gundam RX-78 / 1:144")
+
+    def test_listing_urls_use_id_and_slug(self):
+        url = self.listing.get_absolute_url()
+        self.assertEqual(url, f"/listing/{self.listing.id}/gundam-rx-78-1144")
+        self.assertContains(self.client.get(url), "Gundam RX-78 / 1:144")
+
+        self.assertEqual(make_listing(self.poster, title="???").slug, "listing")
+
+    def test_stale_slug_redirects_to_the_current_one(self):
+        response = self.client.get(reverse("listing", args=[self.listing.id, "gundam"]), {"cursor": "x"})
+        self.assertRedirects(response, self.listing.get_absolute_url() + "?cursor=x", 301, fetch_redirect_response=False)
+
+    def test_old_title_urls_redirect(self):
+        listing = make_listing(self.poster, title="Zaku II")
+        path = reverse("listing_by_title", args=[listing.list_title])
+        self.assertEqual(path, "/Zaku%20II/$")
+        response = self.client.get(path)
+        self.assertRedirects(response, listing.get_absolute_url(), 301)
+
+        # The title is mapped to the listing from the cache after that
+        with self.assertNumQueries(0):
+            self.client.get(path)
+
+        listing.list_title = "Zaku III"
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.save()
+        self.assertRedirects(self.client.get(path), reverse("index"))
+
+
+class CategoryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.poster = User.objects.create_user("poster")
+
+    def counts(self):
+        return dict(category_counts())
+
+    def test_counts_active_listings(self):
+        make_listing(self.poster, title="A", category_id="Art")
+        make_listing(self.poster, title="B", category_id="Art")
+        make_listing(self.poster, title="C", category_id="Art", active=False)
+        make_listing(self.poster, title="D", category_id="Toys")
+
+        counts = self.counts()
+        self.assertEqual((counts["Art"], counts["Toys"], counts["Motors"]), (2, 1, 0))
+        self.assertEqual(list(counts), sorted(counts))
+
+        response = self.client.get(reverse("categories"))
+        self.assertContains(response, "Art</a> (2)")
+
+    def test_counts_are_cached_until_listings_change(self):
+        listing = make_listing(self.poster, title="A", category_id="Art")
+        self.counts()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.counts()["Art"], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            make_listing(self.poster, title="B", category_id="Art")
+        self.assertEqual(self.counts()["Art"], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            close_listing(listing.id)
+        self.assertEqual(self.counts()["Art"], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name="Books")
+        self.assertEqual(self.counts()["Books"], 0)
+
+    @override_settings(AUCTIONS_IMAGE_FETCHER="auctions.tests.fetch_test_image")
+    def test_listings_refer_to_categories_by_name(self):
+        listing = make_listing(self.poster, category_id="Toys")
+        self.assertEqual(listing.category, Category.objects.get(name="Toys"))
+        self.assertEqual(list(listing_summaries(category_id="Toys")), [listing])
+
+        self.client.force_login(self.poster)
+        self.client.post(reverse("create"), {
+            "list_title": "Zaku", "description": "A listing", "starting_bid": "5.00",
+            "category": "Motors", "image_url": "https://example.com/zaku.png",
+        })
+        self.assertEqual(Listing.objects.get(list_title="Zaku").category_id, "Motors")
+
+
+class RealtimeTests(TestCase):
+    async def connect(self, path, inbox):
+        incoming = asyncio.Queue()
+        await incoming.put({"type": "websocket.connect"})
+
+        async def send(event):
+            await inbox.put(event)
+
+        task = asyncio.ensure_future(websocket_application({"type": "websocket", "path": path}, incoming.get, send))
+        return task, incoming
+
+    async def test_bids_are_pushed_to_listing_subscribers(self):
+        inbox = asyncio.Queue()
+        task, incoming = await self.connect("/ws/listing/7", inbox)
+        self.assertEqual((await inbox.get())["type"], "websocket.accept")
+        while get_broker().subscriber_count(listing_channel(7)) == 0:
+            await asyncio.sleep(0)
+
+        # Published from another thread, as the bid view does
+        await asyncio.get_running_loop().run_in_executor(None, publish_bid, 7, Decimal("12.50"), "bidder")
+        update = json.loads((await asyncio.wait_for(inbox.get(), 1))["text"])
+        self.assertEqual(update, {"listing": 7, "highest_bid": "12.50", "high_bidder": "bidder"})
+
+        await incoming.put({"type": "websocket.disconnect", "code": 1000})
+        await asyncio.wait_for(task, 1)
+        self.assertEqual(get_broker().subscriber_count(listing_channel(7)), 0)
+
+    async def test_unknown_path_is_rejected(self):
+        inbox = asyncio.Queue()
+        task, incoming = await self.connect("/ws/nothing", inbox)
+        await asyncio.wait_for(task, 1)
+        self.assertEqual((await inbox.get())["type"], "websocket.close")
+
+    def test_accepted_bid_is_published(self):
+        poster = User.objects.create_user("poster")
+        listing = make_listing(poster)
+        with mock.patch.object(get_broker(), "publish") as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                place_bid(listing.id, User.objects.create_user("bidder"), Decimal("11.00"))
+
+        publish.assert_called_once_with(
+            listing_channel(listing.id),
+            {"listing": listing.id, "highest_bid": "11.00", "high_bidder": "bidder"}
+        )
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.poster = User.objects.create_user("poster")
+        self.listings = [make_listing(self.poster, title=f"Listing {i}", category_id="Art") for i in range(30)]
+        Watchlist.objects.create(user_id=self.poster, listing_id=self.listings[3])
+        self.factory = AsyncRequestFactory()
+
+    def request(self, path, user=None, **params):
+        request = self.factory.get(path, params)
+        if user is None:
+            request.session = SessionStore()
+        else:
+            self.client.force_login(user)
+            request.session = SessionStore(self.client.session.session_key)
+        return request
+
+    async def test_pages_match_sync_views(self):
+        for name, args in [("index", []), ("closed", []), ("category", ["Art"]), ("categories", [])]:
+            path = reverse(name, args=args)
+            sync_response = await sync_to_async(getattr(views, name))(self.request(path), *args)
+            async_response = await getattr(async_views, name)(self.request(path), *args)
+            self.assertEqual(async_response.content, sync_response.content, name)
+
+    async def test_next_page(self):
+        first = await async_views.index(self.request("/"))
+        self.assertContains(first, "Listing 24")
+        self.assertNotContains(first, "Listing 25")
+
+        cursor = encode_cursor(NEXT, self.listings[24].id)
+        second = await async_views.index(self.request("/", cursor=cursor))
+        self.assertContains(second, "Listing 29")
+
+    async def test_streamed_index(self):
+        response = await async_views.index(self.request("/", stream=1))
+        content = "".join([chunk.decode() async for chunk in response.streaming_content])
+        self.assertEqual(content.count('class="container"'), 30)
+
+    async def test_listing(self):
+        request = await sync_to_async(self.request)("/", self.poster)
+        listing = self.listings[3]
+        response = await async_views.listing(request, listing.id, listing.slug)
+        self.assertContains(response, "Remove from watchlist")
+
+        response = await async_views.listing(request, listing.id, "old-title")
+        self.assertEqual(response.status_code, 301)
+        self.assertEqual(response.url, listing.get_absolute_url())
+
+    async def test_watchlist_requires_login(self):
+        response = await async_views.watchlist_view(self.request("/watchlist_view"))
+        self.assertEqual(response.status_code, 302)
+
+    async def test_watchlist(self):
+        request = await sync_to_async(self.request)("/watchlist_view", self.poster)
+        response = await async_views.watchlist_view(request)
+        self.assertContains(response, "Listing 3")
+
+
+class ClosingTests(TestCase):
+    def setUp(self):
+        self.poster = User.objects.create_user("poster")
+        self.bidder = User.objects.create_user("bidder")
+        self.past = timezone.now() - timezone.timedelta(hours=1)
+
+    def test_expired_listings_are_closed_in_batches(self):
+        sold = [make_listing(self.poster, title=f"Sold {i}") for i in range(5)]
+        unsold = make_listing(self.poster, title="Unsold", ends_at=self.past)
+        running = make_listing(self.poster, title="Running", ends_at=timezone.now() + timezone.timedelta(hours=1))
+        manual = make_listing(self.poster, title="Manual")
+        for listing in sold:
+            place_bid(listing.id, self.bidder, Decimal("20.00"))
+        Listing.objects.filter(id__in=[l.id for l in sold]).update(ends_at=self.past)
+
+        self.assertEqual(close_expired(batch_size=4), 6)
+
+        self.assertFalse(Listing.objects.filter(id__in=[l.id for l in sold + [unsold]], active=True).exists())
+        self.assertEqual(Listing.objects.filter(id__in=[running.id, manual.id], active=True).count(), 2)
+        self.assertEqual(
+            sorted(Winner.objects.values_list("listing_id", "user_id", "amount")),
+            [(l.id, self.bidder.id, Decimal("20.00")) for l in sold]
+        )
+
+    def test_bids_after_end_time_are_rejected(self):
+        listing = make_listing(self.poster, ends_at=self.past)
+        result = place_bid(listing.id, self.bidder, Decimal("20.00"))
+        self.assertEqual(result.status, BidResult.CLOSED)
+
+    def test_close_by_hand_records_winner_once(self):
+        listing = make_listing(self.poster)
+        place_bid(listing.id, self.bidder, Decimal("20.00"))
+
+        self.assertTrue(close_listing(listing.id))
+        self.assertFalse(close_listing(listing.id))
+        self.assertEqual(Winner.objects.get().user_id, self.bidder)
+
+    def test_end_time_must_be_in_the_future(self):
+        def errors(ends_at):
+            form = views.NewListingForm({"list_title": "Gundam", "description": "A listing", "starting_bid": "10.00", "ends_at": ends_at})
+            form.is_valid()
+            return form.errors
+
+        self.assertIn("ends_at", errors(self.past.strftime("%Y-%m-%d %H:%M")))
+        self.assertNotIn("ends_at", errors((timezone.now() + timedelta(hours=1)).strftime("%Y-%m-%d %H:%M")))
+        self.assertNotIn("ends_at", errors(""))
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.poster = User.objects.create_user("poster")
+        self.bidder = User.objects.create_user("bidder")
+        self.old = make_listing(self.poster, title="Old")
+        self.recent = make_listing(self.poster, title="Recent")
+        for listing in (self.old, self.recent):
+            place_bid(listing.id, self.bidder, Decimal("20.00"))
+            place_bid(listing.id, self.bidder, Decimal("25.00"))
+            Comment.objects.create(listing_id=listing, user_id=self.bidder, comment=f"{listing} comment")
+            Watchlist.objects.create(listing_id=listing, user_id=self.bidder)
+            close_listing(listing.id)
+        Listing.objects.filter(id=self.old.id).update(closed_at=timezone.now() - timedelta(days=100))
+
+    def test_moves_rows_of_long_closed_listings(self):
+        bid_ids = list(self.old.listing_bid.order_by("id").values_list("id", flat=True))
+        with self.captureOnCommitCallbacks(execute=True):
+            totals = archive_closed(archive_cutoff(days=90), batch_size=1)
+
+        self.assertEqual(totals, {"listings": 1, "bids": 2, "comments": 1, "watchlists": 1})
+        self.assertFalse(Bid.objects.filter(listing_id=self.old).exists())
+        self.assertEqual(Bid.objects.filter(listing_id=self.recent).count(), 2)
+        self.assertEqual(list(ArchivedBid.objects.order_by("id").values_list("id", flat=True)), bid_ids)
+        self.assertEqual(Watchlist.objects.get().listing_id, self.recent)
+        self.assertEqual(archive_closed(archive_cutoff(days=90)), {})
+
+        # Listings, winners and bid statistics are kept
+        old = Listing.objects.get(id=self.old.id)
+        self.assertTrue(old.archived)
+        self.assertEqual((old.bid_count, old.winner.user_id), (2, self.bidder))
+        self.assertEqual(repair_bid_stats(), (1, 0))
+
+    def test_archived_listings_read_the_archive(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            archive_closed(archive_cutoff(days=90))
+
+        response = self.client.get(Listing.objects.get(id=self.old.id).get_absolute_url())
+        self.assertContains(response, "Old comment")
+        response = self.client.get(reverse("api_listing_bids", args=[self.old.id]))
+        self.assertEqual([bid["amount"] for bid in response.json()["results"]], ["20.00", "25.00"])
+        response = self.client.get(reverse("api_listing_comments", args=[self.old.id]))
+        self.assertEqual([comment["comment"] for comment in response.json()["results"]], ["Old comment"])
+
+        response = self.client.get(reverse("closed"))
+        self.assertContains(response, "Old")
+        self.assertContains(response, "Recent")
+        # Winners are kept with the listing when its bids are archived
+        self.assertContains(response, "Won by bidder for $25.00", count=2)
+
+
+class BidStatsTests(TestCase):
+    def setUp(self):
+        self.poster = User.objects.create_user("poster")
+        self.alice = User.objects.create_user("alice")
+        self.bob = User.objects.create_user("bob")
+        self.listing = make_listing(self.poster)
+
+    def test_stats_follow_accepted_bids(self):
+        place_bid(self.listing.id, self.alice, Decimal("11.00"))
+        place_bid(self.listing.id, self.bob, Decimal("12.00"))
+        place_bid(self.listing.id, self.alice, Decimal("13.00"))
+        place_bid(self.listing.id, self.bob, Decimal("5.00"))
+
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.bid_count, 3)
+        self.assertEqual(self.listing.unique_bidders, 2)
+        self.assertEqual(self.listing.last_bid_at, Bid.objects.latest("created").created)
+
+    def test_repair_recomputes_drifted_stats(self):
+        place_bid(self.listing.id, self.alice, Decimal("11.00"))
+        place_bid(self.listing.id, self.bob, Decimal("12.00"))
+        untouched = make_listing(self.poster, title="No bids")
+        Listing.objects.filter(id=self.listing.id).update(bid_count=99, unique_bidders=0)
+        Listing.objects.filter(id=untouched.id).update(bid_count=4)
+
+        self.assertEqual(repair_bid_stats(batch_size=1), (2, 2))
+
+        self.listing.refresh_from_db()
+        untouched.refresh_from_db()
+        self.assertEqual((self.listing.bid_count, self.listing.unique_bidders), (2, 2))
+        self.assertEqual((untouched.bid_count, untouched.unique_bidders, untouched.last_bid_at), (0, 0, None))
+        self.assertEqual(repair_bid_stats(), (2, 0))
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.poster = User.objects.create_user("poster")
+
+    def search_titles(self, query, **kwargs):
+        return [listing.list_title for listing in search_listings(query, **kwargs)]
+
+    def test_title_matches_rank_above_description_matches(self):
+        make_listing(self.poster, title="Model kit", description="Includes a Gundam decal sheet")
+        make_listing(self.poster, title="Gundam Exia")
+
+        make_listing(self.poster, title="Gundam Zaku")
+
+        self.assertEqual(self.search_titles("gundam"), ["Gundam Zaku", "Gundam Exia", "Model kit"])
+        self.assertEqual(self.search_titles("gundams"), ["Gundam Zaku", "Gundam Exia", "Model kit"])
+        self.assertEqual(self.search_titles("gundam exia"), ["Gundam Exia"])
+
+    def test_index_follows_edits_and_deletes(self):
+        listing = make_listing(self.poster, title="Zaku")
+        self.assertEqual(self.search_titles("zaku"), ["Zaku"])
+
+        Listing.objects.filter(id=listing.id).update(list_title="Gouf")
+        self.assertEqual(self.search_titles("zaku"), [])
+        self.assertEqual(self.search_titles("gouf"), ["Gouf"])
+
+        listing.delete()
+        self.assertEqual(self.search_titles("gouf"), [])
+
+    def test_filters(self):
+        make_listing(self.poster, title="Gundam Exia", category_id="Toys")
+        make_listing(self.poster, title="Gundam poster", category_id="Home")
+        make_listing(self.poster, title="Gundam Zaku", category_id="Toys", active=False)
+
+        self.assertEqual(self.search_titles("gundam", category="Toys"), ["Gundam Exia"])
+        self.assertEqual(self.search_titles("gundam", active=False), ["Gundam Zaku"])
+        self.assertEqual(len(self.search_titles("gundam", active=None)), 3)
+
+    def test_query_syntax_is_treated_as_text(self):
+        make_listing(self.poster, title="Gundam Exia")
+        self.assertEqual(self.search_titles('exia" OR NEAR(*'), [])
+        self.assertEqual(self.search_titles("  "), [])
+
+    def test_pages_cover_every_match_once(self):
+        for i in range(7):
+            make_listing(self.poster, title=f"Gundam {i}")
+
+        for i in range(4):
+            make_listing(self.poster, title=f"Kit {i}", description="Gundam parts")
+
+        seen, cursor = [], None
+        while True:
+            page = search_listings("gundam", cursor=cursor, page_size=3)
+            seen += [listing.list_title for listing in page]
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, [f"Gundam {i}" for i in reversed(range(7))] + [f"Kit {i}" for i in reversed(range(4))])
+
+    def test_search_page(self):
+        make_listing(self.poster, title="Gundam Exia")
+        response = self.client.get(reverse("search"), {"q": "exia"})
+        self.assertContains(response, "Gundam Exia")
+
+    def test_next_links_keep_the_filters(self):
+        for i in range(60):
+            make_listing(self.poster, title=f"Gundam {i}", category_id="Toys", active=bool(i % 2))
+        make_listing(self.poster, title="Gundam poster", category_id="Toys")
+        make_listing(self.poster, title="Gundam kit", category_id="Home", active=False)
+
+        def follow(response, label):
+            link = re.search(rf'href="([^"]*)">[^<]*{label}', response.content.decode())
+            return link and self.client.get(reverse("search") + html.unescape(link.group(1)))
+
+        first = self.client.get(reverse("search"), {"q": "gundam", "category": "Toys", "status": "closed"})
+        second = follow(first, "Next")
+        titles = [listing.list_title for page in (first, second) for listing in page.context["listings"]]
+        self.assertEqual(titles, [f"Gundam {i}" for i in reversed(range(0, 60, 2))])
+        self.assertIsNone(follow(second, "Next"))
+        self.assertTemplateUsed(first, "auctions/pagination.html")
+
+
+class BenchmarkSuiteTests(TestCase):
+    def test_generated_data_is_consistent(self):
+        generate_dataset(200)
+
+        self.assertEqual(Listing.objects.count(), 200)
+        self.assertEqual(Comment.objects.count(), 200)
+        self.assertTrue(Bid.objects.exists())
+        # Denormalized bid statistics match the generated bids
+        self.assertEqual(repair_bid_stats(), (200, 0))
+        for listing in Listing.objects.filter(bid_count__gt=0)[:20]:
+            top = listing.listing_bid.order_by("-bid_amount").first()
+            self.assertEqual((listing.highest_bid, listing.high_bidder_id), (top.bid_amount, top.bidder_id_id))
+
+    def test_compare_to_baseline(self):
+        baseline = {"index": {"p50_ms": 10.0, "p95_ms": 20.0, "peak_kb": 100.0, "queries": 3}}
+        same = {"index": dict(baseline["index"], p50_ms=11.0)}
+        slower = {"index": dict(baseline["index"], p50_ms=30.0)}
+        more_queries = {"index": dict(baseline["index"], queries=4)}
+
+        self.assertEqual(compare_to_baseline(same, baseline), [])
+        self.assertEqual(len(compare_to_baseline(slower, baseline)), 1)
+        self.assertEqual(len(compare_to_baseline(more_queries, baseline)), 1)
+        self.assertEqual(compare_to_baseline({"new_view": baseline["index"]}, baseline), [])
+
+
+@override_settings(AUCTIONS_METRICS_SAMPLE_RATE=1.0, AUCTIONS_METRICS_SLOW_QUERY_MS=None)
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+        self.poster = User.objects.create_user("poster")
+        self.listing = make_listing(self.poster)
+
+    def test_records_view_cost(self):
+        self.client.get(self.listing.get_absolute_url())
+
+        self.assertEqual(registry.requests["listing"], 1)
+        self.assertEqual(registry.counters["sampled_requests_total"]["listing"], 1)
+        self.assertGreater(registry.counters["db_queries_total"]["listing"], 0)
+        self.assertGreater(registry.counters["template_render_seconds_total"]["listing"], 0)
+
+    def test_counts_duplicate_queries(self):
+        token = start_request(sampled=True)
+        for _ in range(3):
+            User.objects.get(id=self.poster.id)
+        User.objects.get(username="poster")
+        stats = end_request(token)
+
+        self.assertEqual(len(stats.queries), 4)
+        self.assertEqual(stats.duplicates, 2)
+
+    def test_logs_slow_queries(self):
+        with override_settings(AUCTIONS_METRICS_SLOW_QUERY_MS=0):
+            with self.assertLogs("auctions.metrics", "WARNING") as logs:
+                self.client.get(reverse("index"))
+        self.assertIn("Slow query in index", logs.output[0])
+        self.assertGreater(registry.counters["slow_queries_total"]["index"], 0)
+
+    def test_prometheus_endpoint_is_local_only(self):
+        self.client.get(reverse("index"))
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('auctions_requests_total{view="index"} 1', response.content.decode())
+        self.assertIn('auctions_request_duration_seconds_bucket{view="index",le="+Inf"} 1', response.content.decode())
+
+        self.assertEqual(self.client.get(reverse("metrics"), REMOTE_ADDR="10.0.0.1").status_code, 404)
+
+
+class WatchlistTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.poster = User.objects.create_user("poster")
+        self.watcher = User.objects.create_user("watcher")
+        self.listings = [make_listing(self.poster, title=f"Listing {i}") for i in range(3)]
+        self.client.force_login(self.watcher)
+
+    def test_add_and_remove_are_idempotent(self):
+        for _ in range(2):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.get(reverse("watchlist_add", args=[self.listings[1].id]))
+        self.assertEqual(Watchlist.objects.filter(user_id=self.watcher).count(), 1)
+
+        for _ in range(2):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.get(reverse("watchlist_remove", args=[self.listings[1].id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Watchlist.objects.exists())
+
+    def test_cached_ids_follow_changes(self):
+        request = RequestFactory().get("/")
+        request.user = self.watcher
+        self.assertEqual(watched_ids(request), frozenset())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(watch(request, self.listings[0].id))
+        self.assertFalse(watch(request, self.listings[0].id))
+        self.assertEqual(watched_ids(request), {self.listings[0].id})
+
+        # A new request reads the set from the cache
+        request = RequestFactory().get("/")
+        request.user = self.watcher
+        with self.assertNumQueries(0):
+            self.assertEqual(watched_ids(request), {self.listings[0].id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(unwatch(request, self.listings[0].id))
+        self.assertEqual(watched_ids(request), frozenset())
+
+    def test_watchlist_page_is_one_query(self):
+        for listing in self.listings:
+            Watchlist.objects.create(user_id=self.watcher, listing_id=listing)
+
+        with self.assertNumQueries(1):
+            titles = [watch.listing_id.list_title for watch in watched_entries(self.watcher)]
+        self.assertEqual(titles, ["Listing 0", "Listing 1", "Listing 2"])
+        self.assertContains(self.client.get(reverse("watchlist_view")), "Listing 2")
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.poster = User.objects.create_user("poster")
+        self.bidder = User.objects.create_user("bidder")
+        self.listing = make_listing(self.poster)
+
+    def test_listings_with_field_selection_and_cursor(self):
+        for i in range(30):
+            make_listing(self.poster, title=f"Listing {i}")
+
+        response = self.client.get(reverse("api_listings"), {"fields": "id,title,current_bid"})
+        data = response.json()
+        self.assertEqual(len(data["results"]), 25)
+        self.assertEqual(data["results"][0], {"id": self.listing.id, "title": "Gundam", "current_bid": "10.00"})
+
+        data = self.client.get(reverse("api_listings"), {"cursor": data["next"]}).json()
+        self.assertEqual(len(data["results"]), 6)
+        self.assertIsNone(data["next"])
+
+        response = self.client.get(reverse("api_listings"), {"fields": "title,password"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_conditional_get(self):
+        url = reverse("api_listing", args=[self.listing.id])
+        response = self.client.get(url)
+        self.assertEqual(response.json()["current_bid"], "10.00")
+        etag = response["ETag"]
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]).status_code, 304
+        )
+        # Another representation of the same listing has its own ETag
+        self.assertEqual(self.client.get(url, {"fields": "id"}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            place_bid(self.listing.id, self.bidder, Decimal("11.00"))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["current_bid"], "11.00")
+
+        self.assertEqual(self.client.get(reverse("api_listing", args=[999])).status_code, 404)
+
+    def test_place_bid(self):
+        url = reverse("api_listing_bids", args=[self.listing.id])
+        self.assertEqual(self.client.post(url, {"amount": "11.00"}).status_code, 401)
+
+        self.client.force_login(self.bidder)
+        response = self.client.post(url, {"amount": "11.00"}, content_type="application/json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["status"], BidResult.ACCEPTED)
+        self.assertEqual(self.client.post(url, {"amount": "11.00"}).status_code, 409)
+        self.assertEqual(self.client.post(url, {"amount": "lots"}).status_code, 400)
+
+        bids = self.client.get(url).json()["results"]
+        self.assertEqual([(bid["bidder"], bid["amount"]) for bid in bids], [("bidder", "11.00")])
+
+    def test_watchlist(self):
+        self.client.force_login(self.bidder)
+        url = reverse("api_watchlist")
+
+        self.assertEqual(self.client.post(url, {"listing": self.listing.id}).status_code, 201)
+        self.assertEqual(self.client.post(url, {"listing": self.listing.id}).status_code, 200)
+        self.assertEqual([row["id"] for row in self.client.get(url).json()["results"]], [self.listing.id])
+
+        self.client.delete(reverse("api_watchlist_entry", args=[self.listing.id]))
+        self.assertEqual(self.client.get(url).json()["results"], [])
+
+
+class CommentTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.poster = User.objects.create_user("poster")
+        self.listing = make_listing(self.poster)
+        start = timezone.now() - timedelta(minutes=1)
+        Comment.objects.bulk_create(
+            Comment(user_id=self.poster, listing_id=self.listing, comment=f"Comment {i}",
+                    created=start + timedelta(seconds=i // 2))
+            for i in range(45)
+        )
+
+    def test_pages_newest_first(self):
+        seen, cursor = [], None
+        while True:
+            with self.assertNumQueries(1):
+                page = comment_page(self.listing.id, cursor)
+            seen += [comment.comment for comment in page]
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, [f"Comment {i}" for i in reversed(range(45))])
+        self.assertEqual(page[0].user_id.username, "poster")
+
+    def test_rendered_pages_are_cached_until_a_new_comment(self):
+        html = render_comments(self.listing.id)
+        self.assertIn("Comment 44", html)
+        self.assertIn("Older comments", html)
+        with self.assertNumQueries(0):
+            self.assertEqual(render_comments(self.listing.id), html)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(user_id=self.poster, listing_id=self.listing, comment="Newest")
+        self.assertIn("Newest", render_comments(self.listing.id))
+
+    def test_fragment_view(self):
+        first = comment_page(self.listing.id)
+        url = reverse("comments", args=[self.listing.id])
+        response = self.client.get(url, {"cursor": first.next_cursor})
+        self.assertContains(response, "Comment 24")
+        self.assertNotContains(response, "Comment 25")
+
+        etag = response["ETag"]
+        response = self.client.get(url, {"cursor": first.next_cursor}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+
+@override_settings(AUCTIONS_REPLICA_DATABASE="replica")
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.poster = User.objects.create_user("poster")
+        self.bidder = User.objects.create_user("bidder")
+        self.listing = make_listing(self.poster)
+        self.client.force_login(self.bidder)
+
+    # Make a request, recording where each read would have gone. Reads still
+    # run on the primary, there is no replica database in the tests.
+    def route(self, method, path, data=None):
+        chosen = []
+        original = ReplicaRouter.db_for_read
+
+        def record(router, model, **hints):
+            chosen.append(original(router, model, **hints))
+            return PRIMARY
+
+        with mock.patch.object(ReplicaRouter, "db_for_read", record):
+            response = getattr(self.client, method)(path, data)
+        return response, set(chosen)
+
+    def test_read_only_pages_use_the_replica(self):
+        for path in [reverse("index"), reverse("closed"), reverse("category", args=["Art"])]:
+            self.assertEqual(self.route("get", path)[1], {"replica"})
+        self.assertEqual(self.route("get", self.listing.get_absolute_url())[1], {"replica"})
+        self.assertEqual(self.route("get", reverse("watchlist_view"))[1], {PRIMARY})
+
+    # Timeouts the listing page cached its snapshot and comments with
+    def cached_for(self):
+        with mock.patch.object(cache, "set", wraps=cache.set) as cache_set:
+            _, aliases = self.route("get", self.listing.get_absolute_url())
+        timeouts = {call.args[0].split(":")[0]: call.args[2] for call in cache_set.call_args_list}
+        return aliases, timeouts["listing"], timeouts["comments"]
+
+    @override_settings(AUCTIONS_REPLICA_STICKY_SECONDS=5, AUCTIONS_LISTING_CACHE_TIMEOUT=600)
+    def test_replica_reads_are_cached_for_the_sticky_window(self):
+        self.assertEqual(self.cached_for(), ({"replica"}, 5, 5))
+
+        cache.clear()
+        self.client.cookies[STICKY_COOKIE] = str(time.time() + 5)
+        self.assertEqual(self.cached_for(), ({PRIMARY}, 600, 600))
+
+    def test_reads_stick_to_the_primary_after_a_write(self):
+        response, aliases = self.route("post", reverse("bid", args=[self.listing.id]), {"bid_amount": "11.00"})
+        self.assertEqual(aliases, {PRIMARY})
+        self.assertIn(STICKY_COOKIE, response.cookies)
+
+        self.assertEqual(self.route("get", reverse("index"))[1], {PRIMARY})
+
+        self.client.cookies[STICKY_COOKIE] = "0"
+        self.assertEqual(self.route("get", reverse("index"))[1], {"replica"})
+
+    def test_everything_uses_the_primary_without_a_replica(self):
+        with override_settings(AUCTIONS_REPLICA_DATABASE=None):
+            response, _ = self.route("post", reverse("bid", args=[self.listing.id]), {"bid_amount": "11.00"})
+            self.assertNotIn(STICKY_COOKIE, response.cookies)
+            self.assertEqual(self.route("get", reverse("index"))[1], {PRIMARY})
+
+
+class SqliteTuningTests(TestCase):
+    def execute_locked(self, sql, failures, in_atomic_block=False):
+        calls = []
+
+        def execute(sql, params, many, context):
+            calls.append(sql)
+            if len(calls) <= failures:
+                raise OperationalError("database is locked")
+            return "done"
+
+        context = {"connection": mock.Mock(in_atomic_block=in_atomic_block)}
+        # Without the jitter, so each delay is exactly double the last
+        with mock.patch("auctions.sqlite.time.sleep") as sleep, mock.patch("auctions.sqlite.random.uniform", return_value=1):
+            try:
+                result = _retry_locked(execute, sql, None, False, context)
+            except OperationalError:
+                result = None
+        return result, calls, [call.args[0] for call in sleep.call_args_list]
+
+    def test_locked_statements_are_retried_with_backoff(self):
+        with override_settings(AUCTIONS_SQLITE_LOCK_RETRIES=3, AUCTIONS_SQLITE_LOCK_BACKOFF=0.1):
+            result, calls, delays = self.execute_locked("UPDATE x", failures=2)
+            self.assertEqual(result, "done")
+            self.assertEqual(len(calls), 3)
+            self.assertLess(delays[0], delays[1])
+
+            result, calls, _ = self.execute_locked("UPDATE x", failures=10)
+            self.assertIsNone(result)
+            self.assertEqual(len(calls), 4)
+
+    def test_transactions_take_the_write_lock_up_front(self):
+        _, calls, _ = self.execute_locked("BEGIN", failures=1)
+        self.assertEqual(calls, ["BEGIN IMMEDIATE", "BEGIN IMMEDIATE"])
+
+        # A statement inside a transaction can't be retried on its own
+        _, calls, _ = self.execute_locked("UPDATE x", failures=1, in_atomic_block=True)
+        self.assertEqual(calls, ["UPDATE x"])
+
+    @skipUnless(connection.vendor == "sqlite", "SQLite only")
+    def test_tune_connection(self):
+        connection.ensure_connection()
+        self.addCleanup(connection.execute_wrappers.remove, _retry_locked)
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA busy_timeout")
+            timeout = cursor.fetchone()[0]
+        self.addCleanup(lambda: connection.cursor().execute(f"PRAGMA busy_timeout = {timeout}"))
+
+        with override_settings(AUCTIONS_SQLITE_PRAGMAS={"busy_timeout": 1234}):
+            tune_connection(connection)
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], 1234)
+        self.assertIn(_retry_locked, connection.execute_wrappers)
+
+
+class TransferTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.poster = User.objects.create_user("poster")
+        self.bidder = User.objects.create_user("bidder")
+
+    def export(self, kind, fmt="jsonl"):
+        stream = io.StringIO()
+        export_records(kind, stream, fmt, chunk_size=2)
+        stream.seek(0)
+        return stream
+
+    def export_all(self, fmt):
+        listing = make_listing(self.poster, title="Gundam", price="12.50", category_id="Toys")
+        place_bid(listing.id, self.bidder, Decimal("15.00"))
+        Comment.objects.create(listing_id=listing, user_id=self.bidder, comment='Mint, "boxed"')
+        Watchlist.objects.create(listing_id=listing, user_id=self.bidder)
+        streams = {kind: self.export(kind, fmt) for kind in KINDS}
+        return listing, streams
+
+    def round_trip(self, fmt):
+        original, streams = self.export_all(fmt)
+        bid = Bid.objects.get()
+        original.delete()
+        self.bidder.delete()
+
+        importer = Importer(batch_size=2)
+        results = [importer.run(kind, streams[kind], fmt) for kind in KINDS]
+        self.assertEqual([(result.imported, result.errors) for result in results], [(1, [])] * 4 + [(0, [])] * 3)
+
+        listing = Listing.objects.get()
+        self.assertNotEqual(listing.id, original.id)
+        self.assertEqual(
+            (listing.list_title, listing.category_id, listing.highest_bid, listing.high_bidder.username),
+            ("Gundam", "Toys", Decimal("15.00"), "bidder"),
+        )
+        self.assertEqual((listing.bid_count, listing.last_bid_at), (1, bid.created))
+        imported = listing.listing_bid.get()
+        self.assertEqual((imported.bidder_id.username, imported.created), ("bidder", bid.created))
+        self.assertEqual(listing.listing_comment.get().comment, 'Mint, "boxed"')
+        self.assertEqual(listing.listing_watch.get().user_id.username, "bidder")
+        # Missing users are created without a usable password
+        self.assertFalse(User.objects.get(username="bidder").has_usable_password())
+
+    def test_round_trip_jsonl(self):
+        self.round_trip("jsonl")
+
+    def test_round_trip_csv(self):
+        self.round_trip("csv")
+
+    def test_round_trip_after_archiving(self):
+        now = timezone.now()
+        original, _ = self.export_all("jsonl")
+        close_listing(original.id)
+        Listing.objects.filter(id=original.id).update(closed_at=now - timedelta(days=100))
+        archive_closed(archive_cutoff(now=now))
+        streams = {kind: self.export(kind) for kind in KINDS}
+        Listing.objects.all().delete()
+
+        importer = Importer()
+        results = [importer.run(kind, streams[kind]) for kind in KINDS]
+        self.assertEqual([(result.imported, result.errors) for result in results], [(1, [])] + [(0, [])] * 3 + [(1, [])] * 3)
+
+        listing = Listing.objects.get()
+        self.assertTrue(listing.archived)
+        self.assertEqual(listing.closed_at, now - timedelta(days=100))
+        self.assertEqual([bid.bid_amount for bid in bid_ledger(listing)], [Decimal("15.00")])
+        self.assertEqual(listing.archived_comment.get().comment, 'Mint, "boxed"')
+        self.assertEqual(listing.archived_watch.get().user_id.username, "bidder")
+        self.assertFalse(Bid.objects.exists())
+
+    def test_invalid_records_are_skipped(self):
+        make_listing(self.poster, title="Taken")
+        lines = [
+            {"id": 7, "title": "Zaku", "description": "", "category": "Toys", "poster": "poster",
+             "starting_bid": "1.00", "highest_bid": "1.00", "high_bidder": "poster", "image_url": "", "active": True},
+            {"id": 8, "title": "Taken", "description": "", "category": "Toys", "poster": "poster",
+             "starting_bid": "1.00", "highest_bid": "1.00", "high_bidder": "poster", "image_url": "", "active": True},
+            {"id": 9, "title": "Gouf", "description": "", "category": "Books", "poster": "poster",
+             "starting_bid": "1.00", "highest_bid": "1.00", "high_bidder": "poster", "image_url": "", "active": True},
+            {"id": 10, "title": "Dom", "description": "", "category": "Toys", "poster": "poster",
+             "starting_bid": "1.001", "highest_bid": "1.00", "high_bidder": "poster", "image_url": "", "active": True},
+        ]
+        stream = io.StringIO("".join(json.dumps(line) + "\n" for line in lines))
+        importer = Importer()
+        result = importer.run("listings", stream)
+
+        self.assertEqual(result.imported, 1)
+        self.assertEqual([line for line, _ in result.errors], [2, 3, 4])
+        self.assertIn("already exists", result.errors[0][1])
+        self.assertEqual(list(importer.listings), [7])
+
+        bids = io.StringIO("listing,bidder,amount,created\n7,bidder,2.00,\n8,bidder,2.00,\n")
+        result = importer.run("bids", bids, "csv")
+        self.assertEqual(result.imported, 0)
+        self.assertIn("invalid format", result.errors[0][1])
+        self.assertEqual(result.errors[1], (3, "Unknown listing '8'"))
+
+    def test_export_command(self):
+        self.export_all("csv")
+        with tempfile.TemporaryDirectory() as directory:
+            call_command("export_data", directory, format="csv", stdout=io.StringIO())
+            with open(os.path.join(directory, "bids.csv"), newline="") as stream:
+                rows = list(csv.DictReader(stream))
+            Listing.objects.all().delete()
+            call_command("import_data", directory, format="csv", stdout=io.StringIO(), stderr=io.StringIO())
+
+        self.assertEqual([(row["bidder"], row["amount"]) for row in rows], [("bidder", "15.00")])
+        self.assertEqual(Bid.objects.get().listing_id.list_title, "Gundam")
+
+
+@override_settings(AUCTIONS_IMAGE_FETCHER="auctions.tests.fetch_test_image")
+class ThumbnailTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.poster = User.objects.create_user("poster")
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        directory_override = override_settings(AUCTIONS_IMAGE_DIR=directory)
+        directory_override.enable()
+        self.addCleanup(directory_override.disable)
+
+    def create(self, image_url):
+        self.client.force_login(self.poster)
+        self.client.post(reverse("create"), {
+            "list_title": "Zaku", "description": "A listing", "starting_bid": "5.00",
+            "category": "Toys", "image_url": image_url,
+        })
+        call_command("generate_thumbnails", stdout=io.StringIO())
+        return Listing.objects.get(list_title="Zaku")
+
+    @skipUnless(images.Image, "Pillow isn't installed")
+    def test_thumbnails_are_made_by_the_command_and_served_cacheable(self):
+        TEST_IMAGES["https://example.com/zaku.png"] = png(1600, 900)
+        listing = self.create("https://example.com/zaku.png")
+        self.assertEqual(len(listing.image_digest), 16)
+
+        response = self.client.get(reverse("index"))
+        self.assertContains(response, f'src="{listing.summary_image}"')
+        self.assertNotContains(response, "example.com")
+
+        response = self.client.get(listing.summary_image)
+        self.assertEqual(response["Content-Type"], "image/jpeg")
+        self.assertIn("immutable", response["Cache-Control"])
+        with images.Image.open(io.BytesIO(b"".join(response.streaming_content))) as thumbnail:
+            self.assertEqual(thumbnail.size, (200, 125))
+
+        etag = response["ETag"]
+        response = self.client.get(listing.summary_image, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # The ETag only answers for the listing's current thumbnail
+        digest = listing.image_digest
+        for args, status in [([listing.id + 1, "summary", digest], 404), ([listing.id, "huge", digest], 404)]:
+            self.assertEqual(self.client.get(reverse("thumbnail", args=args), HTTP_IF_NONE_MATCH=etag).status_code, status)
+        stale = reverse("thumbnail", args=[listing.id, "summary", "0123456789abcdef"])
+        response = self.client.get(stale, HTTP_IF_NONE_MATCH='"0123456789abcdef-summary"')
+        self.assertRedirects(response, listing.summary_image, fetch_redirect_response=False)
+
+    @skipUnless(images.Image, "Pillow isn't installed")
+    def test_evicted_thumbnails_are_made_again_by_the_command(self):
+        TEST_IMAGES["https://example.com/gouf.png"] = png(400, 400, "blue")
+        listing = self.create("https://example.com/gouf.png")
+        path = thumbnail_path(listing.image_digest, "listing")
+        self.assertEqual(evict(limit=0), 2)
+        self.assertFalse(os.path.exists(path))
+
+        # The request is sent to the original image rather than fetching it
+        old_url = listing.listing_image
+        with mock.patch.object(images, "fetch_image") as fetch, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(old_url)
+        fetch.assert_not_called()
+        self.assertRedirects(response, "https://example.com/gouf.png", fetch_redirect_response=False)
+        self.assertEqual(Listing.objects.get(id=listing.id).listing_image, "https://example.com/gouf.png")
+
+        # A new image gets new URLs, the old ones lead to it
+        TEST_IMAGES["https://example.com/gouf.png"] = png(400, 400, "green")
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("generate_thumbnails", stdout=io.StringIO())
+        listing.refresh_from_db()
+        self.assertNotEqual(listing.listing_image, old_url)
+        self.assertRedirects(self.client.get(old_url), listing.listing_image)
+
+    def test_least_recently_used_thumbnails_are_evicted(self):
+        for age, name in enumerate(["new", "middle", "old"]):
+            path = thumbnail_path(name, "summary")
+            with open(path, "wb") as stream:
+                stream.write(b"x" * 100)
+            os.utime(path, (1000 - age, 1000 - age))
+
+        self.assertEqual(evict(limit=300), 0)
+        self.assertEqual(evict(limit=250), 1)
+        self.assertFalse(os.path.exists(thumbnail_path("old", "summary")))
+        self.assertTrue(os.path.exists(thumbnail_path("middle", "summary")))
+
+    def test_without_thumbnails_pages_use_the_image_url(self):
+        listing = make_listing(self.poster, image_url="https://example.com/missing.png")
+        self.assertEqual(listing.summary_image, "https://example.com/missing.png")
+        self.assertContains(self.client.get(reverse("index")), 'src="https://example.com/missing.png"')
+
+        # Thumbnails that can't be made again send browsers to the original
+        Listing.objects.filter(id=listing.id).update(image_digest="0123456789abcdef")
+        response = self.client.get(reverse("thumbnail", args=[listing.id, "summary", "0123456789abcdef"]))
+        self.assertRedirects(response, "https://example.com/missing.png", fetch_redirect_response=False)
+
+    def test_only_public_http_urls_are_fetched(self):
+        for url in [
+            "file:///etc/passwd", "http://127.0.0.1/", "http://localhost:8000/", "http://169.254.169.254/latest",
+            "http://10.0.0.1/", "http://[::1]/",
+        ]:
+            with self.subTest(url=url), self.assertRaises(ImageError):
+                fetch_url(url)
+
+    def test_redirects_are_checked(self):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(302)
+                self.send_header("Location", "ftp://127.0.0.1/x" if self.path == "/ftp" else "http://127.0.0.1:1/")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        server = HTTPServer(("127.0.0.1", 0), Handler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        # The test server counts as public for the first connection only
+        for path, message in [("/ftp", "isn't http(s)"), ("/private", "isn't a public address")]:
+            with mock.patch.object(images, "_is_public", side_effect=[True, False]) as is_public:
+                with self.subTest(path=path), self.assertRaisesMessage(ImageError, message):
+                    fetch_url(f"http://127.0.0.1:{server.server_port}{path}")
+        # The redirect to a private address was checked before connecting
+        self.assertEqual(is_public.call_count, 2)
+
+
+# Records deliveries, failing the first attempt for the recipients in fail
+class RecordingSink:
+    name = "recording"
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.keys = []
+
+    def send(self, notification, key):
+        if notification.recipient.username in self.fail:
+            self.fail.discard(notification.recipient.username)
+            raise ConnectionError("sink unavailable")
+        self.keys.append(key)
+
+
+@override_settings(AUCTIONS_NOTIFICATIONS=True, AUCTIONS_OUTBOX_RETRY_DELAY=60, AUCTIONS_OUTBOX_CLAIM_SECONDS=300)
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.poster = User.objects.create_user("poster", email="poster@example.com")
+        self.first = User.objects.create_user("first", email="first@example.com")
+        self.second = User.objects.create_user("second", email="second@example.com")
+        self.listing = make_listing(self.poster)
+
+    def bid_war(self):
+        place_bid(self.listing.id, self.first, Decimal("20.00"))
+        place_bid(self.listing.id, self.second, Decimal("25.00"))
+        close_listing(self.listing.id)
+
+    def test_events_are_written_with_the_bid_or_close(self):
+        self.bid_war()
+        self.assertEqual(
+            list(OutboxEvent.objects.order_by("id").values_list("kind", flat=True)),
+            [OutboxEvent.BID, OutboxEvent.BID, OutboxEvent.CLOSED],
+        )
+        # The displaced bidder is worked out by the dispatcher
+        first, second = OutboxEvent.objects.filter(kind=OutboxEvent.BID).order_by("id")
+        self.assertEqual(notifications(first), [])
+        self.assertEqual([n.recipient for n in notifications(second)], [self.first])
+
+        # Nothing is recorded for a bid that is rolled back, or when
+        # notifications are off
+        other = make_listing(self.poster, title="Other")
+        place_bid(other.id, self.first, Decimal("20.00"))
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            place_bid(other.id, self.second, Decimal("25.00"))
+            raise RuntimeError
+        with self.settings(AUCTIONS_NOTIFICATIONS=False):
+            place_bid(other.id, self.second, Decimal("25.00"))
+        self.assertEqual(OutboxEvent.objects.count(), 4)
+
+    def test_bid_beaten_by_a_proxy_tells_nobody(self):
+        place_proxy_bid(self.listing.id, self.first, Decimal("100.00"))
+        place_bid(self.listing.id, self.second, Decimal("20.00"))
+        self.assertEqual(
+            place_bid(self.listing.id, self.second, Decimal("60.00")).status, BidResult.OUTBID,
+        )
+        dispatch_outbox()
+        self.assertEqual(mail.outbox, [])
+
+        # Only a bid that takes the lead tells the leader it displaced
+        place_bid(self.listing.id, self.second, Decimal("150.00"))
+        dispatch_outbox()
+        self.assertEqual([message.to for message in mail.outbox], [["first@example.com"]])
+        self.assertIn("over your $61.00", mail.outbox[0].body)
+
+    def test_dispatch_sends_outbid_won_and_closed_once(self):
+        self.bid_war()
+        self.assertEqual(dispatch_outbox(), (3, 0))
+
+        self.assertEqual(
+            [(message.to, message.subject) for message in mail.outbox],
+            [
+                (["first@example.com"], "You've been outbid on Gundam"),
+                (["poster@example.com"], "Gundam has sold"),
+                (["second@example.com"], "You won Gundam"),
+            ],
+        )
+        self.assertFalse(OutboxEvent.objects.filter(dispatched_at__isnull=True).exists())
+        self.assertEqual(dispatch_outbox(), (0, 0))
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_failed_deliveries_are_retried_without_repeats(self):
+        self.bid_war()
+        sink = RecordingSink(fail=["second"])
+        now = timezone.now()
+
+        with self.assertLogs("auctions.outbox", "WARNING"):
+            self.assertEqual(dispatch_batch(now=now, sinks=[sink]), (2, 1))
+        failed = OutboxEvent.objects.get(kind=OutboxEvent.CLOSED)
+        self.assertEqual((failed.attempts, failed.last_error), (1, "ConnectionError: sink unavailable"))
+        self.assertEqual(dispatch_batch(now=now, sinks=[sink]), (0, 0))
+
+        self.assertEqual(dispatch_batch(now=now + timedelta(seconds=61), sinks=[sink]), (1, 0))
+        # The poster's delivery went through the first time and isn't repeated
+        self.assertEqual(len(sink.keys), len(set(sink.keys)))
+        self.assertEqual(
+            sorted(key.rsplit(":", 2)[1] for key in sink.keys if key.startswith("closed:")),
+            sorted([str(self.poster.id), str(self.second.id)]),
+        )
+
+    def test_claimed_events_are_not_sent_twice(self):
+        self.bid_war()
+        now = timezone.now()
+        # Another dispatcher has claimed the first event
+        claimed = _claim(2, now)
+        sink = RecordingSink()
+        self.assertEqual(dispatch_batch(now=now, sinks=[sink]), (1, 0))
+        self.assertFalse(any(key.startswith(claimed[0].key + ":") for key in sink.keys))
+
+        # If that dispatcher dies, the event is due again once the claim runs out
+        later = now + timedelta(seconds=301)
+        self.assertEqual(dispatch_batch(now=later, sinks=[sink]), (2, 0))
+        self.assertFalse(OutboxEvent.objects.exclude(claimed_by="").exists())
+
+    @override_settings(AUCTIONS_OUTBOX_MAX_ATTEMPTS=2)
+    def test_events_out_of_attempts_are_failed(self):
+        self.bid_war()
+        now = timezone.now()
+        with self.assertLogs("auctions.outbox", "WARNING"):
+            dispatch_batch(now=now, sinks=[RecordingSink(fail=["second"])])
+        with self.assertLogs("auctions.outbox", "ERROR") as logs:
+            sink = RecordingSink(fail=["second"])
+            self.assertEqual(dispatch_batch(now=now + timedelta(days=1), sinks=[sink]), (0, 1))
+        self.assertIn("Giving up on closed:", logs.output[0])
+
+        failed = failed_events().get()
+        self.assertEqual((failed.kind, failed.attempts), (OutboxEvent.CLOSED, 2))
+        self.assertEqual(dispatch_batch(now=now + timedelta(days=2), sinks=[sink]), (0, 0))
+        self.assertEqual(purge_failed(now + timedelta(days=2)), 1)
+        self.assertFalse(failed_events().exists())
+
+    def test_webhook_sink_posts_with_idempotency_key(self):
+        received = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                received.append((self.headers["Idempotency-Key"], json.loads(body)))
+                self.send_response(204)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        server = HTTPServer(("127.0.0.1", 0), Handler)
+        thread = threading.Thread(target=server.handle_request)
+        thread.start()
+        self.addCleanup(server.server_close)
+
+        place_bid(self.listing.id, self.first, Decimal("20.00"))
+        place_bid(self.listing.id, self.second, Decimal("25.00"))
+        event = OutboxEvent.objects.last()
+        with self.settings(AUCTIONS_WEBHOOK_URL=f"http://127.0.0.1:{server.server_port}/"):
+            WebhookSink().send(Notification(event, self.first, "Subject", "Body"), "bid:1:2:webhook")
+        thread.join()
+
+        key, body = received[0]
+        self.assertEqual(key, "bid:1:2:webhook")
+        self.assertEqual((body["recipient"], body["listing"], body["key"]), ("first", self.listing.id, key))
+
+
+@override_settings(
+    AUCTIONS_RATE_LIMITING=True,
+    AUCTIONS_RATE_LIMITS={"bid": {"user": (1, 2), "listing": (1, 3)}, "comment": {"user": (0.1, 1)}},
+)
+class RateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+        # Empty buckets for each test
+        get_limiter.cache_clear()
+        self.poster = User.objects.create_user("poster")
+        self.bidders = [User.objects.create_user(f"bidder{i}") for i in range(2)]
+        self.listing = make_listing(self.poster)
+
+    def post_bid(self, bidder, amount):
+        self.client.force_login(bidder)
+        return self.client.post(reverse("bid", args=[self.listing.id]), {"bid_amount": amount})
+
+    def test_token_bucket(self):
+        # One token a second, a burst of two
+        bucket = [("key", 1.0, 2.0)]
+        full_at, _ = _take(bucket, [None], 100.0)
+        full_at, _ = _take(bucket, full_at, 100.0)
+        self.assertEqual(full_at, [102.0])
+        self.assertEqual(_take(bucket, full_at, 100.0), (None, ("key", 1.0)))
+        self.assertEqual(_take(bucket, full_at, 101.0), ([103.0], None))
+
+        # An empty bucket takes nothing from the others
+        buckets = [("user", 1.0, 5.0), ("listing", 1.0, 1.0)]
+        self.assertEqual(_take(buckets, [None, 101.0], 100.0), (None, ("listing", 1.0)))
+
+    def test_bids_over_the_limit_get_429(self):
+        self.assertEqual(self.post_bid(self.bidders[0], "11.00").status_code, 200)
+        self.assertEqual(self.post_bid(self.bidders[0], "12.00").status_code, 200)
+        response = self.post_bid(self.bidders[0], "13.00")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "1")
+        self.assertEqual(Bid.objects.count(), 2)
+        # Only posts are limited
+        self.assertEqual(self.client.get(reverse("bid", args=[self.listing.id])).status_code, 200)
+
+        # The next bidder has their own bucket, until the listing's runs out
+        self.assertEqual(self.post_bid(self.bidders[1], "14.00").status_code, 200)
+        self.assertEqual(self.post_bid(self.bidders[1], "15.00").status_code, 429)
+        self.assertEqual(registry.rejected, {("bid", "user"): 1, ("bid", "listing"): 1})
+
+        response = self.client.get(reverse("metrics"))
+        self.assertIn('auctions_rate_limited_total{action="bid",scope="listing"} 1', response.content.decode())
+
+    def test_api_and_comments_are_limited(self):
+        self.client.force_login(self.bidders[0])
+        url = reverse("api_listing_bids", args=[self.listing.id])
+        for amount in ("11.00", "12.00"):
+            self.assertEqual(self.client.post(url, {"amount": amount}).status_code, 201)
+        response = self.client.post(url, {"amount": "13.00"})
+        self.assertEqual((response.status_code, response["Retry-After"]), (429, "1"))
+        self.assertEqual(response.json(), {"error": "Too many requests"})
+
+        url = reverse("comment", args=[self.listing.id])
+        self.client.post(url, {"comment": "First"})
+        response = self.client.post(url, {"comment": "Second"})
+        self.assertEqual((response.status_code, response["Retry-After"]), (429, "10"))
+        self.assertEqual(Comment.objects.count(), 1)
+
+    def test_backends(self):
+        # Separate instances share buckets through the cache, like workers
+        bucket = [(("bid", "user", 1), 1.0, 2.0)]
+        self.assertIsNone(CacheBackend().take(bucket))
+        self.assertIsNone(CacheBackend().take(bucket))
+        self.assertEqual(CacheBackend().take(bucket)[0], ("bid", "user", 1))
+
+        local = LocalBackend()
+        self.assertIsNone(local.take(bucket))
+        self.assertIsNone(local.take(bucket))
+        self.assertIsNotNone(local.take(bucket))
+        self.assertIsNone(LocalBackend().take(bucket))
+
+        with override_settings(AUCTIONS_RATE_LIMITING=False):
+            for amount in ("11.00", "12.00", "13.00"):
+                self.assertEqual(self.post_bid(self.bidders[0], amount).status_code, 200)
 
-# Create your tests here.
@@ -0,0 +1,305 @@
+import csv
+import json
+from decimal import Decimal
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .categories import invalidate_category_counts
+from .models import (
+    ArchivedBid, ArchivedComment, ArchivedWatchlist, Bid, Category, Comment, Listing, User, Watchlist,
+)
+
+# Bulk export and import of listings, bids, comments and watchlists as
+# JSON Lines or CSV, one file per kind of record. The archived bids,
+# comments and watchlists of long-closed listings, see auctions.archive,
+# are kinds of their own, and listings keep their archived_at, so an
+# archived listing comes back archived with its history.
+#
+# Exports stream each table in id order through iterator(), which uses a
+# server-side cursor where the database has them, so memory use doesn't
+# depend on the size of the table. Users are written by username and
+# listings by their id in the exported database.
+#
+# Imports read a batch of records at a time, validate them with the model
+# fields, create any users they mention and write each batch with one
+# bulk_create in its own transaction. Listings get new ids, which are
+# remembered so the bids, comments and watchlists imported after them point
+# at the right listing. Invalid records are skipped and reported.
+
+FORMATS = ["jsonl", "csv"]
+
+# Import order, so listings exist before anything that refers to them
+KINDS = ["listings", "bids", "comments", "watchlists", "archived_bids", "archived_comments", "archived_watchlists"]
+ARCHIVED_KINDS = KINDS[4:]
+
+EXPORT_CHUNK_SIZE = 2000
+IMPORT_BATCH_SIZE = 5000
+
+# Exported columns of each kind, and the queryset path each is read from
+COLUMNS = {
+    "listings": {
+        "id": "id",
+        "title": "list_title",
+        "description": "description",
+        "category": "category_id",
+        "poster": "poster_id__username",
+        "starting_bid": "starting_bid",
+        "highest_bid": "highest_bid",
+        "high_bidder": "high_bidder__username",
+        "image_url": "image_url",
+        "active": "active",
+        "ends_at": "ends_at",
+        "bid_count": "bid_count",
+        "unique_bidders": "unique_bidders",
+        "last_bid_at": "last_bid_at",
+        "closed_at": "closed_at",
+        "archived_at": "archived_at",
+    },
+    "bids": {
+        "id": "id",
+        "listing": "listing_id_id",
+        "bidder": "bidder_id__username",
+        "amount": "bid_amount",
+        "created": "created",
+    },
+    "comments": {
+        "id": "id",
+        "listing": "listing_id_id",
+        "user": "user_id__username",
+        "comment": "comment",
+        "created": "created",
+    },
+    "watchlists": {
+        "listing": "listing_id_id",
+        "user": "user_id__username",
+    },
+}
+
+# The archive tables have the same columns as the tables they archive
+COLUMNS.update((f"archived_{kind}", COLUMNS[kind]) for kind in ("bids", "comments", "watchlists"))
+
+MODELS = {
+    "listings": Listing,
+    "bids": Bid,
+    "comments": Comment,
+    "watchlists": Watchlist,
+    "archived_bids": ArchivedBid,
+    "archived_comments": ArchivedComment,
+    "archived_watchlists": ArchivedWatchlist,
+}
+
+
+def filename(kind, fmt):
+    return f"{kind}.{fmt}"
+
+
+# Dates in full ISO 8601 and decimals as strings, so nothing is rounded
+def _plain(value):
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return int(value)
+    return _plain(value)
+
+
+# Write every record of a kind to a text stream. Returns the number written.
+def export_records(kind, stream, fmt="jsonl", chunk_size=EXPORT_CHUNK_SIZE):
+    columns = COLUMNS[kind]
+    rows = MODELS[kind].objects.order_by("id").values_list(*columns.values()).iterator(chunk_size=chunk_size)
+
+    count = 0
+    if fmt == "csv":
+        writer = csv.writer(stream)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow([_csv_value(value) for value in row])
+            count += 1
+    else:
+        for row in rows:
+            stream.write(json.dumps(dict(zip(columns, map(_plain, row))), separators=(",", ":")) + "\n")
+            count += 1
+    return count
+
+
+# (line number, record) for each record in a text stream
+def read_records(stream, fmt="jsonl"):
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+    else:
+        for line_number, line in enumerate(stream, 1):
+            if line.strip():
+                yield line_number, json.loads(line)
+
+
+class ImportResult:
+    def __init__(self, kind):
+        self.kind = kind
+        self.imported = 0
+        self.errors = []
+
+    def __repr__(self):
+        return f"<ImportResult {self.kind}: {self.imported} imported, {len(self.errors)} errors>"
+
+
+# State shared by the imports of one run: usernames and exported listing ids
+# mapped to ids in this database
+class Importer:
+    def __init__(self, batch_size=IMPORT_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.users = {}
+        self.listings = {}
+        self.categories = set(Category.objects.values_list("name", flat=True))
+
+    # Import a stream of one kind of record. Returns an ImportResult.
+    def run(self, kind, stream, fmt="jsonl"):
+        result = ImportResult(kind)
+        records = read_records(stream, fmt)
+        while True:
+            batch = list(islice(records, self.batch_size))
+            if not batch:
+                break
+            self._import_batch(kind, batch, result)
+        result.errors.sort()
+        if kind == "listings":
+            invalidate_category_counts()
+        return result
+
+    def _import_batch(self, kind, batch, result):
+        self._load_users(kind, [record for _, record in batch])
+        build = getattr(self, f"_build_{kind[:-1]}")
+        # (line number, exported listing id, object) of each valid record
+        valid = []
+        for line_number, record in batch:
+            try:
+                source = int(record["id"]) if kind == "listings" else None
+                valid.append((line_number, source, build(record)))
+            except (KeyError, TypeError, ValueError, ValidationError) as error:
+                result.errors.append((line_number, _describe(error)))
+
+        if kind == "listings":
+            valid = self._unique_titles(valid, result)
+
+        # Databases that return ids from bulk inserts fill in the listings'
+        # new ids here
+        with transaction.atomic():
+            created = MODELS[kind].objects.bulk_create(
+                [obj for _, _, obj in valid], ignore_conflicts=kind == "watchlists"
+            )
+        if kind == "listings":
+            self.listings.update((source, listing.pk) for _, source, listing in valid)
+        result.imported += len(created)
+
+    # Create the users a batch mentions that don't exist yet, with no usable
+    # password, in two queries
+    def _load_users(self, kind, records):
+        fields = [column for column in COLUMNS[kind] if column in ("poster", "high_bidder", "bidder", "user")]
+        names = {record.get(field) for record in records for field in fields} - set(self.users) - {None, ""}
+        if not names:
+            return
+        self.users.update(User.objects.filter(username__in=names).values_list("username", "id"))
+        missing = names - set(self.users)
+        if missing:
+            created = User.objects.bulk_create([User(username=name, password="!") for name in missing])
+            self.users.update((user.username, user.pk) for user in created)
+
+    def _user(self, record, column):
+        try:
+            return self.users[record[column]]
+        except KeyError:
+            raise ValueError(f"Missing {column}")
+
+    def _listing(self, record):
+        try:
+            return self.listings[int(record["listing"])]
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"Unknown listing {record.get('listing')!r}")
+
+    def _build_listing(self, record):
+        if record.get("category", "None") not in self.categories:
+            raise ValueError(f"Unknown category {record.get('category')!r}")
+        return Listing(
+            poster_id_id=self._user(record, "poster"),
+            high_bidder_id=self._user(record, "high_bidder"),
+            category_id=record.get("category", "None"),
+            **_clean(Listing, record, COLUMNS["listings"], exclude=("id", "category", "poster", "high_bidder")),
+        )
+
+    def _build_bid(self, record, model=Bid):
+        return model(
+            listing_id_id=self._listing(record),
+            bidder_id_id=self._user(record, "bidder"),
+            **_clean(model, record, COLUMNS["bids"], exclude=("id", "listing", "bidder")),
+        )
+
+    def _build_comment(self, record, model=Comment):
+        return model(
+            listing_id_id=self._listing(record),
+            user_id_id=self._user(record, "user"),
+            **_clean(model, record, COLUMNS["comments"], exclude=("id", "listing", "user")),
+        )
+
+    def _build_watchlist(self, record, model=Watchlist):
+        return model(listing_id_id=self._listing(record), user_id_id=self._user(record, "user"))
+
+    def _build_archived_bid(self, record):
+        return self._build_bid(record, ArchivedBid)
+
+    def _build_archived_comment(self, record):
+        return self._build_comment(record, ArchivedComment)
+
+    def _build_archived_watchlist(self, record):
+        return self._build_watchlist(record, ArchivedWatchlist)
+
+    # Titles must be unique, in the batch and against what is already stored
+    def _unique_titles(self, valid, result):
+        titles = [listing.list_title for _, _, listing in valid]
+        taken = set(Listing.objects.filter(list_title__in=titles).values_list("list_title", flat=True))
+        kept = []
+        for line_number, source, listing in valid:
+            if listing.list_title in taken:
+                result.errors.append((line_number, f"Title {listing.list_title!r} already exists"))
+                continue
+            taken.add(listing.list_title)
+            kept.append((line_number, source, listing))
+        return kept
+
+
+# Model field values from a record's columns, converted and checked against
+# the field's validators (lengths, decimal places). Blank values are None
+# for fields that allow it, CSV can't tell the two apart. Unlike form
+# validation, blank strings are accepted, as the database accepts them.
+def _clean(model, record, columns, exclude=()):
+    values = {}
+    for column, path in columns.items():
+        if column in exclude or column not in record:
+            continue
+        field = model._meta.get_field(path)
+        value = record[column]
+        if value == "" and field.null:
+            value = None
+        if value is None and not field.null:
+            raise ValidationError(f"{column} can't be empty")
+        value = field.to_python(value)
+        field.run_validators(value)
+        values[field.attname] = value
+    return values
+
+
+def _describe(error):
+    if isinstance(error, ValidationError):
+        return "; ".join(error.messages)
+    if isinstance(error, KeyError):
+        return f"Missing {error.args[0]}"
+    return str(error)
@@ -1,21 +1,38 @@
+from django.conf import settings
 from django.urls import path
 from django import forms
-from . import views
+from . import api, views, async_views
+from .metrics import metrics_view
+
+# Read-only pages have async versions for when the site is served over ASGI
+reads = async_views if settings.AUCTIONS_ASYNC_VIEWS else views
 
 urlpatterns = [
-    path("", views.index, name="index"),
+    path("", reads.index, name="index"),
     path("login", views.login_view, name="login"),
     path("logout", views.logout_view, name="logout"),
     path("register", views.register, name="register"),
     path("create", views.create_new, name="create"),
-    path("<str:title>/$", views.listing, name="listing"),   # /$ to terminate url pattern
-    path("watchlist_add/<str:title>", views.watchlist_add, name="watchlist_add"),
-    path("watchlist_remove/<str:title>", views.watchlist_remove, name="watchlist_remove"),
-    path("watchlist_view", views.watchlist_view, name="watchlist_view"),
-    path("bid/<str:title>", views.bid, name="bid"),
-    path("close/<str:title>", views.close, name="close"),
-    path("closed", views.closed, name="closed"),
-    path("comment/<str:title>/$", views.comment, name="comment"),
-    path("category/<str:category>", views.category, name="category"),
-    path("categories", views.categories, name="categories")
+    path("listing/<int:listing_id>/<slug:slug>", reads.listing, name="listing"),
+    path("watchlist_add/<int:listing_id>", views.watchlist_add, name="watchlist_add"),
+    path("watchlist_remove/<int:listing_id>", views.watchlist_remove, name="watchlist_remove"),
+    path("watchlist_view", reads.watchlist_view, name="watchlist_view"),
+    path("bid/<int:listing_id>", views.bid, name="bid"),
+    path("close/<int:listing_id>", views.close, name="close"),
+    path("closed", reads.closed, name="closed"),
+    path("comment/<int:listing_id>", views.comment, name="comment"),
+    path("comments/<int:listing_id>", views.comments, name="comments"),
+    path("category/<str:category>", reads.category, name="category"),
+    path("categories", reads.categories, name="categories"),
+    path("search", views.search, name="search"),
+    path("thumbnails/<int:listing_id>/<str:size>/<slug:digest>.jpg", views.thumbnail, name="thumbnail"),
+    path("metrics", metrics_view, name="metrics"),
+    path("api/listings", api.listings, name="api_listings"),
+    path("api/listings/<int:listing_id>", api.listing_detail, name="api_listing"),
+    path("api/listings/<int:listing_id>/bids", api.listing_bids, name="api_listing_bids"),
+    path("api/listings/<int:listing_id>/comments", api.listing_comments, name="api_listing_comments"),
+    path("api/watchlist", api.watchlist, name="api_watchlist"),
+    path("api/watchlist/<int:listing_id>", api.watchlist_entry, name="api_watchlist_entry"),
+    # Listing pages by title, as they were linked before
+    path("<str:title>/$", views.listing_by_title, name="listing_by_title"),
 ]
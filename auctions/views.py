@@ -1,39 +1,49 @@
 from django.contrib.auth import authenticate, login, logout
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
 from django.db import IntegrityError
-from django.http import HttpResponse, HttpResponseRedirect
+from django.http import FileResponse, Http404, HttpResponse, HttpResponsePermanentRedirect, HttpResponseRedirect
 from django.shortcuts import render
 from django.urls import reverse
 from django import forms
 from .models import *
+from .bidding import place_bid, place_proxy_bid
+from .queries import listing_summaries
+from .pagination import paginate
+from .streaming import stream_rows
+from .categories import category_counts, category_names
+from .cache import get_listing_snapshot, get_snapshot_by_id, listing_conditional
+from .comments import render_comments
+from .closing import close_listing
+from .images import thumbnail_file
+from .loaders import listing_required
+from .ratelimit import rate_limited
+from .routers import replica_reads
+from .search import search_listings
+from .watchlist import unwatch, watch, watched_entries, watched_ids
 from django.contrib.auth.decorators import login_required
 from django.forms import ModelForm
-
-CATEGORIES= [
-    ('Art', 'Art'),
-    ('Business', 'Business'),
-    ('Collectibles', 'Collectibles'),
-    ('Electronics', 'Electronics'),
-    ('Fashion', 'Fashion'), 
-    ('Garden', 'Garden'),
-    ('Home', 'Home'),
-    ('Industrial', 'Industrial'), 
-    ('Motors', 'Motors'),
-    ('Outdoors', 'Outdoors'),
-    ('Sports', 'Sports'),
-    ('Toys', 'Toys'), 
-    ('None', 'None')
-    ]
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
 
 # Form for creating a new listing
 class NewListingForm(ModelForm):
     class Meta:
         model = Listing
-        fields = ['list_title', 'description', 'starting_bid', 'category_id', 'image_url']
+        fields = ['list_title', 'description', 'starting_bid', 'category', 'image_url', 'ends_at']
+        widgets = {'ends_at': forms.DateTimeInput(attrs={'type': 'datetime-local'})}
+
+    # An end time already past would have the listing closed on the next sweep
+    def clean_ends_at(self):
+        ends_at = self.cleaned_data['ends_at']
+        if ends_at is not None and ends_at <= timezone.now():
+            raise forms.ValidationError("The end time must be in the future.")
+        return ends_at
 
 # Form for bidding on an auction
 class NewBidForm(forms.Form):
     bid_amount = forms.DecimalField(widget=forms.TextInput(attrs={'size':20}), label = "Enter your bid   ", max_digits=10, decimal_places=2)
+    proxy = forms.BooleanField(required=False, label="Bid for me up to this amount")
 
 # Form for adding a comment
 class NewCommentForm(forms.Form):
@@ -41,45 +51,69 @@ class NewCommentForm(forms.Form):
 
 
 
+# Render a page of listing summaries, either one cursor page at a time or,
+# with ?stream=1, every listing streamed in chunks
+def listing_page(request, template, listings, context):
+    if request.GET.get("stream"):
+        return stream_rows(request, template, context, listings, "auctions/listing_summary.html")
+
+    page = paginate(listings, request.GET.get("cursor"))
+    context.update({"listings": page, "page": page})
+    return render(request, template, context)
+
+
 # Main active listing page
+@replica_reads
 def index(request):
-    active_listings = Listing.objects.filter(active=True)
-    bids = Bid.objects.all()
+    active_listings = listing_summaries(active=True)
 
-    return render(request, "auctions/index.html", {
-        "listings": active_listings, "bids": bids
-    })
+    return listing_page(request, "auctions/index.html", active_listings, {})
 
 
 # Closed listings page
+@replica_reads
 def closed(request):
-    closed_listings = Listing.objects.filter(active=False)
+    closed_listings = listing_summaries(active=False)
 
-    return render(request, "auctions/closed.html", {
-        "listings": closed_listings
-    })
+    return listing_page(request, "auctions/closed.html", closed_listings, {})
 
 
 # View listings by Category
+@replica_reads
 def category(request, category):
-    category_listings = Listing.objects.filter(category_id=category).filter(active=True)
-    #listings = [i[1] for i in CATEGORIES]
+    category_listings = listing_summaries(category_id=category, active=True)
 
-    return render(request, "auctions/category.html", {
-        "listings": category_listings, "category": category
+    return listing_page(request, "auctions/category.html", category_listings, {
+        "category": category
     })
 
 
-# View categories
+# View categories with their active listing counts
 def categories(request):
-    categories = [] 
-
-    categories = [i[1] for i in CATEGORIES]
-
     return render(request, "auctions/categories.html", {
-        "categories": categories
+        "categories": category_counts()
+    })
+
+# Search listings by title and description
+@replica_reads
+def search(request):
+    query = request.GET.get("q", "")
+    category = request.GET.get("category") or None
+    status = request.GET.get("status", "active")
+    active = {"active": True, "closed": False}.get(status)
+
+    results = search_listings(query, category=category, active=active, cursor=request.GET.get("cursor"))
+
+    return render(request, "auctions/search.html", {
+        "query": query,
+        "category": category,
+        "status": status,
+        "categories": category_names(),
+        "listings": results,
+        "page": results,
     })
 
+
 # Login to existing account
 def login_view(request):
     if request.method == "POST":
@@ -151,12 +185,19 @@ def create_new(request):
                 starting_bid = new_input.cleaned_data["starting_bid"],
                 highest_bid = new_input.cleaned_data["starting_bid"],
                 high_bidder = request.user,
-                category_id = new_input.cleaned_data["category_id"],
+                category = new_input.cleaned_data["category"],
                 image_url = new_input.cleaned_data["image_url"],
+                ends_at = new_input.cleaned_data["ends_at"],
                 active = True
                 )
             new_listing.save()
 
+        # Titles are unique, so show the form again with the errors
+        else:
+            return render(request, "auctions/create.html", {
+                "form": new_input
+            })
+
         # Display the index    
         return HttpResponseRedirect(reverse("index"))
 
@@ -166,229 +207,149 @@ def create_new(request):
         })
 
 
-# Call up the listing for this title
-def listing(request, title):
-    in_list = False     # Default to indicate title not in users watchlist     
+# Render the listing page. The listing and the first page of comments come
+# from the versioned listing cache, only the user's watchlist flag is looked up per request
+def render_listing(request, snapshot, message=None):
+    # Check if title is in the logged in user's watchlist
+    in_list = snapshot.listing.id in watched_ids(request)
 
-    # Try to get the listing
-    try:
-        listing = Listing.objects.get(list_title=title)
-        
-        # Check if user is logged in or not   
-        if request.user.is_anonymous:
-            pass
-        else:
-            logged_user = request.user      # Get user id
-            watchlist = Watchlist.objects.filter(user_id=logged_user)   # Get users watchlist
-            
-            # Check user has a watchlist
-            if watchlist:
-                # Check if title is in the watchlist
-                if watchlist.filter(listing_id=listing.id):
-                    in_list = "True"    # Indicate title is in users watchlist
-                else:
-                    pass  
-
-        # Get the highest bid
-        highest_bid = listing.highest_bid
-    
-        # Create a new bid form
-        bid_form = NewBidForm()  
-
-        # Create a new comment form     
-        comment_form = NewCommentForm()
-        
-        comments = Comment.objects.filter(listing_id=listing.id)         # Get the comments
-
-        # Send listing, title status, bid form and highest bid
-        return render(request, "auctions/listing.html", {
-            "listing": listing, 
-            "in_list": in_list,  
-            "highest_bid": highest_bid,
-            "bid_form": bid_form,
-            "comments": comments,
-            "comment_form": comment_form,            
-        })        
+    # Send listing, comments, title status and the bid and comment forms
+    return render(request, "auctions/listing.html", {
+        "listing": snapshot.listing,
+        "comments": render_comments(snapshot.listing.id, archived=snapshot.listing.archived),
+        "version": snapshot.version,
+        "cache_timeout": settings.AUCTIONS_LISTING_CACHE_TIMEOUT,
+        "in_list": in_list,
+        "message": message,
+        "bid_form": NewBidForm(),
+        "comment_form": NewCommentForm(),
+    })
+
+
+# Call up the listing for this id
+@replica_reads
+@listing_required
+def listing(request, listing_id):
+    return render_listing(request, request.snapshot)
+
+
+# Listing pages used to be found by title. Send old links to the listing's
+# page, the title to id mapping is cached.
+def listing_by_title(request, title):
+    snapshot = get_listing_snapshot(title)
 
     # Do nothing if listing doesn't exist
-    except Listing.DoesNotExist:
+    if snapshot is None:
         return HttpResponseRedirect(reverse("index"))
 
+    return HttpResponsePermanentRedirect(snapshot.listing.get_absolute_url())
+
 
 # if user logged in, try to add the listing to their watchlist
 @login_required
-def watchlist_add(request, title):     
-    listing = Listing.objects.get(list_title=title)             # Get the listing
-    logged_user = request.user                                  # Get the user's id
-    users_list = Watchlist.objects.filter(user_id=logged_user)  # Get the users watchlist
-    comments = Comment.objects.filter(listing_id=listing.id)         # Get the comments   
-    comment_form = NewCommentForm()     # Create a new comment form     
-    
-    # Check if the user has this title in the watchlist
-    if users_list.filter(listing_id=listing.id):
-        message = str(title) + " is already in your watchlist"    # Let user know its already there
-        in_list = "True"
+@listing_required
+def watchlist_add(request, listing_id):
+    snapshot = request.snapshot
+    title = snapshot.listing.list_title
 
+    # Add listing to the watchlist, unless the user already has it there
+    if not watch(request, listing_id):
+        message = str(title) + " is already in your watchlist"    # Let user know its already there
 
         # Send back to listing page with message
-        return render(request, "auctions/listing.html", {
-            "listing": listing, 
-            "in_list": in_list, 
-            "message": message, 
-            "title": title,
-            "comments": comments,
-            "comment_form": comment_form
-        })
+        return render_listing(request, snapshot, message)
+
+    message = str(title) + " has been added to your watchlist"    # Let user know its been added
 
-    # Add listing to the watchlist
-    else:
-        watch = Watchlist(
-            user_id = logged_user,
-            listing_id = listing
-        )
-        watch.save()     
-        message = str(title) + " has been added to your watchlist"    # Let user know its been added
-    
     # Send the users watchlist to the template
     return render(request, "auctions/watchlist.html", {
-        "users_list": users_list, "message": message, "title": title    
+        "users_list": watched_entries(request.user), "message": message, "title": title
     })
 
 
 # If user logged in, try to remove the listing from their watchlist
 @login_required
-def watchlist_remove(request, title):     
-    listing = Listing.objects.get(list_title=title)             # Get the listing
-    logged_user = request.user                                  # Get the user's id
-    to_remove = Watchlist.objects.filter(user_id=logged_user, listing_id=listing)  # Get the listing from users watchlist
-    
+@listing_required
+def watchlist_remove(request, listing_id):
+    title = request.snapshot.listing.list_title
+
     # Remove listing from the watchlist
-    to_remove.delete()  
+    unwatch(request, listing_id)
 
     # Advise listing removed
     message = str(title) + " has been removed from your watchlist"     
-    in_list = "False"   
-    
-    users_list = Watchlist.objects.filter(user_id=logged_user)  # Get the users updated watchlist
 
-    # Send the users watchlist to the template
+    # Send the users updated watchlist to the template
     return render(request, "auctions/watchlist.html", {
-        "users_list": users_list, "message": message, "title": title
+        "users_list": watched_entries(request.user), "message": message, "title": title
     })
 
 
 # View users watchlist
 @login_required
 def watchlist_view(request):     
-    logged_user = request.user      # Get the user's id 
-
-    try:
-        users_titles = Watchlist.objects.filter(user_id=logged_user)  # Get the users watchlist
-    except Watchlist.DoesNotExist:
-        users_titles = None
-
-    if users_titles is None:
-        message = "List is empty"
-        return render(request, "auctions/watchlist.html", {
-            "message": message
-        })
-    else:
-        # Send the users watchlist to the template
-        return render(request, "auctions/watchlist.html", {
-            "users_list": users_titles
-        })
-
+    # Send the users watchlist to the template
+    return render(request, "auctions/watchlist.html", {
+        "users_list": watched_entries(request.user)
+    })
 
 
 # Bid on an item
 @login_required
-def bid(request, title):
+@rate_limited("bid")
+@listing_required
+def bid(request, listing_id):
     logged_user = request.user      # Get the user's id 
-    listing = Listing.objects.get(list_title=title)         # Get the listing
-    users_list = Watchlist.objects.filter(user_id=logged_user)  # Get the users watchlist
-    in_list = "False"
+    snapshot = request.snapshot
     message = None
 
     # Validate submitted bid
     if request.method == "POST":        
         new_input = NewBidForm(request.POST)
 
-    if new_input.is_valid():    
-        # Check the bid is higher than current highest bid
-        new_bid = new_input.cleaned_data["bid_amount"]
-
-        if new_bid > listing.highest_bid:
-            # Add the bid to the bid db
-            bid = Bid(
-                listing_id = listing,
-                bidder_id = logged_user,
-                bid_amount = new_bid
-                )
-            bid.save() 
-
-            # Update the listing's highest_bid and bidder
-            listing.highest_bid = bid.bid_amount
-            listing.high_bidder = bid.bidder_id
-            listing.save()
-
-            message = "Your bid has been accepted"
-        else:
-            message = "New bid must be higher than the current price"
-  
-    # Create a new bid form
-    bid_form = NewBidForm()   
-
-    # Create a new comment form     
-    comment_form = NewCommentForm()
-
-    # Check if the user has this title in the watchlist
-    if users_list.filter(listing_id=listing.id):
-        in_list = "True"
+        if new_input.is_valid():    
+            # Place the bid, it is only accepted if higher than the current highest bid.
+            # As a proxy bid the amount is a hidden maximum we bid up to as needed.
+            place = place_proxy_bid if new_input.cleaned_data["proxy"] else place_bid
+            result = place(listing_id, logged_user, new_input.cleaned_data["bid_amount"])
+            message = result.message
 
-    comments = Comment.objects.filter(listing_id=listing.id)
+            # Reload the listing if the bid changed it
+            if result.placed:
+                snapshot = get_snapshot_by_id(listing_id)
 
     # Go back to listing 
-    return render(request, "auctions/listing.html", {
-        "listing": listing, 
-        "in_list": in_list,  
-        "message": message,
-        "bid_form": bid_form,
-        "comments": comments,
-        "comment_form": comment_form
-    })
+    return render_listing(request, snapshot, message)
 
 
 # Close an auction listing
 @login_required
-def close(request, title):
+@listing_required
+def close(request, listing_id):
     logged_user = request.user      # Get the user's id 
-    listing = Listing.objects.get(list_title=title)         # Get the listing            
-    comment_form = NewCommentForm()          # Create a new comment form
-
-
-    if logged_user == listing.poster_id:
-        # Close the auction
-        listing.active = False
-        listing.save()
+    snapshot = request.snapshot
+    message = None
 
-        message = "This auction has been closed. " + str(listing.high_bidder) + " won the auction."
+    if logged_user.id == snapshot.listing.poster_id_id:
+        # Close the auction and record the winner
+        close_listing(listing_id)
 
-    comments = Comment.objects.filter(listing_id=listing.id)
+        snapshot = get_snapshot_by_id(listing_id)
+        if snapshot.listing.bid_count:
+            message = "This auction has been closed. " + str(snapshot.listing.high_bidder) + " won the auction."
+        else:
+            message = "This auction has been closed without any bids."
 
     # Go back to listing 
-    return render(request, "auctions/listing.html", {
-        "listing": listing, 
-        "message": message,
-        "comments": comments,
-        "comment_form": comment_form
-    })
+    return render_listing(request, snapshot, message)
 
 # Add a comment
 @login_required
-def comment(request, title):
+@rate_limited("comment")
+@listing_required
+def comment(request, listing_id):
     logged_user = request.user      # Get the user's id 
-    listing = Listing.objects.get(list_title=title)         # Get the listing
-    comment_form = NewCommentForm()          # Create a new comment form
+    snapshot = request.snapshot
 
     if request.method == "POST":        
         new_input = NewCommentForm(request.POST)
@@ -399,16 +360,45 @@ def comment(request, title):
             # Add the comment to the comment db
             new_comment = Comment(
                 user_id = logged_user,
-                listing_id = listing,
+                listing_id = snapshot.listing,
                 comment = comment
                 )
             new_comment.save() 
 
-    comments = Comment.objects.filter(listing_id=listing.id)
-
     # Go back to listing 
-    return render(request, "auctions/listing.html", {
-        "listing": listing, 
-        "comments": comments,
-        "comment_form": comment_form
-    })
+    return render_listing(request, snapshot)
+
+
+# Page of older comments, loaded into the listing page on request
+@listing_conditional
+def comments(request, listing_id):
+    snapshot = get_snapshot_by_id(listing_id)
+    archived = snapshot is not None and snapshot.listing.archived
+    return HttpResponse(render_comments(listing_id, request.GET.get("cursor"), archived))
+
+
+# A listing image thumbnail. The URL names the image's hash, so its content
+# never changes and browsers can keep it for a year without asking again.
+# Old hashes redirect to the listing's current image. The ETag is only
+# answered once the thumbnail is known to be the listing's current one.
+def thumbnail(request, listing_id, size, digest):
+    snapshot = get_snapshot_by_id(listing_id)
+    if snapshot is None or size not in settings.AUCTIONS_THUMBNAIL_SIZES:
+        raise Http404("No such thumbnail")
+
+    listing = snapshot.listing
+    path = thumbnail_file(listing, digest, size)
+    if path is None:
+        # An earlier image, or a thumbnail that can't be made again
+        fallback = listing.image_src(size) if digest != listing.image_digest else listing.image_url
+        if not fallback:
+            raise Http404("No such thumbnail")
+        return HttpResponseRedirect(fallback)
+
+    etag = f'"{digest}-{size}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = FileResponse(open(path, "rb"), content_type="image/jpeg")
+    response["ETag"] = etag
+    response["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
@@ -0,0 +1,97 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+
+from .models import Watchlist
+from .routers import cache_timeout
+
+# A user's watchlist as a set of listing ids.
+#
+# The set is loaded with one query, cached per user and remembered on the
+# request, so a page checking several listings only looks it up once. Adding
+# and removing go straight to the database, relying on the unique constraint
+# on (user, listing) instead of checking first, and drop the cached set once
+# the write is committed.
+
+
+def watchlist_cache_key(user_id):
+    return f"watchlist:{user_id}"
+
+
+# Drop the cached sets of these users once the current transaction commits
+def invalidate_watchlists(user_ids):
+    keys = [watchlist_cache_key(user_id) for user_id in user_ids]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def _load_ids(user_id):
+    return frozenset(Watchlist.objects.filter(user_id=user_id).values_list("listing_id", flat=True))
+
+
+# Ids of the listings the request's user is watching, empty for anonymous
+# users
+def watched_ids(request):
+    if not request.user.is_authenticated:
+        return frozenset()
+    if not hasattr(request, "_watched_ids"):
+        key = watchlist_cache_key(request.user.id)
+        ids = cache.get(key)
+        if ids is None:
+            ids = _load_ids(request.user.id)
+            cache.set(key, ids, cache_timeout(settings.AUCTIONS_WATCHLIST_CACHE_TIMEOUT))
+        request._watched_ids = ids
+    return request._watched_ids
+
+
+async def awatched_ids(request):
+    if not request.user.is_authenticated:
+        return frozenset()
+    if not hasattr(request, "_watched_ids"):
+        key = watchlist_cache_key(request.user.id)
+        ids = await cache.aget(key)
+        if ids is None:
+            ids = frozenset([
+                listing_id async for listing_id in
+                Watchlist.objects.filter(user_id=request.user.id).values_list("listing_id", flat=True)
+            ])
+            await cache.aset(key, ids, cache_timeout(settings.AUCTIONS_WATCHLIST_CACHE_TIMEOUT))
+        request._watched_ids = ids
+    return request._watched_ids
+
+
+def _changed(request):
+    request.__dict__.pop("_watched_ids", None)
+    key = watchlist_cache_key(request.user.id)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+# Add a listing to the user's watchlist. Returns False if it was already
+# there.
+def watch(request, listing_id):
+    try:
+        with transaction.atomic():
+            Watchlist.objects.create(user_id_id=request.user.id, listing_id_id=listing_id)
+    except IntegrityError:
+        return False
+    _changed(request)
+    return True
+
+
+# Remove a listing from the user's watchlist. Returns False if it wasn't
+# there.
+def unwatch(request, listing_id):
+    removed, _ = Watchlist.objects.filter(user_id=request.user.id, listing_id=listing_id).delete()
+    if removed:
+        _changed(request)
+    return bool(removed)
+
+
+# The user's watchlist entries with their listings, in the order they were
+# added, for rendering in one joined query
+def watched_entries(user):
+    return (
+        Watchlist.objects.filter(user_id=user)
+        .select_related("listing_id")
+        .only("listing_id", "listing_id__list_title")
+        .order_by("id")
+    )
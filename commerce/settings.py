@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/3.0/ref/settings/
 
 import os
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -47,7 +49,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'auctions.middleware.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'auctions.middleware.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -60,7 +64,8 @@ ROOT_URLCONF = 'commerce.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates with render timing for the instrumentation middleware
+        'BACKEND': 'auctions.metrics.InstrumentedTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -76,19 +81,237 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'commerce.wsgi.application'
 
+# Serve the read-only pages with async views. Only worth turning on when the
+# site runs under commerce/asgi.py.
+AUCTIONS_ASYNC_VIEWS = os.environ.get('AUCTIONS_ASYNC_VIEWS') == '1'
+
 
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+#
+# SQLite at db.sqlite3 by default. Set AUCTIONS_DB_ENGINE=postgresql and the
+# AUCTIONS_DB_* variables below for PostgreSQL. Connections are kept open for
+# AUCTIONS_DB_CONN_MAX_AGE seconds and checked before they are reused. Set
+# AUCTIONS_DB_POOLER=1 when connecting through a transaction pooler such as
+# PgBouncer, which can't hold server-side cursors between transactions.
+#
+# AUCTIONS_DB_REPLICA adds a 'replica' alias for the read-only pages, see
+# auctions/routers.py. It is the replica's host for PostgreSQL, or a database
+# file for SQLite, which can point at the same file to try routing locally.
+
+DB_ENGINES = {
+    'sqlite': 'django.db.backends.sqlite3',
+    'postgresql': 'django.db.backends.postgresql',
+}
+
+DB_ENGINE = os.environ.get('AUCTIONS_DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': DB_ENGINES['sqlite'],
+            'NAME': os.environ.get('AUCTIONS_DB_NAME', os.path.join(BASE_DIR, 'db.sqlite3')),
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': DB_ENGINES[DB_ENGINE],
+            'NAME': os.environ.get('AUCTIONS_DB_NAME', 'auctions'),
+            'USER': os.environ.get('AUCTIONS_DB_USER', ''),
+            'PASSWORD': os.environ.get('AUCTIONS_DB_PASSWORD', ''),
+            'HOST': os.environ.get('AUCTIONS_DB_HOST', ''),
+            'PORT': os.environ.get('AUCTIONS_DB_PORT', ''),
+            'CONN_MAX_AGE': int(os.environ.get('AUCTIONS_DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('AUCTIONS_DB_POOLER') == '1',
+            'OPTIONS': {
+                'connect_timeout': 5,
+            },
+        }
     }
+
+# Opt-in tuning for SQLite, see auctions/sqlite.py. Set AUCTIONS_SQLITE_TUNING=1
+# to apply AUCTIONS_SQLITE_PRAGMAS to every new connection and retry
+# statements that find the database locked.
+AUCTIONS_SQLITE_TUNING = os.environ.get('AUCTIONS_SQLITE_TUNING') == '1'
+
+AUCTIONS_SQLITE_PRAGMAS = {
+    # Readers don't block the writer, or the writer readers
+    'journal_mode': 'WAL',
+    # Only sync at checkpoints. Safe from corruption in WAL mode; a power
+    # loss can drop the last few commits.
+    'synchronous': 'NORMAL',
+    # Milliseconds to wait for the write lock before giving up
+    'busy_timeout': 5000,
+    # Page cache per connection, negative values are in KiB
+    'cache_size': -20000,
+    'mmap_size': 256 * 1024 * 1024,
 }
 
+# Retries for statements that still find the database locked, and the delay
+# in seconds before the first one, doubled each time
+AUCTIONS_SQLITE_LOCK_RETRIES = 5
+AUCTIONS_SQLITE_LOCK_BACKOFF = 0.05
+
+DB_REPLICA = os.environ.get('AUCTIONS_DB_REPLICA')
+
+if DB_REPLICA:
+    DATABASES['replica'] = dict(
+        DATABASES['default'],
+        **{'NAME' if DB_ENGINE == 'sqlite' else 'HOST': DB_REPLICA},
+        TEST={'MIRROR': 'default'},
+    )
+
+DATABASE_ROUTERS = ['auctions.routers.ReplicaRouter']
+
+# Alias the read-only pages are served from, None to use the primary only
+AUCTIONS_REPLICA_DATABASE = 'replica' if DB_REPLICA else None
+
+# Seconds a user's reads stay on the primary after they write something.
+# Should be comfortably longer than the replica's usual lag.
+AUCTIONS_REPLICA_STICKY_SECONDS = 5
+
 AUTH_USER_MODEL = 'auctions.User'
 
+
+# Cache
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+#
+# Cached pages are invalidated by bumping version keys in the cache, so
+# every worker process must share one cache, or the others keep serving
+# stale listings, categories and watchlists. WEB_CONCURRENCY is the number
+# of worker processes, as read by gunicorn and uvicorn. With one, the cache
+# is local memory by default; with more it is the file cache, which the
+# workers on one machine share. Set AUCTIONS_CACHE_BACKEND=redis or
+# memcached and AUCTIONS_CACHE_LOCATION to share it between machines. Local
+# memory is refused with more than one worker.
+
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 1))
+
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+    'memcached': 'django.core.cache.backends.memcached.PyMemcacheCache',
+}
+CACHE_LOCATIONS = {
+    'locmem': '',
+    'file': os.path.join(BASE_DIR, '.cache'),
+    'redis': 'redis://127.0.0.1:6379',
+    'memcached': '127.0.0.1:11211',
+}
+
+CACHE_BACKEND = os.environ.get('AUCTIONS_CACHE_BACKEND', 'locmem' if WEB_CONCURRENCY == 1 else 'file')
+if CACHE_BACKEND == 'locmem' and WEB_CONCURRENCY > 1:
+    raise ImproperlyConfigured(
+        'AUCTIONS_CACHE_BACKEND=locmem with WEB_CONCURRENCY > 1 would leave each worker with its own '
+        'cache, and all but one serving stale pages. Use file, redis or memcached.'
+    )
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': os.environ.get('AUCTIONS_CACHE_LOCATION', CACHE_LOCATIONS[CACHE_BACKEND]),
+        'TIMEOUT': 600,
+    }
+}
+if CACHE_BACKEND in ('locmem', 'file'):
+    CACHES['default']['OPTIONS'] = {
+        # Evict a third of the entries once the cache is full
+        'MAX_ENTRIES': int(os.environ.get('AUCTIONS_CACHE_MAX_ENTRIES', 10000)),
+        'CULL_FREQUENCY': 3,
+    }
+
+# Seconds a rendered listing page stays cached if it isn't invalidated first
+AUCTIONS_LISTING_CACHE_TIMEOUT = 600
+
+# Seconds the category counts stay cached if they aren't invalidated first
+AUCTIONS_CATEGORY_CACHE_TIMEOUT = 600
+
+# Seconds a user's cached watchlist lives if it isn't invalidated first
+AUCTIONS_WATCHLIST_CACHE_TIMEOUT = 600
+
+# Step by which proxy bids outbid each other, see auctions/bidding.py
+AUCTIONS_BID_INCREMENT = '1.00'
+
+# Days after closing that a listing's bids, comments and watchlist entries
+# are moved to the archive tables by the archive_closed command, see
+# auctions/archive.py
+AUCTIONS_ARCHIVE_AFTER_DAYS = 90
+
+# Listing image thumbnails, see auctions/images.py. Needs Pillow, without it
+# pages show the original image URLs. Run the generate_thumbnails command
+# with --loop to make them. Thumbnails are kept in AUCTIONS_IMAGE_DIR, least
+# recently used first out once the directory passes AUCTIONS_IMAGE_CACHE_BYTES.
+AUCTIONS_IMAGE_DIR = os.environ.get('AUCTIONS_IMAGE_DIR', os.path.join(BASE_DIR, '.images'))
+AUCTIONS_IMAGE_CACHE_BYTES = int(os.environ.get('AUCTIONS_IMAGE_CACHE_BYTES', 256 * 2 ** 20))
+AUCTIONS_THUMBNAIL_SIZES = {
+    'summary': (200, 125),
+    'listing': (400, 250),
+}
+# Fetches an image URL's bytes. The default only fetches http(s) URLs on
+# public addresses.
+AUCTIONS_IMAGE_FETCHER = 'auctions.images.fetch_url'
+AUCTIONS_IMAGE_FETCH_TIMEOUT = 5
+AUCTIONS_IMAGE_MAX_BYTES = 10 * 2 ** 20
+
+# Outbid, won and closed notifications, see auctions/outbox.py. Set
+# AUCTIONS_NOTIFICATIONS=1 to record them with each bid and close, and run
+# the dispatch_outbox command to send them to AUCTIONS_NOTIFICATION_SINKS.
+# Set AUCTIONS_WEBHOOK_URL to post them to a webhook as well as email them.
+AUCTIONS_NOTIFICATIONS = os.environ.get('AUCTIONS_NOTIFICATIONS') == '1'
+AUCTIONS_WEBHOOK_URL = os.environ.get('AUCTIONS_WEBHOOK_URL')
+AUCTIONS_WEBHOOK_TIMEOUT = 5
+AUCTIONS_NOTIFICATION_SINKS = ['auctions.outbox.EmailSink']
+if AUCTIONS_WEBHOOK_URL:
+    AUCTIONS_NOTIFICATION_SINKS.append('auctions.outbox.WebhookSink')
+# Failed deliveries are retried after AUCTIONS_OUTBOX_RETRY_DELAY seconds,
+# doubling each time, up to AUCTIONS_OUTBOX_MAX_ATTEMPTS attempts
+AUCTIONS_OUTBOX_MAX_ATTEMPTS = 8
+AUCTIONS_OUTBOX_RETRY_DELAY = 30
+# An event a dispatcher claimed is due again after this many seconds if it
+# wasn't sent or failed by then, in case that dispatcher died
+AUCTIONS_OUTBOX_CLAIM_SECONDS = 300
+
+# Email printed to the console by default. Set AUCTIONS_EMAIL_FILE_PATH to
+# write each message to a file in that directory instead.
+EMAIL_FILE_PATH = os.environ.get('AUCTIONS_EMAIL_FILE_PATH')
+EMAIL_BACKEND = (
+    'django.core.mail.backends.filebased.EmailBackend' if EMAIL_FILE_PATH
+    else 'django.core.mail.backends.console.EmailBackend'
+)
+DEFAULT_FROM_EMAIL = 'auctions@localhost'
+
+# Publish/subscribe broker feeding live bid updates to WebSocket clients
+AUCTIONS_BROKER = 'auctions.realtime.InProcessBroker'
+
+# Request instrumentation, see auctions/middleware.py. Wall time is recorded
+# for every request; database and template timing for this fraction of them.
+AUCTIONS_METRICS_SAMPLE_RATE = float(os.environ.get('AUCTIONS_METRICS_SAMPLE_RATE', 0.1))
+
+# Log queries slower than this many milliseconds, None to turn off
+AUCTIONS_METRICS_SLOW_QUERY_MS = 100
+
+# Addresses allowed to scrape /metrics
+AUCTIONS_METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+# Token bucket rate limits on bids and comments, see auctions/ratelimit.py.
+# Each scope is (requests per second, burst). LocalBackend counts per worker
+# process; set AUCTIONS_RATE_LIMIT_BACKEND=cache to share the limits through
+# the cache, which needs a cache the workers share.
+AUCTIONS_RATE_LIMITING = os.environ.get('AUCTIONS_RATE_LIMITING', '1') == '1'
+AUCTIONS_RATE_LIMITS = {
+    'bid': {'user': (1, 10), 'listing': (20, 100)},
+    'comment': {'user': (0.2, 5), 'listing': (2, 20)},
+}
+RATE_LIMIT_BACKENDS = {
+    'local': 'auctions.ratelimit.LocalBackend',
+    'cache': 'auctions.ratelimit.CacheBackend',
+}
+AUCTIONS_RATE_LIMIT_BACKEND = RATE_LIMIT_BACKENDS[os.environ.get('AUCTIONS_RATE_LIMIT_BACKEND', 'local')]
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 